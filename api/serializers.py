@@ -1,10 +1,21 @@
+from django.db import models
 from rest_framework import serializers
 from yaksh.models import (
     Question, Quiz, QuestionPaper, AnswerPaper, Course,
-    LearningModule, LearningUnit, Lesson
+    LearningModule, LearningUnit, Lesson, prefetch_test_cases
 )
 
 
+class QuestionListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        questions = list(data.all() if isinstance(data, models.Manager)
+                         else data)
+        prefetch_test_cases(questions)
+        return super(QuestionListSerializer, self).to_representation(
+            questions)
+
+
 class QuestionSerializer(serializers.ModelSerializer):
     test_cases = serializers.SerializerMethodField()
 
@@ -14,7 +25,8 @@ class QuestionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Question
-        exclude = ('partial_grading', )
+        exclude = ('partial_grading', 'fail_fast', 'grading_version')
+        list_serializer_class = QuestionListSerializer
 
 
 class QuizSerializer(serializers.ModelSerializer):
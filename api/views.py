@@ -206,7 +206,9 @@ class AnswerValidator(APIView):
         answerpaper.save()
         json_data = None
         if question.type in ['code', 'upload']:
-            json_data = question.consolidate_answer_data(user_answer, user)
+            json_data = question.consolidate_answer_data(
+                user_answer, user, by_reference=True
+            )
         result = answerpaper.validate_answer(user_answer, question, json_data,
                                              answer.id)
 
@@ -226,14 +228,17 @@ class AnswerValidator(APIView):
         result = get_result_from_code_server(url, uid)
         # update result
         if result['status'] == 'done':
-            final_result = json.loads(result.get('result'))
+            final_result = result.get('result')
             answer.error = json.dumps(final_result.get('error'))
+            answer.set_timing(final_result.get('timing'))
             if final_result.get('success'):
                 answer.correct = True
                 answer.marks = answer.question.points
             answer.save()
             answerpaper = answer.answerpaper_set.get()
             answerpaper.update_marks(state='inprogress')
+            # The API sends the result as a JSON string, as it always did.
+            result['result'] = json.dumps(final_result)
         return Response(result)
 
 
@@ -55,6 +55,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE = (
+    'yaksh.middleware.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -228,6 +229,12 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TIMEZONE = 'Asia/Kolkata'
 CELERY_BROKER_URL = 'redis://localhost'
 CELERY_RESULT_BACKEND = 'django-db'
+CELERY_BEAT_SCHEDULE = {
+    'prescale-code-servers': {
+        'task': 'yaksh.tasks.prescale_code_servers',
+        'schedule': 60.0,
+    },
+}
 
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
@@ -1,38 +1,219 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
+import asyncio
+import contextlib
 import os
-from os.path import abspath, exists
+from os.path import exists
 import subprocess
 import stat
 import signal
+import sys
+import threading
+import time
 
 
 # Local imports
 from .grader import TimeoutException
+from .settings import SERVER_TIMEOUT
+
+
+def kill_process_group(pid, sig=signal.SIGKILL):
+    """Kill the process group led by pid, ignoring already dead groups."""
+    try:
+        os.killpg(os.getpgid(pid), sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class _ThreadedChildWatcher(asyncio.AbstractChildWatcher):
+    """Waits for each subprocess on a thread of its own, like the default
+    child watcher of Python 3.8 and later.
+
+    The watchers of older versions only work with the event loop of the main
+    thread, while the evaluators run subprocesses on private loops, possibly
+    from the grading threads of a code server.
+    """
+
+    def add_child_handler(self, pid, callback, *args):
+        loop = asyncio.get_event_loop()
+        thread = threading.Thread(target=self._do_waitpid,
+                                  args=(loop, pid, callback, args),
+                                  daemon=True)
+        thread.start()
+
+    def remove_child_handler(self, pid):
+        return True
+
+    def attach_loop(self, loop):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def _do_waitpid(self, loop, pid, callback, args):
+        try:
+            pid, status = os.waitpid(pid, 0)
+        except ChildProcessError:
+            # The process was reaped elsewhere, its status is unknown.
+            returncode = 255
+        else:
+            if os.WIFSIGNALED(status):
+                returncode = -os.WTERMSIG(status)
+            elif os.WIFEXITED(status):
+                returncode = os.WEXITSTATUS(status)
+            else:
+                returncode = status
+        try:
+            loop.call_soon_threadsafe(callback, pid, returncode, *args)
+        except RuntimeError:
+            # The loop was closed in the meantime.
+            pass
+
+
+_child_watcher_lock = threading.Lock()
+_child_watcher = None
+
+
+def _set_child_watcher():
+    global _child_watcher
+    if sys.version_info >= (3, 8):
+        return
+    with _child_watcher_lock:
+        if _child_watcher is None:
+            _child_watcher = _ThreadedChildWatcher()
+            asyncio.set_child_watcher(_child_watcher)
+
+
+def run_coroutines(coroutines, max_concurrency=None):
+    """Run the given coroutines on a private event loop and return their
+    results in order. At most `max_concurrency` of them run at a time.
+
+    If one of the coroutines fails, or the run is interrupted, all the
+    pending coroutines are cancelled (which kills their process groups)
+    before the exception is re-raised.
+
+    The SIGALRM of the grader is held back while the loop runs, it would
+    otherwise be raised in a loop callback where it is only logged. The
+    commands time out on the deadline of the evaluation instead.
+    """
+    _set_child_watcher()
+    loop = asyncio.new_event_loop()
+
+    async def _bounded(semaphore, coro):
+        async with semaphore:
+            return await coro
+
+    async def _gather(coros):
+        semaphore = asyncio.Semaphore(max_concurrency or len(coros) or 1)
+        tasks = [asyncio.ensure_future(_bounded(semaphore, coro))
+                 for coro in coros]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            # gather does not cancel the other tasks when one of them fails.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    task = loop.create_task(_gather(coroutines))
+    mask = signal.pthread_sigmask(signal.SIG_BLOCK, [signal.SIGALRM])
+    try:
+        return loop.run_until_complete(task)
+    except BaseException:
+        task.cancel()
+        try:
+            loop.run_until_complete(task)
+        except BaseException:
+            pass
+        raise
+    finally:
+        loop.close()
+        # A pending alarm is delivered here.
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
 
 
 class BaseEvaluator(object):
     """Base Evaluator class containing generic attributes
         and callable methods"""
 
+    # Evaluators doing all of their work in subprocesses can be run on a
+    # thread by the code server, they must then not depend on the current
+    # directory or on signals.
+    thread_safe = False
+
+    # The directory the submission is evaluated in and the time by which the
+    # evaluation must be done, both are set by the Grader.
+    in_dir = None
+    deadline = None
+
     def __init__(self):
         pass
 
+    @classmethod
+    def prepare(cls, instances, fail_fast=False):
+        """Called once with all the test case instances of this class in a
+        submission before they are evaluated, so that work common to the
+        test cases can be shared. `fail_fast` tells that evaluation stops at
+        the first failing test case.
+
+        Time spent compiling or running a test case ahead is recorded in the
+        'compile' and 'run' entries of the instance timing.
+        """
+        pass
+
     def check_code(self):
         raise NotImplementedError("check_code method not implemented")
 
+    @property
+    def timing(self):
+        """Seconds spent by this evaluator in each recorded phase"""
+        if not hasattr(self, '_timing'):
+            self._timing = {}
+        return self._timing
+
+    @contextlib.contextmanager
+    def record_time(self, phase):
+        """Add the time spent in the with block to the given phase"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timing[phase] = self.timing.get(phase, 0.0) + \
+                time.time() - start
+
+    @property
+    def working_dir(self):
+        """Directory in which files are created and commands are run"""
+        return self.in_dir or os.getcwd()
+
+    def get_timeout(self):
+        """Seconds left before the evaluation times out"""
+        if self.deadline is None:
+            return SERVER_TIMEOUT
+        return max(self.deadline - time.time(), 0)
+
     def compile_code(self):
         pass
 
     def _run_command(self, cmd_args, *args, **kw):
         """Run a command in a subprocess while blocking, the process is killed
-        if it takes more than 2 seconds to run.  Return the Popen object, the
-        stdout and stderr.
+        if it runs past the deadline of the evaluation.  Return the Popen
+        object, the stdout and stderr.
         """
+        kw.setdefault('cwd', self.working_dir)
+        proc = subprocess.Popen(cmd_args, start_new_session=True, *args, **kw)
         try:
-            proc = subprocess.Popen(cmd_args,
-                                    preexec_fn=os.setpgrp, *args, **kw)
-            stdout, stderr = proc.communicate()
+            stdout, stderr = proc.communicate(timeout=self.get_timeout())
+        except subprocess.TimeoutExpired:
+            kill_process_group(proc.pid)
+            proc.wait()
+            raise TimeoutException('Code took too long to run.')
         except TimeoutException:
             # Runaway code, so kill it.
             os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
@@ -40,6 +221,66 @@ class BaseEvaluator(object):
             raise
         return proc, stdout.decode('utf-8'), stderr.decode('utf-8')
 
+    async def _run_command_async(self, cmd_args, input=None, timeout=None,
+                                 shell=False, **kw):
+        """Asynchronous counterpart of `_run_command`.
+
+        The command runs in its own process group and is killed along with
+        all its children if it takes more than `timeout` seconds (defaults
+        to the time left before the deadline), in which case a
+        TimeoutException is raised. `input` is an optional string fed to the
+        standard input. Return the process object, the stdout and stderr.
+        """
+        timeout = self.get_timeout() if timeout is None else timeout
+        kw.setdefault('cwd', self.working_dir)
+        if input is not None:
+            kw.setdefault('stdin', subprocess.PIPE)
+            input = input.encode('utf-8')
+        if shell:
+            proc = await asyncio.create_subprocess_shell(
+                cmd_args, start_new_session=True, **kw
+            )
+        else:
+            if isinstance(cmd_args, str):
+                cmd_args = [cmd_args]
+            proc = await asyncio.create_subprocess_exec(
+                *cmd_args, start_new_session=True, **kw
+            )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                proc.communicate(input), timeout
+            )
+        except asyncio.TimeoutError:
+            await self._kill_process_async(proc)
+            raise TimeoutException('Code took too long to run.')
+        except asyncio.CancelledError:
+            await self._kill_process_async(proc)
+            raise
+        return (proc,
+                stdout.decode('utf-8') if stdout is not None else '',
+                stderr.decode('utf-8') if stderr is not None else '')
+
+    async def _kill_process_async(self, proc):
+        """Kill the process group of an asyncio process and wait for it,
+        reading what is left of its output so that its pipes get closed.
+        """
+        kill_process_group(proc.pid)
+        try:
+            await asyncio.wait_for(proc.communicate(), 1)
+        except asyncio.TimeoutError:
+            await proc.wait()
+
+    def _run_commands(self, commands, max_concurrency=None):
+        """Run several commands concurrently while blocking.
+
+        `commands` is a list of (cmd_args, kwargs) tuples, the kwargs being
+        passed on to `_run_command_async`. Return a list of
+        (proc, stdout, stderr) tuples in the order of the commands.
+        """
+        coroutines = [self._run_command_async(cmd_args, **kw)
+                      for cmd_args, kw in commands]
+        return run_coroutines(coroutines, max_concurrency)
+
     def _remove_null_substitute_char(self, string):
         """Returns a string without any null and substitute characters"""
         stripped = ""
@@ -50,7 +291,7 @@ class BaseEvaluator(object):
 
     def create_submit_code_file(self, file_name):
         """ Set the file path for code (`answer`)"""
-        submit_path = abspath(file_name)
+        submit_path = os.path.join(self.working_dir, file_name)
         if not exists(submit_path):
             submit_f = open(submit_path, 'w')
             submit_f.close()
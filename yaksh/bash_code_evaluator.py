@@ -1,15 +1,70 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
+from collections import OrderedDict
+import hashlib
 import os
 from os.path import isfile
+import shutil
 import subprocess
+import tempfile
+import threading
 
 # local imports
 from .base_evaluator import BaseEvaluator
 from .file_utils import copy_files, delete_files
+from .settings import MAX_CACHED_REFERENCE_OUTPUTS
+
+
+# Outputs of the instructor's reference script, keyed by a fingerprint of the
+# script, its arguments and the supporting files. The reference output does
+# not change between submissions so it is computed once per worker.
+_reference_outputs = OrderedDict()
+# The cache is shared by the grading threads of a worker.
+_reference_outputs_lock = threading.Lock()
+
+
+def get_reference_fingerprint(ref_code, args, file_paths=None):
+    """Return a hash identifying a run of the reference script with the
+    given arguments. Supporting files are identified by path, size and
+    modification time so that re-uploading a file invalidates the entry.
+    """
+    data = [ref_code, args]
+    for file_path, extract in file_paths or []:
+        try:
+            stat = os.stat(file_path)
+            data.append("{0}:{1}:{2}".format(
+                file_path, stat.st_size, stat.st_mtime
+            ))
+        except OSError:
+            data.append(file_path)
+    return hashlib.sha1("\0".join(data).encode('utf-8')).hexdigest()
+
+
+def get_cached_reference_output(fingerprint):
+    """Return the cached (stdout, stderr) for the fingerprint or None"""
+    with _reference_outputs_lock:
+        output = _reference_outputs.get(fingerprint)
+        if output is not None:
+            _reference_outputs.move_to_end(fingerprint)
+    return output
+
+
+def set_cached_reference_output(fingerprint, output):
+    with _reference_outputs_lock:
+        _reference_outputs[fingerprint] = output
+        _reference_outputs.move_to_end(fingerprint)
+        while len(_reference_outputs) > MAX_CACHED_REFERENCE_OUTPUTS:
+            _reference_outputs.popitem(last=False)
+
+
+def clear_reference_outputs():
+    with _reference_outputs_lock:
+        _reference_outputs.clear()
 
 
 class BashCodeEvaluator(BaseEvaluator):
+    thread_safe = True
+
     # Private Protocol ##########
     def __init__(self, metadata, test_case_data):
         self.files = []
@@ -38,7 +93,40 @@ class BashCodeEvaluator(BaseEvaluator):
         if os.path.exists(self.tc_args_path):
             os.remove(self.tc_args_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
+
+    def get_reference_output(self, ref_code_path, args=None):
+        """Run the instructor script with the given arguments and return
+        its stdout and stderr. The output is cached per worker using a
+        fingerprint of the script, so only the first submission pays for it.
+
+        The script is run from a scratch directory holding only a fresh copy
+        of the supporting files, so that the files a student script leaves
+        in the working directory cannot change the cached output.
+        """
+        args = args or []
+        fingerprint = get_reference_fingerprint(
+            self.test_case, " ".join(args), self.file_paths
+        )
+        output = get_cached_reference_output(fingerprint)
+        if output is None:
+            run_dir = tempfile.mkdtemp(dir=self.working_dir)
+            try:
+                if self.file_paths:
+                    with self.record_time('file_copy'):
+                        copy_files(self.file_paths, run_dir)
+                proc, stdout, stderr = self._run_command(
+                    ["bash", os.path.abspath(ref_code_path)] + args,
+                    stdin=None,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    cwd=run_dir
+                )
+            finally:
+                shutil.rmtree(run_dir, ignore_errors=True)
+            output = (stdout, stderr)
+            set_cached_reference_output(fingerprint, output)
+        return output
 
     def check_code(self):
         """ Function validates student script using instructor script as
@@ -84,7 +172,10 @@ class BashCodeEvaluator(BaseEvaluator):
             self.test_code_path, self.tc_args_path
 
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(
+                    self.file_paths, self.working_dir
+                )
         if not isfile(clean_ref_code_path):
             msg = "No file at %s or Incorrect path" % clean_ref_code_path
             return False, msg, 0.0
@@ -99,12 +190,9 @@ class BashCodeEvaluator(BaseEvaluator):
             return False, msg, 0.0
 
         if not clean_test_case_path:
-            ret = self._run_command(["bash", clean_ref_code_path],
-                                    stdin=None,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE
-                                    )
-            proc, inst_stdout, inst_stderr = ret
+            inst_stdout, inst_stderr = self.get_reference_output(
+                clean_ref_code_path
+            )
             ret = self._run_command(["bash", self.submit_code_path],
                                     stdin=None,
                                     stdout=subprocess.PIPE,
@@ -134,19 +222,21 @@ class BashCodeEvaluator(BaseEvaluator):
             loop_count = 0
             test_cases = open(clean_test_case_path).readlines()
             num_lines = len(test_cases)
-            for tc in test_cases:
+            # The reference outputs are all computed before the student
+            # script runs.
+            reference_outputs = [
+                self.get_reference_output(clean_ref_code_path, tc.split())
+                for tc in test_cases
+            ]
+            for tc, reference_output in zip(test_cases, reference_outputs):
                 loop_count += 1
                 if valid_answer:
-                    args = ["bash", clean_ref_code_path] + \
-                        [x for x in tc.split()]
-                    ret = self._run_command(args,
-                                            stdin=None,
-                                            stdout=subprocess.PIPE,
-                                            stderr=subprocess.PIPE
-                                            )
-                    proc, inst_stdout, inst_stderr = ret
+                    inst_stdout, inst_stderr = reference_output
                     if self.file_paths:
-                        self.files = copy_files(self.file_paths)
+                        with self.record_time('file_copy'):
+                            self.files = copy_files(
+                                self.file_paths, self.working_dir
+                            )
                     args = ["bash", self.submit_code_path] + \
                         [x for x in tc.split()]
                     ret = self._run_command(args,
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
-import subprocess
 import os
+import shlex
 from os.path import isfile
 
 # local imports
@@ -20,41 +20,41 @@ class BashStdIOEvaluator(StdIOEvaluator):
         self.partial_grading = metadata.get('partial_grading')
 
         # Set test case data values
-        self.expected_input = test_case_data.get('expected_input')
+        self.expected_input = str(
+            test_case_data.get('expected_input')
+        ).replace('\r', '')
         self.expected_output = test_case_data.get('expected_output')
         self.weight = test_case_data.get('weight')
         self.hidden = test_case_data.get('hidden')
 
     def teardown(self):
-        os.remove(self.submit_code_path)
+        if os.path.exists(self.submit_code_path):
+            os.remove(self.submit_code_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
 
     def compile_code(self):
+        if self.compiled:
+            return None
         self.submit_code_path = self.create_submit_code_file('Test.sh')
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(
+                    self.file_paths, self.working_dir
+                )
         if not isfile(self.submit_code_path):
             msg = "No file at %s or Incorrect path" % self.submit_code_path
             return False, msg
         self.user_answer = self.user_answer.replace("\r", "")
         self.write_to_submit_code_file(self.submit_code_path, self.user_answer)
 
+    def get_run_command(self):
+        return "bash {0}".format(shlex.quote(self.submit_code_path))
+
     def check_code(self):
         success = False
         mark_fraction = 0.0
 
-        self.expected_input = str(self.expected_input).replace('\r', '')
-        proc = subprocess.Popen("bash ./Test.sh",
-                                shell=True,
-                                stdin=subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                preexec_fn=os.setpgrp
-                                )
-        success, err = self.evaluate_stdio(self.user_answer, proc,
-                                           self.expected_input,
-                                           self.expected_output
-                                           )
+        success, err = self.run_stdio("bash ./Test.sh")
         mark_fraction = 1.0 if self.partial_grading and success else 0.0
         return success, err, mark_fraction
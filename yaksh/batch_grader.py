@@ -0,0 +1,75 @@
+"""Grading of many jobs on a local pool of processes.
+
+This grades the jobs directly with `Grader.evaluate`, without going through
+the code server, e.g. for mass regrades, see the `grade_answers` management
+command. Each job is run in a scratch directory of its own, which is removed
+afterwards.
+"""
+import json
+from multiprocessing import Pool
+import shutil
+import tempfile
+import traceback
+
+from .code_server import expand_job, run_as_nobody
+from .error_messages import prettify_exceptions
+from .grader import Grader
+from .language_registry import get_registry
+from .settings import code_evaluators
+
+# The grading bundles of the jobs, set in each process of the pool.
+_bundles = {}
+
+
+def _init_process(bundles, as_nobody):
+    global _bundles
+    _bundles = bundles
+    if as_nobody:
+        # Import the evaluators while their code is readable.
+        registry = get_registry()
+        for language, evaluators in code_evaluators.items():
+            for test_case_type in evaluators:
+                try:
+                    registry.get_class(language, test_case_type)
+                except Exception:
+                    pass
+        run_as_nobody()
+
+
+def grade_job(job):
+    """Grade a (key, job data as JSON) pair and return the key and the
+    result, see `Grader.evaluate`.
+    """
+    key, json_data = job
+    user_dir = tempfile.mkdtemp(prefix='yaksh_batch_')
+    try:
+        data = expand_job(json.loads(json_data), _bundles)
+        result = Grader(user_dir).evaluate(data)
+    except Exception as e:
+        result = dict(
+            success=False, weight=0.0, timing={},
+            error=[prettify_exceptions(type(e).__name__, str(e),
+                                       traceback.format_exc())]
+        )
+    finally:
+        shutil.rmtree(user_dir, ignore_errors=True)
+    return key, result
+
+
+def grade_jobs(jobs, bundles=None, processes=None, as_nobody=False,
+               chunksize=4):
+    """Grade the (key, job data as JSON) pairs on a pool of `processes`
+    processes, by default one per CPU, and yield the (key, result) pairs
+    in the order of the jobs.
+
+    Jobs referring to a grading bundle, see
+    `Question.consolidate_answer_data`, get it from the `bundles` dict of
+    the bundle JSON by hash, which is sent once to each process.
+
+    If `as_nobody` is True, the processes run the jobs as the nobody user,
+    like the code server, which needs root privileges.
+    """
+    with Pool(processes, initializer=_init_process,
+              initargs=(bundles or {}, as_nobody)) as pool:
+        for key, result in pool.imap(grade_job, jobs, chunksize):
+            yield key, result
@@ -0,0 +1,302 @@
+"""Micro-benchmarks of the evaluators and of their helpers.
+
+Grades a correct answer with each evaluator of `settings.code_evaluators`,
+i.e. each language and test case type, a number of times and reports the
+median seconds spent in each phase of the grading, see `Grader.evaluate`.
+It also times `compare_outputs`, `prettify_exceptions` and `copy_files`.
+The report is JSON and is saved as a baseline, with which a later run is
+compared, e.g.
+
+    $ python -m yaksh.benchmarks.evaluators -o baseline.json
+    $ python -m yaksh.benchmarks.evaluators --compare baseline.json
+
+The comparison exits with status 1 if any time grew by more than the
+threshold. Evaluators whose compilers or interpreters are not installed are
+skipped.
+"""
+from argparse import ArgumentParser
+from collections import OrderedDict
+import copy
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+from textwrap import dedent
+import time
+import timeit
+
+from yaksh.benchmarks.load import C_ADD, JAVA_ADD
+from yaksh.error_messages import compare_outputs, prettify_exceptions
+from yaksh.file_utils import copy_files
+from yaksh.grader import Grader
+from yaksh.settings import code_evaluators
+
+# The phases of grading reported, `run` is the time of all the test cases.
+PHASES = ('setup', 'prepare', 'file_copy', 'compile', 'run', 'teardown',
+          'total')
+
+# The programs each language needs.
+TOOLS = {
+    'c': ['g++'], 'cpp': ['g++'], 'java': ['javac', 'java'],
+    'bash': ['bash'], 'scilab': ['scilab-cli'], 'r': ['Rscript'],
+}
+
+C_FUNCTION = 'int add(int a, int b)\n{return a + b;}'
+
+HOOK = dedent("""
+    def check_answer(user_answer):
+        success = '+' in user_answer
+        return success, '' if success else 'Wrong answer', 1.0
+""")
+
+# The answer defining an add function and the standard test case of each
+# language.
+FUNCTIONS = {
+    'python': ('def add(a, b):\n    return a + b',
+               'assert add(1, 2) == 3'),
+    'c': (C_FUNCTION, dedent("""
+        #include <stdio.h>
+        #include <stdlib.h>
+        extern int add(int, int);
+        int main(void)
+        {
+            if (add(1, 2) != 3) {printf("Incorrect"); exit(1);}
+            printf("Correct");
+            return 0;
+        }
+    """)),
+    'java': (
+        'class Test {\n\tint add(int a, int b)\n\t{\n\treturn a + b;\n\t}\n}',
+        dedent("""
+            class main
+            {
+                public static void main(String arg[])
+                {
+                    Test t = new Test();
+                    if (t.add(1, 2) != 3) {System.exit(1);}
+                    System.out.println("Correct");
+                }
+            }
+        """)
+    ),
+    'bash': ('#!/bin/bash\necho $(( $1 + $2 ))',
+             '#!/bin/bash\necho $(( $1 + $2 ))'),
+    'scilab': (
+        'funcprot(0)\nfunction[c]=add(a,b)\nc=a+b;\nendfunction',
+        'p = add(1, 2);\nif p == 3 then\n exit(5);\nelse\n exit(3);\nend'
+    ),
+    'r': ('add = function(a, b){\n  return(a + b)\n}',
+          'if (add(1, 2) == 3) {\n  quit("no", 31)\n}'),
+}
+FUNCTIONS['cpp'] = FUNCTIONS['c']
+
+# The answer reading two numbers and printing their sum in each language.
+PROGRAMS = {
+    'python': 'a, b = map(int, input().split())\nprint(a + b)',
+    'c': C_ADD, 'cpp': C_ADD, 'java': JAVA_ADD,
+    'bash': 'read a b\necho $(( a + b ))',
+}
+
+
+def make_case(language, test_case_type):
+    """Return the job data of a correct answer graded by the evaluator, or
+    None if there is no case for it.
+    """
+    metadata = {'language': language, 'partial_grading': False,
+                'file_paths': None}
+    function, standard_test = FUNCTIONS.get(language, (None, None))
+    if test_case_type == 'standardtestcase' and function is not None:
+        metadata['user_answer'] = function
+        test_case = {'test_case': standard_test}
+        if language == 'bash':
+            test_case['test_case_args'] = '1 2\n-1 1'
+    elif test_case_type == 'stdiobasedtestcase' and language in PROGRAMS:
+        metadata['user_answer'] = PROGRAMS[language]
+        test_case = {'expected_input': '1 2', 'expected_output': '3'}
+    elif test_case_type == 'hooktestcase' and function is not None:
+        metadata['user_answer'] = function
+        test_case = {'hook_code': HOOK}
+    else:
+        return None
+    test_case.update(test_case_type=test_case_type, weight=1.0)
+    return {'metadata': metadata, 'test_case_data': [test_case]}
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def bench_case(data, repeat=5):
+    """Grade the job `repeat` times, after a first run warming up, and
+    return the median seconds of each phase, or the error if the answer was
+    not graded as correct.
+    """
+    timings = []
+    for i in range(repeat + 1):
+        user_dir = tempfile.mkdtemp()
+        try:
+            result = Grader(user_dir).evaluate(copy.deepcopy(data))
+        finally:
+            shutil.rmtree(user_dir, ignore_errors=True)
+        if not result['success']:
+            return OrderedDict(error=result['error'])
+        timing = result['timing']
+        timing['run'] = sum(timing.get('test_cases', []))
+        if i > 0:
+            timings.append(timing)
+    return OrderedDict(
+        (phase, _median([timing.get(phase, 0.0) for timing in timings]))
+        for phase in PHASES
+    )
+
+
+def bench_evaluators(repeat=5, only=None):
+    """Return the phases of each evaluator by 'language/test case type',
+    see `bench_case`. `only` restricts them to those containing it.
+    """
+    report = OrderedDict()
+    for language, evaluators in sorted(code_evaluators.items()):
+        for test_case_type in sorted(evaluators):
+            name = '%s/%s' % (language, test_case_type)
+            if only and only not in name:
+                continue
+            data = make_case(language, test_case_type)
+            missing = [tool for tool in TOOLS.get(language, [])
+                       if shutil.which(tool) is None]
+            if data is None:
+                report[name] = OrderedDict(skipped='No benchmark case.')
+            elif missing and test_case_type != 'hooktestcase':
+                report[name] = OrderedDict(
+                    skipped='Not installed: %s.' % ', '.join(missing)
+                )
+            else:
+                report[name] = bench_case(data, repeat)
+    return report
+
+
+def _time_calls(function, number, repeat):
+    times = timeit.repeat(function, number=number, repeat=repeat)
+    return OrderedDict([('calls', number), ('total', _median(times))])
+
+
+def bench_helpers(repeat=5):
+    """Return the median seconds `total` taken by a number of `calls` of
+    each helper.
+    """
+    expected = '\n'.join('line %d' % i for i in range(1000))
+    wrong = expected[:-1] + 'x'
+    traceback = 'Traceback (most recent call last):\n' + \
+        '  File "<string>", line 1, in <module>\n' * 20 + 'AssertionError'
+    src_dir, dest_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    file_paths = []
+    for i in range(10):
+        path = os.path.join(src_dir, 'file%d.txt' % i)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 65536)
+        file_paths.append((path, False))
+    try:
+        report = OrderedDict([
+            ('compare_outputs', _time_calls(
+                lambda: compare_outputs(expected, expected, '1 2'), 100,
+                repeat
+            )),
+            ('compare_outputs_mismatch', _time_calls(
+                lambda: compare_outputs(expected, wrong, '1 2'), 100, repeat
+            )),
+            ('prettify_exceptions', _time_calls(
+                lambda: prettify_exceptions('AssertionError', 'failed',
+                                            traceback, 'assert f() == 1'),
+                10000, repeat
+            )),
+            ('copy_files', _time_calls(
+                lambda: copy_files(file_paths, dest_dir), 20, repeat
+            )),
+        ])
+    finally:
+        shutil.rmtree(src_dir)
+        shutil.rmtree(dest_dir)
+    return report
+
+
+def compare(report, baseline, threshold=0.2, min_delta=0.001):
+    """Return the times of the report which grew by more than `threshold`
+    (a fraction) and `min_delta` seconds over the baseline.
+    """
+    regressions = []
+    for section in ('evaluators', 'helpers'):
+        for name, base_times in baseline.get(section, {}).items():
+            times = report.get(section, {}).get(name, {})
+            for key, base in base_times.items():
+                if key not in PHASES or key not in times:
+                    continue
+                value = times[key]
+                if value > base * (1 + threshold) and \
+                        value - base > min_delta:
+                    regressions.append(OrderedDict([
+                        ('name', name), ('phase', key), ('baseline', base),
+                        ('current', value),
+                        ('change', value / base - 1 if base else None),
+                    ]))
+    return regressions
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=5,
+        help="Number of timed runs of each evaluator."
+    )
+    parser.add_argument(
+        '-k', '--only', help="Only benchmark the evaluators whose "
+        "'language/test case type' contains this."
+    )
+    parser.add_argument(
+        '-o', '--output', help="File to write the JSON report to, instead "
+        "of the standard output."
+    )
+    parser.add_argument(
+        '-c', '--compare', help="Baseline report to compare with."
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help="Fraction by which a time may grow over the baseline."
+    )
+    parser.add_argument(
+        '--min-delta', type=float, default=0.001,
+        help="Seconds by which a time may grow over the baseline, "
+        "whatever the threshold."
+    )
+    options = parser.parse_args(args)
+
+    report = OrderedDict([
+        ('created', time.time()),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('evaluators', bench_evaluators(options.repeat, options.only)),
+        ('helpers', bench_helpers(options.repeat)),
+    ])
+    regressions = []
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, options.threshold,
+                              options.min_delta)
+        report['regressions'] = regressions
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,368 @@
+"""Synthetic load on the code server.
+
+Submits a mix of jobs to a code server at a target rate and reports the
+throughput along with the percentiles of the latency, i.e. the time from the
+submission until the result is seen, of the queue wait and of the grading
+time as JSON, which can be compared across releases and machines, e.g.
+
+    $ python -m yaksh.benchmarks.load -n 500 --rate 20 --servers 4
+    $ python -m yaksh.benchmarks.load --url http://localhost:55555 \\
+          --mix python_correct=8,c_correct=1,python_infinite_loop=1
+
+Without --url a server pool is started in this process. The jobs are given
+scratch directories on this machine, so a server given with --url must run
+here too.
+"""
+from argparse import ArgumentParser
+from collections import OrderedDict
+import json
+import random
+import shutil
+import sys
+import tempfile
+from textwrap import dedent
+from threading import Thread
+import time
+
+import requests
+
+from yaksh.code_server import ServerPool, submit, get_result
+from yaksh.settings import (
+    N_CODE_SERVERS, N_CODE_SERVER_THREADS, SERVER_POOL_PORT, CODE_SERVER_POOLS
+)
+
+
+def _job(language, user_answer, test_case_data):
+    return {
+        'metadata': {'user_answer': user_answer, 'language': language,
+                     'partial_grading': False, 'file_paths': None},
+        'test_case_data': test_case_data
+    }
+
+
+def _assertion(test_case):
+    return {'test_case': test_case, 'test_case_type': 'standardtestcase',
+            'weight': 1.0}
+
+
+def _stdio(expected_input, expected_output):
+    return {'expected_input': expected_input,
+            'expected_output': expected_output,
+            'test_case_type': 'stdiobasedtestcase', 'weight': 1.0}
+
+
+C_ADD = dedent("""
+    #include <stdio.h>
+    int main(void)
+    {int a, b; scanf("%d%d", &a, &b); printf("%d", a + b); return 0;}
+""")
+
+JAVA_ADD = dedent("""
+    import java.util.Scanner;
+    class Test
+    {public static void main(String[] args){
+     Scanner s = new Scanner(System.in);
+     int a = s.nextInt();
+     int b = s.nextInt();
+     System.out.print(a+b);
+    }}
+""")
+
+HOOK = dedent("""
+    def check_answer(user_answer):
+        success = 'return a + b' in user_answer
+        return success, '' if success else 'Wrong answer', 1.0
+""")
+
+# The kinds of jobs, each one the job data and whether it should succeed.
+JOBS = OrderedDict([
+    ('python_correct', (_job(
+        'python', 'def add(a, b):\n    return a + b',
+        [_assertion('assert add(1, 2) == 3'),
+         _assertion('assert add(-1, 1) == 0')]
+    ), True)),
+    ('python_wrong', (_job(
+        'python', 'def add(a, b):\n    return a - b',
+        [_assertion('assert add(1, 2) == 3'),
+         _assertion('assert add(-1, 1) == 0')]
+    ), False)),
+    ('python_error', (_job(
+        'python', 'def add(a, b)\n    return a + b',
+        [_assertion('assert add(1, 2) == 3')]
+    ), False)),
+    ('python_stdio', (_job(
+        'python', 'a, b = map(int, input().split())\nprint(a + b)',
+        [_stdio('1 2', '3'), _stdio('-1 1', '0')]
+    ), True)),
+    ('python_hook', (_job(
+        'python', 'def add(a, b):\n    return a + b',
+        [{'hook_code': HOOK, 'test_case_type': 'hooktestcase',
+          'weight': 1.0}]
+    ), True)),
+    ('python_infinite_loop', (_job(
+        'python', 'def add(a, b):\n    while True:\n        pass',
+        [_assertion('assert add(1, 2) == 3')]
+    ), False)),
+    ('python_large_output', (_job(
+        'python', 'print("x" * 1000000)',
+        [_stdio('', 'x')]
+    ), False)),
+    ('c_correct', (_job('c', C_ADD, [_stdio('1 2', '3')]), True)),
+    ('c_wrong', (_job(
+        'c', C_ADD.replace('a + b', 'a - b'), [_stdio('1 2', '3')]
+    ), False)),
+    ('cpp_correct', (_job('cpp', C_ADD, [_stdio('1 2', '3')]), True)),
+    ('java_correct', (_job('java', JAVA_ADD, [_stdio('1 2', '3')]), True)),
+    ('bash_correct', (_job(
+        'bash', '#!/bin/bash\necho $(( $1 + $2 ))',
+        [{'test_case': '#!/bin/bash\necho $(( $1 + $2 ))',
+          'test_case_args': '1 2\n-1 1',
+          'test_case_type': 'standardtestcase', 'weight': 1.0}]
+    ), True)),
+])
+
+DEFAULT_MIX = 'python_correct=6,python_wrong=2,python_stdio=2,python_hook=1,' \
+    'python_error=1,python_infinite_loop=1,python_large_output=1'
+
+
+def parse_mix(mix):
+    """Return the weight of each kind of job from a string like
+    'python_correct=3,c_correct=1'.
+    """
+    weights = OrderedDict()
+    for item in mix.split(','):
+        kind, _, weight = item.strip().partition('=')
+        if kind not in JOBS:
+            raise ValueError('Unknown kind of job: %r, the kinds are %s.'
+                             % (kind, ', '.join(JOBS)))
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+def percentile(values, p):
+    """Return the `p` th percentile of the values, interpolating between
+    the closest ranks, or None if there are none.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def distribution(values):
+    """Return the mean, maximum and p50/p95/p99 of the values."""
+    return OrderedDict([
+        ('mean', sum(values) / len(values) if values else None),
+        ('p50', percentile(values, 50)),
+        ('p95', percentile(values, 95)),
+        ('p99', percentile(values, 99)),
+        ('max', max(values) if values else None),
+    ])
+
+
+def summarize(records, elapsed):
+    """Return the report of the jobs.
+
+    `records` are dicts with the `kind` of each job, its `latency`,
+    `queue_wait` and `grading` times, and whether it was `done` and graded
+    as `expected`. `elapsed` is the wall clock time of the run.
+    """
+    done = [r for r in records if r['done']]
+    kinds = OrderedDict()
+    for record in done:
+        kinds.setdefault(record['kind'], []).append(record['latency'])
+    return OrderedDict([
+        ('jobs', len(records)),
+        ('done', len(done)),
+        ('unexpected', sum(not r['expected'] for r in done)),
+        ('elapsed', elapsed),
+        ('throughput', len(done) / elapsed if elapsed else None),
+        ('latency', distribution([r['latency'] for r in done])),
+        ('queue_wait', distribution(
+            [r['queue_wait'] for r in done if r['queue_wait'] is not None]
+        )),
+        ('grading', distribution(
+            [r['grading'] for r in done if r['grading'] is not None]
+        )),
+        ('kinds', OrderedDict(
+            (kind, distribution(latencies))
+            for kind, latencies in kinds.items()
+        )),
+    ])
+
+
+def run_jobs(url, jobs, timeout=600, poll_interval=0.05, bundles=None):
+    """Submit the jobs to the code server on schedule and wait for their
+    results, for at most `timeout` seconds after the last submission.
+
+    `jobs` are dicts with the `kind` of job, the seconds after the start it
+    is submitted `at`, its `data` and the `expected` values of the result,
+    along with the optional `course` and `user` of the job. The grading
+    bundles the jobs refer to are taken from `bundles`.
+
+    Returns the records of the jobs, see `summarize`, and the time the run
+    took.
+    """
+    records = []
+    pending = OrderedDict()
+    run_id = '%x' % random.getrandbits(32)
+    start = time.time()
+
+    def _submit():
+        for i, job in enumerate(jobs):
+            delay = start + job['at'] - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            uid = '%s-%d' % (run_id, i)
+            record = dict(kind=job['kind'], job=job, done=False,
+                          user_dir=tempfile.mkdtemp(), submitted=time.time())
+            bundle_hash = job['data'].get('metadata', {}).get('bundle_hash')
+            bundle = None
+            if bundle_hash is not None:
+                bundle = lambda h=bundle_hash: (h, bundles[h])
+            submit(url, uid, json.dumps(job['data']), record['user_dir'],
+                   course=job.get('course'), user=job.get('user'),
+                   bundle=bundle)
+            records.append(record)
+            pending[uid] = record
+
+    submitter = Thread(target=_submit)
+    submitter.start()
+    deadline = None
+    while submitter.is_alive() or pending:
+        if deadline is None and not submitter.is_alive():
+            deadline = time.time() + timeout
+        if deadline is not None and time.time() > deadline:
+            break
+        for uid, record in list(pending.items()):
+            data = get_result(url, uid)
+            if data.get('status') != 'done':
+                continue
+            result = data['result']
+            timing = result.get('timing', {})
+            record.update(
+                done=True, result=result,
+                latency=time.time() - record['submitted'],
+                queue_wait=timing.get('queue_wait'),
+                grading=timing.get('total'),
+                expected=all(result.get(key) == value for key, value
+                             in record['job']['expected'].items())
+            )
+            del pending[uid]
+        time.sleep(poll_interval)
+    elapsed = time.time() - start
+    submitter.join()
+    for record in records:
+        shutil.rmtree(record['user_dir'], ignore_errors=True)
+    return records, elapsed
+
+
+def run_load(url, jobs, rate, timeout=600):
+    """Submit the jobs, (kind, job data, expected success) tuples, to the
+    code server at `rate` jobs per second and return the report of the
+    run, see `summarize`.
+    """
+    jobs = [dict(kind=kind, at=i / rate, data=data,
+                 expected=dict(success=expected))
+            for i, (kind, data, expected) in enumerate(jobs)]
+    return summarize(*run_jobs(url, jobs, timeout=timeout))
+
+
+def make_jobs(mix, n, seed=None):
+    """Return `n` jobs drawn from the mix, see `run_load`."""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=n)
+    return [(kind,) + JOBS[kind] for kind in kinds]
+
+
+def start_server_pool(servers, port, threads, pools):
+    """Start a server pool on a thread and wait until it serves."""
+    server_pool = ServerPool(n=servers, pool_port=port, n_threads=threads,
+                             pools=pools)
+    thread = Thread(target=server_pool.run)
+    thread.start()
+    url = 'http://localhost:%s' % port
+    for i in range(100):
+        try:
+            requests.get(url)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    return server_pool, thread, url
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-n', '--jobs', type=int, default=200,
+        help="Number of jobs to submit."
+    )
+    parser.add_argument(
+        '-r', '--rate', type=float, default=10.0,
+        help="Jobs submitted per second."
+    )
+    parser.add_argument(
+        '-m', '--mix', default=DEFAULT_MIX,
+        help="Weights of the kinds of jobs, the kinds are: %s."
+        % ', '.join(JOBS)
+    )
+    parser.add_argument(
+        '-u', '--url', help="URL of a running code server, otherwise one is "
+        "started in this process."
+    )
+    parser.add_argument(
+        '-s', '--servers', type=int, default=N_CODE_SERVERS,
+        help="Number of servers of the server pool started."
+    )
+    parser.add_argument(
+        '-t', '--threads', type=int, default=N_CODE_SERVER_THREADS,
+        help="Number of threads of each server of the server pool started."
+    )
+    parser.add_argument(
+        '-p', '--port', type=int, default=SERVER_POOL_PORT + 100,
+        help="Port of the server pool started."
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=600,
+        help="Seconds to wait for the results after the last submission."
+    )
+    parser.add_argument(
+        '--seed', type=int, help="Seed of the random mix of jobs."
+    )
+    parser.add_argument(
+        '-o', '--output', help="File to write the JSON report to, instead "
+        "of the standard output."
+    )
+    options = parser.parse_args(args)
+
+    jobs = make_jobs(parse_mix(options.mix), options.jobs, options.seed)
+    server_pool = None
+    url = options.url
+    if url is None:
+        server_pool, thread, url = start_server_pool(
+            options.servers, options.port, options.threads, CODE_SERVER_POOLS
+        )
+    try:
+        report = run_load(url, jobs, options.rate, timeout=options.timeout)
+    finally:
+        if server_pool is not None:
+            server_pool.stop()
+            thread.join()
+    report['config'] = OrderedDict([
+        ('url', options.url), ('servers', options.servers),
+        ('threads', options.threads), ('rate', options.rate),
+        ('mix', options.mix), ('seed', options.seed),
+    ])
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
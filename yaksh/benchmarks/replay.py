@@ -0,0 +1,130 @@
+"""Replay of the jobs recorded by a code server.
+
+Feeds the jobs of a corpus recorded by the code server, see
+`yaksh.traffic`, back to a code server at the recorded pace or faster. It
+reports whether the results match the recorded ones and the latency
+distributions as JSON, like `yaksh.benchmarks.load`, e.g.
+
+    $ python -m yaksh.benchmarks.replay final_exam.jsonl.gz --speed 2
+
+Jobs which needed files uploaded by the students are replayed without them,
+so their results may differ from the recorded ones.
+"""
+from argparse import ArgumentParser
+from collections import OrderedDict
+import json
+import sys
+
+from yaksh.benchmarks.load import (
+    distribution, run_jobs, summarize, start_server_pool
+)
+from yaksh.settings import (
+    N_CODE_SERVERS, N_CODE_SERVER_THREADS, SERVER_POOL_PORT, CODE_SERVER_POOLS
+)
+from yaksh.traffic import read_corpus
+
+
+def make_replay_jobs(jobs, results, speed=1.0):
+    """Return the jobs of a corpus to be submitted `speed` times faster than
+    they were, expecting their recorded results, see
+    `yaksh.benchmarks.load.run_jobs`. The kind of each job is its language.
+    """
+    if not jobs:
+        return []
+    start = jobs[0]['time']
+    replay_jobs = []
+    for job in jobs:
+        recorded = results.get(job['uid'], {})
+        expected = dict((key, recorded[key]) for key in ('success', 'weight')
+                        if recorded.get(key) is not None)
+        replay_jobs.append(dict(
+            kind=job['data'].get('metadata', {}).get('language'),
+            at=(job['time'] - start) / speed, data=job['data'],
+            expected=expected, course=job.get('course'),
+            user=job.get('user'), uid=job['uid']
+        ))
+    return replay_jobs
+
+
+def replay(url, path, speed=1.0, timeout=600):
+    """Replay the corpus at `path` and return the report. It lists the
+    recorded uids of the jobs whose results differ as `mismatches` and
+    has the distribution of the recorded grading times.
+    """
+    bundles, jobs, results = read_corpus(path)
+    records, elapsed = run_jobs(
+        url, make_replay_jobs(jobs, results, speed), timeout=timeout,
+        bundles=bundles
+    )
+    report = summarize(records, elapsed)
+    report['mismatches'] = [
+        record['job']['uid'] for record in records
+        if record['done'] and not record['expected']
+    ]
+    report['recorded_grading'] = distribution(
+        [r['duration'] for r in results.values()
+         if r.get('duration') is not None]
+    )
+    return report
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('corpus', help="The recorded corpus file.")
+    parser.add_argument(
+        '--speed', type=float, default=1.0,
+        help="How many times faster than recorded the jobs are submitted."
+    )
+    parser.add_argument(
+        '-u', '--url', help="URL of a running code server, otherwise one is "
+        "started in this process."
+    )
+    parser.add_argument(
+        '-s', '--servers', type=int, default=N_CODE_SERVERS,
+        help="Number of servers of the server pool started."
+    )
+    parser.add_argument(
+        '-t', '--threads', type=int, default=N_CODE_SERVER_THREADS,
+        help="Number of threads of each server of the server pool started."
+    )
+    parser.add_argument(
+        '-p', '--port', type=int, default=SERVER_POOL_PORT + 100,
+        help="Port of the server pool started."
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=600,
+        help="Seconds to wait for the results after the last submission."
+    )
+    parser.add_argument(
+        '-o', '--output', help="File to write the JSON report to, instead "
+        "of the standard output."
+    )
+    options = parser.parse_args(args)
+
+    server_pool = None
+    url = options.url
+    if url is None:
+        server_pool, thread, url = start_server_pool(
+            options.servers, options.port, options.threads, CODE_SERVER_POOLS
+        )
+    try:
+        report = replay(url, options.corpus, options.speed, options.timeout)
+    finally:
+        if server_pool is not None:
+            server_pool.stop()
+            thread.join()
+    report['config'] = OrderedDict([
+        ('url', options.url), ('servers', options.servers),
+        ('threads', options.threads), ('speed', options.speed),
+        ('corpus', options.corpus),
+    ])
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -13,27 +13,51 @@ run as many servers as desired.
 # Standard library imports
 from __future__ import unicode_literals
 from argparse import ArgumentParser
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
-from multiprocessing import Process, Queue, Manager
+from multiprocessing import Event, Process, Queue, Manager
 import os
 from os.path import dirname, abspath
 import pwd
+import queue
 import sys
+import threading
 import time
+import traceback
 
 # Library imports
 import requests
-from tornado.ioloop import IOLoop
+from tornado.ioloop import IOLoop, PeriodicCallback
 from tornado.web import Application, RequestHandler
 import urllib
 
 # Local imports
-from .settings import N_CODE_SERVERS, SERVER_POOL_PORT
-from .grader import Grader
+from .settings import (
+    N_CODE_SERVERS, N_CODE_SERVER_THREADS, SERVER_POOL_PORT, CODE_SERVER_POOLS,
+    CODE_SERVER_COURSE_SHARES, CODE_SERVER_MAX_BUNDLES,
+    CODE_SERVER_RECORD_FILE, CODE_SERVER_MAX_PRESCALE_SERVERS
+)
+from .error_messages import prettify_exceptions
+from .grader import (
+    Grader, create_signal_handler, delete_signal_handler,
+    set_original_signal_handler
+)
+from .hook_evaluator import load_hook
+from .traffic import Recorder
+from .language_registry import is_thread_safe
+from . import wire_format
 
 
 MY_DIR = abspath(dirname(__file__))
 
+# Name of the pool grading the languages without a pool of their own.
+DEFAULT_POOL = 'default'
+
+# Grading bundles decoded by this process, keyed by their hash.
+_bundle_cache = OrderedDict()
+
 
 # Private Protocol ##########
 def run_as_nobody():
@@ -44,48 +68,421 @@ def run_as_nobody():
     os.seteuid(nobody.pw_uid)
 
 
-def check_code(pid, job_queue, results):
-    """Check the code, this runs forever.
+def grade(pid, results, uid, data, user_dir, queue_wait):
+    """Grade a single job and store its result."""
+    started = time.time()
+    grader = Grader(user_dir)
+
+    def publish_progress(progress):
+        results[uid] = dict(
+            status='running', pid=pid, result=None, started=started,
+            progress=progress
+        )
+
+    try:
+        result = grader.evaluate(data, progress_callback=publish_progress)
+    except Exception as e:
+        # Report the failure instead of leaving the job running for ever,
+        # this matters most on a thread where nothing else would catch it.
+        result = dict(
+            success=False, weight=0.0, timing={},
+            error=[prettify_exceptions(type(e).__name__, str(e),
+                                       traceback.format_exc())]
+        )
+    result['timing']['queue_wait'] = queue_wait
+    results[uid] = dict(status='done', result=result,
+                        duration=time.time() - started)
+
+
+def merge_bundle(data, bundle):
+    """Return the job data referring to a grading bundle with the test cases
+    and metadata of the bundle added.
+    """
+    merged = dict(data)
+    merged['test_case_data'] = [dict(test_case)
+                                for test_case in bundle['test_case_data']]
+    metadata = dict(bundle['metadata'])
+    metadata.update(data['metadata'])
+    merged['metadata'] = metadata
+    return merged
+
+
+def expand_job(data, bundles):
+    """Return the job data with the grading bundle it refers to, if any,
+    merged in. The bundle is read from the shared `bundles` dict and decoded
+    once per process. Raises KeyError if the bundle is not known.
+    """
+    bundle_hash = data.get('metadata', {}).get('bundle_hash')
+    if bundle_hash is None:
+        return data
+    bundle = _bundle_cache.get(bundle_hash)
+    if bundle is None:
+        bundle = json.loads(bundles[bundle_hash])
+        _bundle_cache[bundle_hash] = bundle
+        while len(_bundle_cache) > CODE_SERVER_MAX_BUNDLES:
+            _bundle_cache.popitem(last=False)
+    else:
+        _bundle_cache.move_to_end(bundle_hash)
+    return merge_bundle(data, bundle)
+
+
+def warm_up(bundles, bundle_hashes):
+    """Decode the grading bundles and load their hooks ahead of the jobs
+    referring to them, see `ServerPool.scale`.
+    """
+    for bundle_hash in bundle_hashes:
+        if bundle_hash in _bundle_cache:
+            continue
+        try:
+            data = expand_job({'metadata': {'bundle_hash': bundle_hash}},
+                              bundles)
+        except KeyError:
+            continue
+        for test_case in data['test_case_data']:
+            if test_case.get('test_case_type') != 'hooktestcase':
+                continue
+            # The hook is instructor code, give it the time a job gets.
+            prev_handler = create_signal_handler()
+            try:
+                load_hook(test_case['hook_code'])
+            except Exception:
+                pass
+            finally:
+                delete_signal_handler()
+                set_original_signal_handler(prev_handler)
+
+
+def runs_on_thread(data):
+    """Return True if the job only needs thread safe evaluators."""
+    try:
+        return is_thread_safe(data.get('metadata', {}),
+                              data.get('test_case_data', []))
+    except Exception:
+        # Let the grader report the error on the main thread.
+        return False
+
+
+def check_code(pid, job_queue, results, n_threads=1, bundles=None,
+               retire=None, warm=()):
+    """Check the code, this runs until the `retire` event is set.
+
+    Jobs referring to a grading bundle get it from `bundles`, see
+    `expand_job`. While idle, the bundles listed in `warm` are loaded
+    ahead, see `warm_up`.
+
+    If `n_threads` is more than one, jobs whose evaluators all work in
+    subprocesses (C, C++, Java, Bash, R, Scilab) are graded concurrently on a
+    pool of that many threads. The other jobs, e.g. Python ones which run the
+    code in this process, are graded one at a time on the main thread.
+    """
+    if n_threads > 1:
+        executor = ThreadPoolExecutor(max_workers=n_threads)
+        free_threads = threading.BoundedSemaphore(n_threads)
+    while retire is None or not retire.is_set():
+        try:
+            job = job_queue.get(True, 1)
+        except queue.Empty:
+            if warm:
+                warm_up(bundles, list(warm))
+            continue
+        uid, json_data, user_dir, submitted_at = job
+        try:
+            data = expand_job(json.loads(json_data), bundles)
+        except KeyError:
+            error = prettify_exceptions(
+                'KeyError', 'The test cases of the question are not '
+                'available any more, please submit again.'
+            )
+            results[uid] = dict(status='done', result=dict(
+                success=False, weight=0.0, error=[error],
+                timing=dict(queue_wait=time.time() - submitted_at)
+            ))
+            continue
+        on_thread = n_threads > 1 and runs_on_thread(data)
+        if on_thread:
+            # Wait for a free thread before marking the job as running, so
+            # that its status reflects when it really starts.
+            free_threads.acquire()
+        queue_wait = time.time() - submitted_at
+        results[uid] = dict(status='running', pid=pid, result=None,
+                            started=time.time())
+        if on_thread:
+            future = executor.submit(
+                grade, pid, results, uid, data, user_dir, queue_wait
+            )
+            future.add_done_callback(lambda f: free_threads.release())
+        else:
+            grade(pid, results, uid, data, user_dir, queue_wait)
+    if n_threads > 1:
+        executor.shutdown(wait=True)
+
+
+###############################################################################
+# `FairQueue` class.
+###############################################################################
+class FairQueue(object):
+    """Weighted fair queue of jobs keyed on the course and the user.
+
+    The courses with waiting jobs are served in proportion to their weight:
+    each course has a virtual time which advances by 1/weight for every job
+    taken and the course with the smallest virtual time goes next. The users
+    of a course are served in turn, so that one user submitting again and
+    again does not hold up the others. A course with `quota` jobs in flight
+    is skipped until one of them is `done`.
+    """
+    def __init__(self, shares=None):
+        """
+        Parameters
+        ----------
+
+        shares : dict
+            Maps a course id to a dict with its `weight` (1 by default) and
+            `quota` (0, i.e. no limit, by default). A `default` entry
+            applies to the courses not listed.
+        """
+        shares = dict(shares or {})
+        self.default_share = dict(weight=1.0, quota=0)
+        self.default_share.update(shares.pop('default', {}))
+        self.shares = dict((str(course), share)
+                           for course, share in shares.items())
+        self.courses = OrderedDict()
+        self.virtual_time = 0.0
+        self.in_flight = {}
+        self.finish_times = {}
+
+    def __len__(self):
+        return sum(len(jobs) for users in self.courses.values()
+                   for jobs in users.values())
+
+    def _get_share(self, course, key):
+        share = self.shares.get(str(course), {})
+        return share.get(key, self.default_share[key])
+
+    def put(self, job, course=None, user=None):
+        users = self.courses.get(course)
+        if users is None:
+            # A course which was idle starts at the current virtual time,
+            # it cannot claim the turns it did not use.
+            users = self.courses[course] = OrderedDict()
+            self.finish_times[course] = max(
+                self.finish_times.get(course, 0.0), self.virtual_time
+            )
+        users.setdefault(user, deque()).append(job)
+
+    def get(self):
+        """Return the next job along with its course, None if there are no
+        jobs or all the courses with jobs are at their quota.
+        """
+        eligible = [
+            course for course in self.courses
+            if not (0 < self._get_share(course, 'quota')
+                    <= self.in_flight.get(course, 0))
+        ]
+        if not eligible:
+            return None
+        course = min(eligible, key=lambda c: self.finish_times[c])
+        users = self.courses[course]
+        user, jobs = next(iter(users.items()))
+        job = jobs.popleft()
+        del users[user]
+        if jobs:
+            users[user] = jobs
+        if not users:
+            del self.courses[course]
+        self.virtual_time = self.finish_times[course]
+        self.finish_times[course] += 1.0 / self._get_share(course, 'weight')
+        self.in_flight[course] = self.in_flight.get(course, 0) + 1
+        return job, course
+
+    def done(self, course):
+        """Mark a job of the course taken with `get` as finished."""
+        self.in_flight[course] -= 1
+        if not self.in_flight[course]:
+            del self.in_flight[course]
+
+
+###############################################################################
+# `JobEstimator` class.
+###############################################################################
+class JobEstimator(object):
+    """Rolling estimates of the time taken to grade a job.
+
+    The estimates are exponentially weighted averages of the durations of
+    the jobs graded, kept for each question and for each language. A job of
+    a question not seen yet is estimated from its language, then from all
+    the jobs, and `default` seconds when nothing was graded yet.
     """
-    while True:
-        uid, json_data, user_dir = job_queue.get(True)
-        results[uid] = dict(status='running', pid=pid, result=None)
-        data = json.loads(json_data)
-        grader = Grader(user_dir)
-        result = grader.evaluate(data)
-        results[uid] = dict(status='done', result=json.dumps(result))
+    def __init__(self, alpha=0.2, default=1.0, max_keys=4096):
+        self.alpha = alpha
+        self.default = default
+        self.max_keys = max_keys
+        self.estimates = OrderedDict()
+
+    def _update(self, key, duration):
+        estimate = self.estimates.pop(key, None)
+        if estimate is None:
+            estimate = duration
+        else:
+            estimate += self.alpha * (duration - estimate)
+        self.estimates[key] = estimate
+        while len(self.estimates) > self.max_keys:
+            self.estimates.popitem(last=False)
+
+    def record(self, language, question, duration):
+        self._update((language, question), duration)
+        self._update((language, None), duration)
+        self._update((None, None), duration)
+
+    def estimate(self, language, question):
+        for key in ((language, question), (language, None), (None, None)):
+            if key in self.estimates:
+                return self.estimates[key]
+        return self.default
 
 
 ###############################################################################
 # `ServerPool` class.
 ###############################################################################
 class ServerPool(object):
-    """Manages a pool of processes checking code."""
-    def __init__(self, n, pool_port=50000):
+    """Manages a pool of processes checking code.
+
+    The processes may be split into several pools, each grading a group of
+    languages from its own queue, so that a wave of submissions in one
+    language does not hold up the others.
+
+    Submitted jobs wait in a `FairQueue` of their pool and are only handed
+    to the processes as they are ready to take them, so that the jobs of
+    one course or user cannot fill the queue ahead of the others.
+
+    The time taken by the graded jobs is used to estimate when the waiting
+    and running jobs will be done, see `get_eta`.
+    """
+    def __init__(self, n, pool_port=50000, n_threads=1, pools=None,
+                 shares=None, recorder=None):
         """Create a pool of servers.
 
         Parameters
         ----------
 
         n : int
-            Number of code servers to run
+            Number of code servers to run for the languages which do not
+            have a pool of their own.
 
         pool_port : int
             Port at which the server pool should serve.
+
+        n_threads : int
+            Number of jobs each code server may grade concurrently on
+            threads, see `check_code`.
+
+        pools : dict
+            Maps the name of a pool to a dict with the `languages` it grades,
+            its number of `servers` and optionally of `threads`, e.g.
+            {'java': {'languages': ['java'], 'servers': 2}}.
+
+        shares : dict
+            The weight and quota of the courses, see `FairQueue`.
+
+        recorder : yaksh.traffic.Recorder
+            Optionally records the jobs and their results.
         """
         self.n = n
+        self.n_threads = n_threads
         self.manager = Manager()
         self.results = self.manager.dict()
         self.my_port = pool_port
+        self.shares = shares
+        self.recorder = recorder
+        self.estimator = JobEstimator()
+        # The JSON of the grading bundles by their hash, shared with the
+        # processes, and the hashes from the least recently used.
+        self.bundles = self.manager.dict()
+        self.bundle_hashes = OrderedDict()
+        # The hashes of the bundles the idle processes load ahead.
+        self.warm = self.manager.list()
+        # The pool, language, question and submission time of the jobs
+        # which are not done, by uid.
+        self.jobs = {}
+
+        self.pools = OrderedDict()
+        self.language_pools = {}
+        self._add_pool(DEFAULT_POOL, n, n_threads)
+        for name, config in (pools or {}).items():
+            self._add_pool(name, config['servers'],
+                           config.get('threads', n_threads))
+            for language in config['languages']:
+                self.language_pools[language] = name
+        self.job_queue = self.pools[DEFAULT_POOL]['queue']
 
-        self.job_queue = Queue()
+        # The pool of each process, indexed by the process id, the events
+        # telling them to stop and the ids of the processes stopped or
+        # stopping.
+        self.process_pools = []
+        for name, pool in self.pools.items():
+            self.process_pools.extend([name] * pool['servers'])
+        self.retire_events = {}
+        self.retired = set()
         processes = []
-        for i in range(n):
+        for i in range(len(self.process_pools)):
             p = self._make_process(i)
             processes.append(p)
         self.processes = processes
         self.app = self._make_app()
 
+    def _add_pool(self, name, servers, threads):
+        self.pools[name] = dict(queue=Queue(), servers=servers,
+                                base_servers=servers, boost=None,
+                                threads=threads,
+                                fair_queue=FairQueue(self.shares),
+                                dispatched=OrderedDict(), running={})
+
+    def _dispatch(self, name):
+        """Move jobs from the fair queue of the pool to its processes,
+        keeping no more jobs waiting in the process queue than there are
+        processes.
+        """
+        pool = self.pools[name]
+        fair_queue = pool['fair_queue']
+        dispatched = pool['dispatched']
+        running = pool['running'] = {}
+        waiting = 0
+        for uid in list(dispatched):
+            result = self.results.get(uid, {})
+            status = result.get('status')
+            if status == 'not started':
+                waiting += 1
+            elif status == 'running':
+                running[uid] = result.get('started', time.time())
+            else:
+                self._finish(uid, result)
+        while waiting < pool['servers']:
+            item = fair_queue.get()
+            if item is None:
+                break
+            job, course = item
+            dispatched[job[0]] = course
+            pool['queue'].put(job)
+            waiting += 1
+
+    def _finish(self, uid, result):
+        """Forget a job which is done and learn from the time it took."""
+        job = self.jobs.pop(uid, None)
+        if job is None:
+            return
+        pool = self.pools[job['pool']]
+        if uid in pool['dispatched']:
+            pool['fair_queue'].done(pool['dispatched'].pop(uid))
+        pool['running'].pop(uid, None)
+        if self.recorder is not None:
+            self.recorder.result(uid, result)
+        if result.get('duration') is not None:
+            self.estimator.record(job['language'], job['question'],
+                                  result['duration'])
+
+    def _dispatch_all(self):
+        for name in self.pools:
+            self._dispatch(name)
+
     def _make_app(self):
         app = Application([
             (r"/.*", MainHandler, dict(server=self)),
@@ -94,10 +491,53 @@ class ServerPool(object):
         return app
 
     def _make_process(self, pid):
+        pool = self.pools[self.process_pools[pid]]
+        self.retire_events[pid] = retire = Event()
         return Process(
-            target=check_code, args=(pid, self.job_queue, self.results)
+            target=check_code,
+            args=(pid, pool['queue'], self.results, pool['threads'],
+                  self.bundles, retire, self.warm)
         )
 
+    def _resize(self, name):
+        """Start or stop processes of the pool so that it runs its base
+        number of servers, or more while it is scaled up.
+        """
+        pool = self.pools[name]
+        servers = pool['base_servers']
+        if pool['boost'] is not None:
+            boost_servers, until = pool['boost']
+            if until > time.time():
+                servers = max(servers, boost_servers)
+            else:
+                pool['boost'] = None
+        pool['servers'] = servers
+        pids = [pid for pid, pool_name in enumerate(self.process_pools)
+                if pool_name == name]
+        active = [pid for pid in pids if pid not in self.retired]
+        # Idle processes stop once their current job is done.
+        for pid in active[servers:]:
+            self.retire_events[pid].set()
+            self.retired.add(pid)
+        n_missing = servers - len(active)
+        for pid in pids:
+            if n_missing <= 0:
+                break
+            if pid in self.retired and not self.processes[pid].is_alive():
+                self.retired.discard(pid)
+                self.processes[pid] = self._make_process(pid)
+                self.processes[pid].start()
+                n_missing -= 1
+        for i in range(n_missing):
+            self.process_pools.append(name)
+            pid = len(self.processes)
+            self.processes.append(self._make_process(pid))
+            self.processes[pid].start()
+
+    def _resize_all(self):
+        for name in self.pools:
+            self._resize(name)
+
     def _start_code_servers(self):
         for proc in self.processes:
             if proc.pid is None:
@@ -109,16 +549,17 @@ class ServerPool(object):
             proc = self.processes[pid]
             if not proc.is_alive():
                 # If the processes is dead, something bad happened so
-                # restart that process.
-                new_proc = self._make_process(pid)
-                self.processes[pid] = new_proc
-                new_proc.start()
+                # restart that process, unless it was retired.
+                if pid not in self.retired:
+                    new_proc = self._make_process(pid)
+                    self.processes[pid] = new_proc
+                    new_proc.start()
                 result['status'] = 'done'
-                result['result'] = json.dumps(dict(
+                result['result'] = dict(
                     success=False, weight=0.0,
                     error=['Process ended with exit code %s.'
                            % proc.exitcode]
-                ))
+                )
 
     # Public Protocol ##########
 
@@ -133,16 +574,149 @@ class ServerPool(object):
 
         return qs, alive, n_running
 
-    def submit(self, uid, json_data, user_dir):
-        self.results[uid] = dict(status='not started')
-        self.job_queue.put((uid, json_data, user_dir))
+    def get_pool_status(self):
+        """Returns the job queue size, number of processes alive and of jobs
+        running for each pool.
+        """
+        status = OrderedDict(
+            (name, [0, 0, 0]) for name in self.pools
+        )
+        for r in self.results.values():
+            if r['status'] == 'not started':
+                status[r.get('pool', DEFAULT_POOL)][0] += 1
+            elif r['status'] == 'running':
+                status[self.process_pools[r['pid']]][2] += 1
+        for name, proc in zip(self.process_pools, self.processes):
+            status[name][1] += proc.is_alive()
+        return OrderedDict(
+            (name, tuple(values)) for name, values in status.items()
+        )
+
+    def _get_metadata(self, json_data):
+        try:
+            return dict(json.loads(json_data)['metadata'])
+        except (ValueError, KeyError, TypeError):
+            return {}
+
+    def get_pool_name(self, json_data):
+        """Returns the name of the pool grading the language of the job."""
+        language = self._get_metadata(json_data).get('language')
+        return self.language_pools.get(language, DEFAULT_POOL)
+
+    def scale(self, name, servers, ttl):
+        """Run at least `servers` processes in the pool, but no more than
+        CODE_SERVER_MAX_PRESCALE_SERVERS, for the next `ttl` seconds, after
+        which it goes back to its base number of servers.
+        """
+        servers = min(servers, CODE_SERVER_MAX_PRESCALE_SERVERS)
+        self.pools[name]['boost'] = (servers, time.time() + ttl)
+        self._resize(name)
+
+    def set_warm_bundles(self, bundle_hashes):
+        """Have the idle processes load the stored bundles ahead."""
+        del self.warm[:]
+        self.warm.extend([bundle_hash for bundle_hash in bundle_hashes
+                          if bundle_hash in self.bundle_hashes])
+
+    def get_eta(self, uid):
+        """Returns the position of a job in its queue and the estimated
+        number of seconds until it starts and finishes, None if the job is
+        not known or done.
+
+        The work ahead of a waiting job is the estimate of the jobs of its
+        pool submitted before it and the remaining estimate of the running
+        ones, shared among all the servers and threads of the pool.
+        """
+        job = self.jobs.get(uid)
+        if job is None:
+            return None
+        pool = self.pools[job['pool']]
+        now = time.time()
+        estimate = self.estimator.estimate(job['language'], job['question'])
+        started = pool['running'].get(uid)
+        if started is not None:
+            finish_in = max(started + estimate - now, 0.0)
+            return dict(position=0, start_in=0.0, finish_in=finish_in)
+
+        position = 1
+        work = 0.0
+        for other_uid, other in self.jobs.items():
+            if other['pool'] != job['pool'] or other_uid == uid:
+                continue
+            other_estimate = self.estimator.estimate(
+                other['language'], other['question']
+            )
+            other_started = pool['running'].get(other_uid)
+            if other_started is not None:
+                work += max(other_started + other_estimate - now, 0.0)
+            elif other['submitted'] < job['submitted']:
+                position += 1
+                work += other_estimate
+        start_in = work / (pool['servers'] * pool['threads'])
+        return dict(position=position, start_in=start_in,
+                    finish_in=start_in + estimate)
+
+    def has_bundle(self, bundle_hash):
+        if bundle_hash in self.bundle_hashes:
+            self.bundle_hashes.move_to_end(bundle_hash)
+            return True
+        return False
+
+    def put_bundle(self, bundle_hash, bundle_json):
+        """Store the JSON of a grading bundle for the jobs referring to it,
+        keeping at most CODE_SERVER_MAX_BUNDLES of them.
+        """
+        self.bundles[bundle_hash] = bundle_json
+        self.bundle_hashes[bundle_hash] = True
+        self.bundle_hashes.move_to_end(bundle_hash)
+        while len(self.bundle_hashes) > CODE_SERVER_MAX_BUNDLES:
+            old_hash, _ = self.bundle_hashes.popitem(last=False)
+            self.bundles.pop(old_hash, None)
+
+    def submit(self, uid, json_data, user_dir, course=None, user=None,
+               metadata=None):
+        """Queue a job. The `language`, `question_id` and `bundle_hash` of
+        the job are taken from `metadata` if given, from the job data
+        otherwise.
+
+        Returns False without queuing the job if it refers to a grading
+        bundle which is not stored, see `put_bundle`.
+        """
+        if metadata is None:
+            metadata = self._get_metadata(json_data)
+        bundle_hash = metadata.get('bundle_hash')
+        if bundle_hash is not None and not self.has_bundle(bundle_hash):
+            return False
+        language = metadata.get('language')
+        pool = self.language_pools.get(language, DEFAULT_POOL)
+        submitted = time.time()
+        self.jobs[uid] = dict(pool=pool, language=language,
+                              question=metadata.get('question_id'),
+                              submitted=submitted)
+        self.results[uid] = dict(status='not started', pool=pool)
+        if self.recorder is not None:
+            self.recorder.job(
+                uid, json_data, submitted, course, user,
+                self.bundles.get(bundle_hash) if bundle_hash else None
+            )
+        self.pools[pool]['fair_queue'].put(
+            (uid, json_data, user_dir, submitted), course, user
+        )
+        self._dispatch(pool)
+        return True
 
     def get_result(self, uid):
+        """Returns the status of the job as a dict, its result is a dict
+        once it is done.
+        """
         result = self.results.get(uid, dict(status='unknown'))
         self._handle_dead_process(result)
         if result.get('status') == 'done':
             self.results.pop(uid)
-        return json.dumps(result)
+            self._finish(uid, result)
+        elif uid in self.jobs:
+            result['eta'] = self.get_eta(uid)
+        return result
 
     def run(self):
         """Run server which returns an available server port where code
@@ -150,6 +724,12 @@ class ServerPool(object):
         """
         # We start the code servers here to ensure they are run as nobody.
         self._start_code_servers()
+        # Jobs are also dispatched as the processes take them off the
+        # queues, between requests.
+        self.dispatcher = PeriodicCallback(self._dispatch_all, 50)
+        self.dispatcher.start()
+        self.scaler = PeriodicCallback(self._resize_all, 1000)
+        self.scaler.start()
         IOLoop.current().start()
 
     def stop(self):
@@ -157,13 +737,25 @@ class ServerPool(object):
         """
         for proc in self.processes:
             proc.terminate()
+        if self.recorder is not None:
+            self.recorder.close()
         IOLoop.current().stop()
 
 
 class MainHandler(RequestHandler):
+    """Serves the jobs and results as `wire_format` frames to the clients
+    accepting them and as form data and JSON to the others.
+    """
     def initialize(self, server):
         self.server = server
 
+    def _accepts_frames(self):
+        return wire_format.MEDIA_TYPE in self.request.headers.get('Accept', '')
+
+    def _write_frame(self, header):
+        self.set_header('Content-Type', wire_format.MEDIA_TYPE)
+        self.write(wire_format.encode(header))
+
     def get(self):
         path = self.request.path[1:]
         if len(path) == 0:
@@ -171,21 +763,109 @@ class MainHandler(RequestHandler):
             result = "%d processes, %d running, %d queued" % (
                 alive, running, q_size
             )
+            if len(self.server.pools) > 1:
+                pool_status = self.server.get_pool_status()
+                for name, (q_size, alive, running) in pool_status.items():
+                    result += "\n%s: %d processes, %d running, %d queued" % (
+                        name, alive, running, q_size
+                    )
             self.write(result)
+        elif path.startswith('bundles/'):
+            if not self.server.has_bundle(path[len('bundles/'):]):
+                self.set_status(404)
+            self.write('')
         else:
             uid = path
-            json_result = self.server.get_result(uid)
-            self.write(json_result)
+            result = self.server.get_result(uid)
+            if self._accepts_frames():
+                self._write_frame(result)
+            else:
+                if isinstance(result.get('result'), dict):
+                    result['result'] = json.dumps(result['result'])
+                self.write(json.dumps(result))
+
+    def _missing_bundle(self):
+        self.set_status(409)
+        self.write(json.dumps(dict(status='missing bundle')))
 
     def post(self):
-        uid = self.get_argument('uid')
-        json_data = self.get_argument('json_data')
-        user_dir = self.get_argument('user_dir')
-        self.server.submit(uid, json_data, user_dir)
-        self.write('OK')
+        path = self.request.path[1:]
+        if path.startswith('bundles/'):
+            bundle_hash = path[len('bundles/'):]
+            body = self.request.body
+            if hashlib.sha1(body).hexdigest() != bundle_hash:
+                self.set_status(400)
+                self.write('The bundle does not match its hash.')
+                return
+            self.server.put_bundle(bundle_hash, body.decode('utf-8'))
+            self.write('OK')
+            return
+        if path == 'scale':
+            try:
+                data = json.loads(self.request.body.decode('utf-8'))
+                pools = data.get('pools', {})
+                ttl = data['ttl']
+                counts = [ttl] + list(pools.values())
+            except (ValueError, KeyError, AttributeError):
+                counts = None
+            if counts is None or not all(
+                    type(count) is int and count >= 0 for count in counts):
+                self.set_status(400)
+                self.write('Expected a ttl and pool sizes which are '
+                           'non-negative integers.')
+                return
+            for name, servers in pools.items():
+                if name in self.server.pools:
+                    self.server.scale(name, servers, ttl)
+            self.server.set_warm_bundles(data.get('bundles', []))
+            self.write('OK')
+            return
+        content_type = self.request.headers.get('Content-Type', '')
+        if content_type.startswith(wire_format.MEDIA_TYPE):
+            try:
+                header, body = wire_format.decode(self.request.body)
+            except ValueError as e:
+                self.set_status(415)
+                self.write(str(e))
+                return
+            uid = str(header['uid'])
+            queued = self.server.submit(
+                uid, body.decode('utf-8'), header['user_dir'],
+                header.get('course'), header.get('user'),
+                metadata=header.get('metadata')
+            )
+            if not queued:
+                self._missing_bundle()
+                return
+            self._write_frame(dict(
+                status='not started', eta=self.server.get_eta(uid)
+            ))
+        else:
+            uid = self.get_argument('uid')
+            json_data = self.get_argument('json_data')
+            user_dir = self.get_argument('user_dir')
+            course = self.get_argument('course', None)
+            user = self.get_argument('user', None)
+            if not self.server.submit(uid, json_data, user_dir, course, user):
+                self._missing_bundle()
+                return
+            self.write(json.dumps(dict(
+                status='not started', eta=self.server.get_eta(uid)
+            )))
+
 
+def _decode_response(response):
+    if response.headers.get('Content-Type', '').startswith(
+            wire_format.MEDIA_TYPE):
+        return wire_format.decode(response.content)[0]
+    try:
+        return json.loads(response.content.decode('utf-8'))
+    except ValueError:
+        return {}
 
-def submit(url, uid, json_data, user_dir):
+
+def submit(url, uid, json_data, user_dir, course=None, user=None,
+           metadata=None, bundle=None):
     '''Submit a job to the code server.
 
     Parameters
@@ -202,10 +882,93 @@ def submit(url, uid, json_data, user_dir):
 
     user_dir : str
         User directory.
+
+    course : int
+        Optional id of the course of the submission, jobs are scheduled
+        fairly between courses.
+
+    user : int
+        Optional id of the user, jobs are scheduled fairly between the users
+        of a course.
+
+    metadata : dict
+        Optional `language`, `question_id` and `bundle_hash` of the job, so
+        that the server need not read them from `json_data`.
+
+    bundle : callable
+        For a job referring to a grading bundle, a callable returning the
+        hash and the JSON of the bundle, see
+        `Question.get_grading_bundle`. It is only called when the server
+        does not have the bundle yet, which is then sent to the server.
+
+    The job is sent as a `wire_format` frame, with the job data as it is in
+    its body. Servers which do not take frames get it form encoded.
+
+    Returns the status of the job as a dict. It has an 'eta' dict with the
+    `position` of the job in the queue and the estimated seconds until it
+    starts (`start_in`) and finishes (`finish_in`), it is empty for servers
+    not sending any.
     '''
-    requests.post(
-        url, data=dict(uid=uid, json_data=json_data, user_dir=user_dir)
-    )
+    header = dict(uid=str(uid), user_dir=user_dir, course=course,
+                  user=user, metadata=metadata)
+    frame = wire_format.encode(header, json_data.encode('utf-8'))
+    headers = {'Content-Type': wire_format.MEDIA_TYPE,
+               'Accept': wire_format.MEDIA_TYPE}
+    r = requests.post(url, data=frame, headers=headers)
+    if r.status_code == 409 and bundle is not None:
+        put_bundle(url, *bundle())
+        r = requests.post(url, data=frame, headers=headers)
+    if r.status_code in (400, 415):
+        if bundle is not None:
+            # Servers not taking frames do not store bundles either.
+            json_data = json.dumps(merge_bundle(
+                json.loads(json_data), json.loads(bundle()[1])
+            ))
+        data = dict(uid=uid, json_data=json_data, user_dir=user_dir)
+        if course is not None:
+            data['course'] = course
+        if user is not None:
+            data['user'] = user
+        r = requests.post(url, data=data)
+    return _decode_response(r)
+
+
+def has_bundle(url, bundle_hash):
+    '''Return True if the code server stores the grading bundle.'''
+    r = requests.get(urllib.parse.urljoin(url, '/bundles/' + bundle_hash))
+    return r.status_code == 200
+
+
+def put_bundle(url, bundle_hash, bundle_json):
+    '''Store a grading bundle in the code server, see `submit`.'''
+    requests.post(urllib.parse.urljoin(url, '/bundles/' + bundle_hash),
+                  data=bundle_json.encode('utf-8'))
+
+
+def scale(url, pools, ttl, bundles=()):
+    '''Ask the code server to run more processes for a while.
+
+    Parameters
+    ----------
+
+    url : str
+        URL of the server pool.
+
+    pools : dict
+        Maps the name of a pool to the number of servers it should run at
+        least.
+
+    ttl : int
+        Seconds after which the pools go back to their base size, unless
+        scaled again.
+
+    bundles : list
+        Hashes of the stored grading bundles the idle servers should load
+        ahead.
+    '''
+    requests.post(urllib.parse.urljoin(url, '/scale'), data=json.dumps(
+        dict(pools=pools, ttl=ttl, bundles=list(bundles))
+    ))
 
 
 def get_result(url, uid, block=False):
@@ -214,7 +977,10 @@ def get_result(url, uid, block=False):
     Returns the result currently known in the form of a dict. The dictionary
     contains two keys, 'status' and 'result'. The status can be one of
     ['running', 'not started', 'done', 'unknown']. The result is the result of
-    the code execution as a jsonized string.
+    the code execution as a dict. While a job is running, the
+    dictionary may also contain a 'progress' dict with the number of test
+    cases `completed` out of `total` along with the partial `weight` and
+    `error` entries. Until it is done, it has an 'eta' dict, see `submit`.
 
     Parameters
     ----------
@@ -230,8 +996,13 @@ def get_result(url, uid, block=False):
 
     '''
     def _get_data():
-        r = requests.get(urllib.parse.urljoin(url, str(uid)))
-        return json.loads(r.content.decode('utf-8'))
+        r = requests.get(urllib.parse.urljoin(url, str(uid)),
+                         headers={'Accept': wire_format.MEDIA_TYPE})
+        data = _decode_response(r)
+        if isinstance(data.get('result'), str):
+            # Servers not sending frames send the result as a JSON string.
+            data['result'] = json.loads(data['result'])
+        return data
     data = _get_data()
     if block:
         while data.get('status') != 'done':
@@ -252,13 +1023,28 @@ def main(args=None):
         '-p', '--port', dest='port', default=SERVER_POOL_PORT,
         help="Port at which the http server should run."
     )
+    parser.add_argument(
+        '-t', '--threads', dest='threads', type=int,
+        default=N_CODE_SERVER_THREADS,
+        help="Number of jobs run concurrently on threads by each server."
+    )
+    parser.add_argument(
+        '-r', '--record', dest='record', default=CODE_SERVER_RECORD_FILE,
+        help="File to record the jobs and results to, see yaksh.traffic."
+    )
 
     options = parser.parse_args(args)
 
+    # The recording is opened before giving up the privileges.
+    recorder = Recorder(options.record) if options.record else None
     # Called before serverpool is created so that the multiprocessing
     # can work properly.
     run_as_nobody()
-    server_pool = ServerPool(n=options.n, pool_port=options.port)
+    server_pool = ServerPool(n=options.n, pool_port=options.port,
+                             n_threads=options.threads,
+                             pools=CODE_SERVER_POOLS,
+                             shares=CODE_SERVER_COURSE_SHARES,
+                             recorder=recorder)
 
     server_pool.run()
 
@@ -13,6 +13,8 @@ from .error_messages import prettify_exceptions
 
 class CppCodeEvaluator(BaseEvaluator):
     """Tests the C code obtained from Code Server"""
+    thread_safe = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
         self.compiled_user_answer = None
@@ -43,11 +45,11 @@ class CppCodeEvaluator(BaseEvaluator):
         if os.path.exists(self.test_code_path):
             os.remove(self.test_code_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
 
     def set_file_paths(self):
-        user_output_path = os.getcwd() + '/output_file'
-        ref_output_path = os.getcwd() + '/executable'
+        user_output_path = os.path.join(self.working_dir, 'output_file')
+        ref_output_path = os.path.join(self.working_dir, 'executable')
 
         return user_output_path, ref_output_path
 
@@ -72,7 +74,10 @@ class CppCodeEvaluator(BaseEvaluator):
             self.write_to_submit_code_file(self.test_code_path, self.test_case)
             clean_ref_code_path = self.test_code_path
             if self.file_paths:
-                self.files = copy_files(self.file_paths)
+                with self.record_time('file_copy'):
+                    self.files = copy_files(
+                        self.file_paths, self.working_dir
+                    )
             if not isfile(clean_ref_code_path):
                 msg = "No file at %s or Incorrect path" % clean_ref_code_path
                 return False, msg
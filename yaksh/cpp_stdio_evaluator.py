@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
+import shlex
 import subprocess
 import os
 from os.path import isfile
@@ -30,15 +31,15 @@ class CppStdIOEvaluator(StdIOEvaluator):
         if os.path.exists(self.submit_code_path):
             os.remove(self.submit_code_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
         if os.path.exists(self.ref_output_path):
             os.remove(self.ref_output_path)
         if os.path.exists(self.user_output_path):
             os.remove(self.user_output_path)
 
     def set_file_paths(self):
-        user_output_path = os.getcwd() + '/output_file'
-        ref_output_path = os.getcwd() + '/executable'
+        user_output_path = os.path.join(self.working_dir, 'output_file')
+        ref_output_path = os.path.join(self.working_dir, 'executable')
         return user_output_path, ref_output_path
 
     def get_commands(self, user_output_path, ref_output_path):
@@ -49,9 +50,14 @@ class CppStdIOEvaluator(StdIOEvaluator):
         return compile_command, compile_main
 
     def compile_code(self):
+        if self.compiled:
+            return None
         self.submit_code_path = self.create_submit_code_file('submit.c')
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(
+                    self.file_paths, self.working_dir
+                )
         if not isfile(self.submit_code_path):
             msg = "No file at %s or Incorrect path" % self.submit_code_path
             return False, msg
@@ -75,6 +81,13 @@ class CppStdIOEvaluator(StdIOEvaluator):
                                                     )
         return self.compiled_user_answer, self.compiled_test_code
 
+    def get_run_command(self):
+        proc, stdnt_out, stdnt_stderr = self.compiled_user_answer
+        stdnt_stderr = self._remove_null_substitute_char(stdnt_stderr)
+        if stdnt_stderr == '':
+            return shlex.quote(self.ref_output_path)
+        return None
+
     def check_code(self):
         success = False
         mark_fraction = 0.0
@@ -84,17 +97,7 @@ class CppStdIOEvaluator(StdIOEvaluator):
         if stdnt_stderr == '':
             proc, main_out, main_err = self.compiled_test_code
             main_err = self._remove_null_substitute_char(main_err)
-            proc = subprocess.Popen("./executable",
-                                    shell=True,
-                                    stdin=subprocess.PIPE,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                    preexec_fn=os.setpgrp
-                                    )
-            success, err = self.evaluate_stdio(self.user_answer, proc,
-                                               self.expected_input,
-                                               self.expected_output
-                                               )
+            success, err = self.run_stdio("./executable")
         else:
             err = "Compilation Error:"
             try:
@@ -0,0 +1,120 @@
+from __future__ import unicode_literals
+import unittest
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import psutil
+
+# Local Imports
+from yaksh.base_evaluator import BaseEvaluator
+from yaksh.grader import TimeoutException
+
+
+class AsyncRunCommandTestCases(unittest.TestCase):
+    def setUp(self):
+        self.evaluator = BaseEvaluator()
+        self.in_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.in_dir)
+
+    def test_run_commands_returns_results_in_order(self):
+        # Given
+        commands = [
+            (["bash", "-c", "sleep 0.2; echo first"],
+             dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE)),
+            (["bash", "-c", "echo second >&2; exit 3"],
+             dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE)),
+            ("cat", dict(input="third", stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)),
+        ]
+
+        # When
+        results = self.evaluator._run_commands(commands)
+
+        # Then
+        self.assertEqual([r[1] for r in results], ["first\n", "", "third"])
+        self.assertEqual(results[1][2], "second\n")
+        self.assertEqual(results[1][0].returncode, 3)
+
+    def test_run_commands_concurrently(self):
+        # Given
+        commands = [(["sleep", "0.5"], {}) for i in range(4)]
+
+        # When
+        start = time.time()
+        self.evaluator._run_commands(commands)
+        elapsed = time.time() - start
+
+        # Then
+        self.assertLess(elapsed, 1.5)
+
+    def test_run_command_async_timeout_kills_process_group(self):
+        # Given
+        pid_file = os.path.join(self.in_dir, "pid")
+        cmd = "sleep 30 & echo $! > {0}; wait".format(pid_file)
+        commands = [(cmd, dict(shell=True, timeout=0.5))]
+
+        # When
+        with self.assertRaises(TimeoutException):
+            self.evaluator._run_commands(commands)
+
+        # Then
+        with open(pid_file) as f:
+            child_pid = int(f.read())
+        time.sleep(0.1)
+        try:
+            status = psutil.Process(child_pid).status()
+        except psutil.NoSuchProcess:
+            status = psutil.STATUS_DEAD
+        self.assertIn(status, [psutil.STATUS_DEAD, psutil.STATUS_ZOMBIE])
+
+
+    def test_failing_command_cancels_the_others(self):
+        # Given
+        pid_file = os.path.join(self.in_dir, "pid")
+        commands = [
+            ("sleep 30", dict(shell=True, timeout=0.5)),
+            ("sleep 40 & echo $! > {0}; wait".format(pid_file),
+             dict(shell=True, timeout=60)),
+        ]
+
+        # When
+        start = time.time()
+        with self.assertRaises(TimeoutException):
+            self.evaluator._run_commands(commands)
+
+        # Then
+        self.assertLess(time.time() - start, 5)
+        with open(pid_file) as f:
+            child_pid = int(f.read())
+        time.sleep(0.1)
+        try:
+            status = psutil.Process(child_pid).status()
+        except psutil.NoSuchProcess:
+            status = psutil.STATUS_DEAD
+        self.assertIn(status, [psutil.STATUS_DEAD, psutil.STATUS_ZOMBIE])
+
+    def test_run_commands_on_a_thread(self):
+        # Given
+        commands = [(["echo", str(i)], dict(stdout=subprocess.PIPE))
+                    for i in range(3)]
+        results = []
+
+        # When
+        thread = threading.Thread(
+            target=lambda: results.extend(
+                self.evaluator._run_commands(commands)
+            )
+        )
+        thread.start()
+        thread.join()
+
+        # Then
+        self.assertEqual([r[1] for r in results], ["0\n", "1\n", "2\n"])
+
+if __name__ == '__main__':
+    unittest.main()
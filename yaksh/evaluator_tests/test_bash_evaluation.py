@@ -3,11 +3,17 @@ import unittest
 import os
 import shutil
 import tempfile
+from unittest import mock
 from psutil import Process
 # Local Imports
 from yaksh.grader import Grader
+from yaksh.base_evaluator import BaseEvaluator
+from yaksh.bash_code_evaluator import (
+    BashCodeEvaluator, get_reference_fingerprint,
+    get_cached_reference_output, clear_reference_outputs
+)
 from yaksh.evaluator_tests.test_python_evaluation import EvaluatorBaseTest
-from yaksh.settings import SERVER_TIMEOUT
+from yaksh.settings import SERVER_TIMEOUT, STDIO_MAX_CONCURRENCY
 from textwrap import dedent
 
 
@@ -192,6 +198,96 @@ class BashAssertionEvaluationTestCases(EvaluatorBaseTest):
         # Then
         self.assertTrue(result.get("success"))
 
+    def test_reference_output_is_cached(self):
+        # Given
+        clear_reference_outputs()
+        user_answer = ("#!/bin/bash\n[[ $# -eq 2 ]]"
+                       " && echo $(( $1 + $2 )) && exit $(( $1 + $2 ))")
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'language': 'bash'
+                  }, 'test_case_data': self.test_case_data,
+                  }
+        fingerprints = [
+            get_reference_fingerprint(
+                self.tc_data.replace("\r", ""), args, self.file_paths
+            )
+            for args in ("1 2", "2 1")
+        ]
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertEqual(get_cached_reference_output(fingerprints[0]),
+                         ("3\n", ""))
+        self.assertEqual(get_cached_reference_output(fingerprints[1]),
+                         ("3\n", ""))
+
+        # When
+        with mock.patch.object(BashCodeEvaluator, '_run_command',
+                               autospec=True,
+                               side_effect=BaseEvaluator._run_command) as run:
+            grader = Grader(self.in_dir)
+            result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        # Only the submission is run for each line of arguments, the
+        # reference script outputs come from the cache.
+        self.assertEqual(run.call_count, 2)
+        for call in run.call_args_list:
+            self.assertNotIn("main.sh", call[0][1][1])
+
+    def test_reference_output_ignores_student_files(self):
+        # Given
+        clear_reference_outputs()
+        files_dir = tempfile.mkdtemp()
+        data_path = os.path.join(files_dir, "data.txt")
+        with open(data_path, "w") as f:
+            f.write("2\n")
+        file_paths = [(data_path, False)]
+        test_case = dedent("""
+            #!/bin/bash
+            cat data.txt extra.txt 2>/dev/null
+            echo $(( $1 + $2 ))
+            """)
+        user_answer = dedent("""
+            cat data.txt
+            echo poison > extra.txt
+            echo $(( $1 + $2 ))
+            """)
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': file_paths,
+                  'partial_grading': False,
+                  'language': 'bash'
+                  }, 'test_case_data': [
+                      {"test_case": test_case,
+                       "test_case_args": "1 2\n2 2",
+                       "test_case_type": "standardtestcase",
+                       "weight": 0.0, "hidden": False}
+                  ],
+                  }
+        fingerprint = get_reference_fingerprint(
+            test_case.replace("\r", ""), "2 2", file_paths
+        )
+
+        # When
+        result = Grader(self.in_dir).evaluate(kwargs)
+        result_again = Grader(self.in_dir).evaluate(kwargs)
+        reference_output = get_cached_reference_output(fingerprint)
+        shutil.rmtree(files_dir)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertTrue(result_again.get('success'))
+        self.assertEqual(reference_output, ("2\n4\n", ""))
+
 
 class BashStdIOEvaluationTestCases(EvaluatorBaseTest):
     def setUp(self):
@@ -324,6 +420,111 @@ class BashStdIOEvaluationTestCases(EvaluatorBaseTest):
         # Then
         self.assertTrue(result.get('success'))
 
+    def test_working_dir_with_shell_characters(self):
+        # Given
+        in_dir = tempfile.mkdtemp(prefix="with space;$(exit 1)")
+        user_answer = dedent(""" #!/bin/bash
+                             read A
+                             echo -n $A
+                             """
+                             )
+        test_case_data = [{'expected_output': str(i),
+                           'expected_input': str(i),
+                           'test_case_type': 'stdiobasedtestcase',
+                           'weight': 1.0
+                           } for i in range(2)]
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'language': 'bash'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        result = Grader(in_dir).evaluate(kwargs)
+        shutil.rmtree(in_dir)
+
+        # Then
+        self.assertTrue(result.get('success'))
+
+    def test_runs_are_isolated(self):
+        # Given
+        files_dir = tempfile.mkdtemp()
+        data_path = os.path.join(files_dir, "data.txt")
+        with open(data_path, "w") as f:
+            f.write("2\n")
+        self.file_paths = [(data_path, False)]
+        user_answer = dedent(""" #!/bin/bash
+                             read A
+                             echo $A > out.txt
+                             sleep 0.3
+                             cat data.txt out.txt
+                             echo 0 >> data.txt
+                             """
+                             )
+        test_case_data = [{'expected_output': '2\n{0}'.format(i),
+                           'expected_input': str(i),
+                           'test_case_type': 'stdiobasedtestcase',
+                           'weight': 1.0
+                           } for i in range(3)]
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': True,
+                    'language': 'bash'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+        shutil.rmtree(files_dir)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertEqual(result.get('weight'), 3.0)
+        self.assertEqual(len(result['timing']['test_cases']), 3)
+        for run_time in result['timing']['test_cases']:
+            self.assertGreaterEqual(run_time, 0.3)
+
+    def test_fail_fast_skips_remaining_inputs(self):
+        # Given
+        runs_dir = tempfile.mkdtemp()
+        user_answer = dedent(""" #!/bin/bash
+                             read A
+                             touch {0}/$A
+                             echo $A
+                             """.format(runs_dir)
+                             )
+        test_case_data = [{'expected_output': str(i) if i else 'wrong',
+                           'expected_input': str(i),
+                           'test_case_type': 'stdiobasedtestcase',
+                           'weight': 1.0
+                           } for i in range(2 * STDIO_MAX_CONCURRENCY)]
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'fail_fast': True,
+                    'language': 'bash'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+        runs = os.listdir(runs_dir)
+        shutil.rmtree(runs_dir)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(len(result.get('error')), 1)
+        self.assertEqual(len(runs), STDIO_MAX_CONCURRENCY)
+
 
 class BashHookEvaluationTestCases(EvaluatorBaseTest):
 
@@ -3,6 +3,7 @@ import unittest
 import os
 import shutil
 import tempfile
+import threading
 from textwrap import dedent
 from psutil import Process
 
@@ -154,6 +155,48 @@ class CAssertionEvaluationTestCases(EvaluatorBaseTest):
             children_procs = Process(parent_proc[0].pid)
             self.assertFalse(any(children_procs.children(recursive=True)))
 
+    def test_evaluate_on_threads(self):
+        # Given
+        answers = ["int add(int a, int b)\n{return a+b;}",
+                   "int add(int a, int b)\n{return a-b;}",
+                   "int add(int a, int b)\n{while(1>0){}}"]
+        in_dirs = [tempfile.mkdtemp(dir=self.in_dir) for answer in answers]
+        results = [None] * len(answers)
+        cwd = os.getcwd()
+
+        def evaluate(idx):
+            kwargs = {
+                      'metadata': {
+                        'user_answer': answers[idx],
+                        'file_paths': self.file_paths,
+                        'partial_grading': False,
+                        'language': 'cpp'
+                        }, 'test_case_data': self.test_case_data,
+                      }
+            results[idx] = Grader(in_dirs[idx]).evaluate(kwargs)
+
+        # When
+        threads = [threading.Thread(target=evaluate, args=(idx,))
+                   for idx in range(len(answers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Then
+        self.assertEqual(os.getcwd(), cwd)
+        correct, incorrect, infinite_loop = results
+        self.assertTrue(correct.get('success'))
+        self.assertFalse(incorrect.get('success'))
+        self.assertEqual(incorrect.get('error')[0]['exception'],
+                         'AssertionError')
+        self.assertFalse(infinite_loop.get('success'))
+        self.assert_correct_output(self.timeout_msg,
+                                   infinite_loop.get("error")[0]["message"]
+                                   )
+        for in_dir in in_dirs[:2]:
+            self.assertEqual(os.listdir(in_dir), [])
+
     def test_file_based_assert(self):
         # Given
         self.file_paths = [(self.f_path, False)]
@@ -707,6 +750,74 @@ class CppStdIOEvaluationTestCases(EvaluatorBaseTest):
         # Then
         self.assertTrue(result.get('success'))
 
+    def test_multiple_inputs_with_partial_grading(self):
+        # Given
+        test_case_data = [{'expected_output': str(a + b),
+                           'expected_input': '{0}\n{1}'.format(a, b),
+                           'weight': 1.0,
+                           'test_case_type': 'stdiobasedtestcase',
+                           'hidden': False
+                           } for a, b in [(1, 2), (3, 4), (5, 6), (7, -8)]]
+        user_answer = dedent("""
+        #include<stdio.h>
+        int main(void){
+        int a,b;
+        scanf("%d%d",&a,&b);
+        printf("%d",b < 0 ? 0 : a+b);
+        }""")
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': True,
+                    'language': 'cpp'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(result.get('weight'), 3.0)
+        self.assertEqual(len(result.get('error')), 1)
+        self.assertEqual(result.get('error')[0]['given_input'], '7\n-8')
+
+    def test_multiple_inputs_run_concurrently(self):
+        # Given
+        test_case_data = [{'expected_output': str(i),
+                           'expected_input': str(i),
+                           'weight': 0.0,
+                           'test_case_type': 'stdiobasedtestcase',
+                           'hidden': False
+                           } for i in range(4)]
+        user_answer = dedent("""
+        #include<stdio.h>
+        #include<unistd.h>
+        int main(void){
+        int a;
+        scanf("%d",&a);
+        sleep(1);
+        printf("%d",a);
+        }""")
+        kwargs = {
+                  'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'language': 'c'
+                    }, 'test_case_data': test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        self.assertLess(result['timing']['prepare'], 3.0)
+
 
 class CppHookEvaluationTestCases(EvaluatorBaseTest):
 
@@ -7,6 +7,7 @@ from textwrap import dedent
 
 # Local import
 from yaksh.grader import Grader
+from yaksh.hook_evaluator import load_hook, clear_hook_cache
 from yaksh.settings import SERVER_TIMEOUT
 
 
@@ -88,6 +89,91 @@ class PythonAssertionEvaluationTestCases(EvaluatorBaseTest):
         error_testcase_list = [tc['test_case'] for tc in result.get('error')]
         self.assertEqual(error_testcase_list, given_test_case_list)
 
+    def test_fail_fast_stops_at_first_failure(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a - b"
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'fail_fast': True,
+                  'language': 'python'},
+                  'test_case_data': self.test_case_data,
+                  }
+        progress = []
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs, progress_callback=progress.append)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(len(progress), 1)
+        self.assertEqual(len(result.get('error')), 1)
+        error = result.get('error')[0]
+        self.assertEqual(error['exception'], 'AssertionError')
+        self.assertEqual(error['test_case'],
+                         self.test_case_data[0]['test_case'])
+
+    def test_result_has_timing(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn a + b"
+        self.file_paths = [(self.tmp_file, False)]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': False,
+                  'language': 'python'},
+                  'test_case_data': self.test_case_data,
+                  }
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs)
+
+        # Then
+        self.assertTrue(result.get('success'))
+        timing = result.get('timing')
+        self.assertEqual(len(timing['test_cases']), 3)
+        for phase in ['setup', 'file_copy', 'compile', 'teardown']:
+            self.assertGreaterEqual(timing[phase], 0.0)
+        self.assertGreater(timing['file_copy'], 0.0)
+        self.assertGreaterEqual(timing['total'], sum(timing['test_cases']))
+
+    def test_progress_is_reported_per_test_case(self):
+        # Given
+        user_answer = "def add(a,b):\n\treturn abs(a) + abs(b)"
+        test_case_data = [{"test_case_type": "standardtestcase",
+                           "test_case": 'assert(add(1,2)==3)',
+                           'weight': 2.0, 'hidden': False},
+                          {"test_case_type": "standardtestcase",
+                           "test_case":  'assert(add(-1,-2)==-3)',
+                           'weight': 1.0, 'hidden': False}
+                          ]
+        kwargs = {'metadata': {
+                  'user_answer': user_answer,
+                  'file_paths': self.file_paths,
+                  'partial_grading': True,
+                  'language': 'python'},
+                  'test_case_data': test_case_data,
+                  }
+        progress = []
+
+        # When
+        grader = Grader(self.in_dir)
+        result = grader.evaluate(kwargs, progress_callback=progress.append)
+
+        # Then
+        self.assertFalse(result.get('success'))
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(progress[0]['completed'], 1)
+        self.assertEqual(progress[0]['total'], 2)
+        self.assertEqual(progress[0]['weight'], 2.0)
+        self.assertEqual(progress[0]['error'], [])
+        self.assertEqual(progress[1]['completed'], 2)
+        self.assertEqual(progress[1]['weight'], 2.0)
+        self.assertEqual(progress[1]['error'], result.get('error'))
+
     def test_partial_incorrect_answer(self):
         # Given
         user_answer = "def add(a,b):\n\treturn abs(a) + abs(b)"
@@ -965,6 +1051,53 @@ class PythonHookEvaluationTestCases(EvaluatorBaseTest):
         # Then
         self.assertTrue(result.get('success'))
 
+    def test_loaded_hook_does_not_share_state(self):
+        # Given
+        clear_hook_cache()
+        hook_code = dedent("""\
+                            SEEN = []
+                            def check_answer(user_answer):
+                                success = False
+                                err = "Incorrect Answer"
+                                mark_fraction = 0.0
+                                SEEN.append(user_answer)
+                                exec(user_answer, globals())
+                                if add(1,2) == 3 and len(SEEN) == 1:
+                                    success, err, mark_fraction = True, "", 1.0
+                                return success, err, mark_fraction
+                            """
+                           )
+        test_case_data = [{"test_case_type": "hooktestcase",
+                           "hook_code": hook_code, "weight": 1.0
+                           }]
+
+        def get_kwargs(user_answer):
+            return {'metadata': {
+                    'user_answer': user_answer,
+                    'file_paths': self.file_paths,
+                    'partial_grading': False,
+                    'language': 'python'},
+                    'test_case_data': test_case_data,
+                    }
+
+        # When
+        correct = Grader(self.in_dir).evaluate(
+            get_kwargs("def add(a,b):\n\treturn a + b")
+        )
+        no_function = Grader(self.in_dir).evaluate(get_kwargs("x = 1"))
+        correct_again = Grader(self.in_dir).evaluate(
+            get_kwargs("def add(a,b):\n\treturn a + b")
+        )
+        first_scope = load_hook(hook_code)
+        second_scope = load_hook(hook_code)
+
+        # Then
+        self.assertTrue(correct.get('success'))
+        self.assertFalse(no_function.get('success'))
+        self.assertTrue(correct_again.get('success'))
+        self.assertIsNot(first_scope['SEEN'], second_scope['SEEN'])
+        self.assertIs(first_scope['check_answer'].__globals__, first_scope)
+        self.assertNotIn('add', second_scope)
 
 if __name__ == '__main__':
     unittest.main()
@@ -5,18 +5,21 @@ import tempfile
 import csv
 
 
-def copy_files(file_paths):
-    """ Copy Files to current directory, takes
+def copy_files(file_paths, target_dir=None):
+    """ Copy Files to target directory, current directory by default, takes
     tuple with file paths and extract status"""
 
+    target_dir = target_dir or os.getcwd()
     files = []
     for src in file_paths:
         file_path, extract = src
         file_name = os.path.basename(file_path)
         files.append(file_name)
-        shutil.copy(file_path, os.getcwd())
+        shutil.copy(file_path, target_dir)
         if extract:
-            z_files, path = extract_files(file_name, os.getcwd())
+            z_files, path = extract_files(
+                os.path.join(target_dir, file_name), target_dir
+            )
             for file in z_files:
                 files.append(file)
     return files
@@ -3,8 +3,11 @@ from __future__ import unicode_literals
 import sys
 import os
 import contextlib
+from collections import OrderedDict
 from os.path import dirname, abspath
 import signal
+import threading
+import time
 import traceback
 
 
@@ -67,6 +70,14 @@ def delete_signal_handler():
     return
 
 
+def in_main_thread():
+    """Signals can only be handled on the main thread, the grader then also
+    changes directory. On other threads evaluators rely on their deadline
+    and working directory instead.
+    """
+    return threading.current_thread() is threading.main_thread()
+
+
 class Grader(object):
     """Tests the code obtained from Code Server"""
     def __init__(self, in_dir=None):
@@ -75,7 +86,7 @@ class Grader(object):
         self.timeout_msg = msg
         self.in_dir = in_dir if in_dir else MY_DIR
 
-    def evaluate(self, kwargs):
+    def evaluate(self, kwargs, progress_callback=None):
         """Evaluates given code with the test cases based on
         given arguments in test_case_data.
 
@@ -89,20 +100,47 @@ class Grader(object):
 
         If the optional `in_dir` keyword argument is supplied it changes the
         directory to that directory (it does not change it back to the original
-        when done).
+        when done). When not run on the main thread, the directory is not
+        changed and no signal is used, only thread safe evaluators should then
+        be used, see `language_registry.is_thread_safe`.
+
+        If `progress_callback` is given, it is called with a dict containing
+        the partial result after each test case is evaluated, see
+        `safe_evaluate`.
+
+        If the metadata has `fail_fast` set, evaluation stops at the first
+        failing test case.
 
         Returns
         -------
 
-        A tuple: (success, error, weight).
+        A dict with the keys success, error, weight and timing. timing holds
+        the seconds spent in setup, prepare, file_copy, compile, teardown,
+        the run time of each evaluated test case (test_cases) and the total.
+        Compiling and running done ahead of the test cases, e.g. by the
+        stdio evaluators, is part of prepare and is also counted in compile
+        and test_cases, where concurrent runs overlap.
         """
+        start = time.time()
         self.setup()
         test_case_instances = self.get_evaluator_objects(kwargs)
-        with change_dir(self.in_dir):
-            success, error, weight = self.safe_evaluate(test_case_instances)
+        fail_fast = kwargs.get('metadata', {}).get('fail_fast', False)
+        setup_time = time.time() - start
+        if in_main_thread():
+            with change_dir(self.in_dir):
+                success, error, weight = self.safe_evaluate(
+                    test_case_instances, progress_callback, fail_fast
+                )
+        else:
+            success, error, weight = self.safe_evaluate(
+                test_case_instances, progress_callback, fail_fast
+            )
         self.teardown()
+        self.timing['setup'] = setup_time
+        self.timing['total'] = time.time() - start
 
-        result = {'success': success, 'error': error, 'weight': weight}
+        result = {'success': success, 'error': error, 'weight': weight,
+                  'timing': self.timing}
         return result
 
     # Private Protocol ##########
@@ -118,30 +156,80 @@ class Grader(object):
 
         for test_case in test_case_data:
             test_case_instance = create_evaluator_instance(metadata, test_case)
+            test_case_instance.in_dir = self.in_dir
             test_case_instances.append(test_case_instance)
         return test_case_instances
 
-    def safe_evaluate(self, test_case_instances):
+    def prepare_evaluators(self, test_case_instances, fail_fast=False):
+        """Let each evaluator class prepare its test case instances together,
+        e.g. compile a submission once for all of its stdio test cases.
+        """
+        instances_by_class = OrderedDict()
+        for test_case_instance in test_case_instances:
+            instances_by_class.setdefault(
+                type(test_case_instance), []
+            ).append(test_case_instance)
+        for cls, instances in instances_by_class.items():
+            cls.prepare(instances, fail_fast)
+
+    def safe_evaluate(self, test_case_instances, progress_callback=None,
+                      fail_fast=False):
         """
         Handles code evaluation along with compilation, signal handling
         and Exception handling
+
+        After each test case `progress_callback`, if given, is called with
+        a dict with the keys `completed`, `total`, `weight` and `error`
+        holding the results gathered so far.
+
+        If `fail_fast` is True the remaining test cases are skipped once a
+        test case fails, the result is then already decided.
+
+        The time spent in each phase is recorded in `self.timing`.
         """
+        self.timing = {'file_copy': 0.0, 'compile': 0.0, 'teardown': 0.0,
+                       'test_cases': []}
+        deadline = time.time() + SERVER_TIMEOUT
+        for test_case_instance in test_case_instances:
+            test_case_instance.deadline = deadline
         # Add a new signal handler for the execution of this code.
-        prev_handler = create_signal_handler()
+        use_signals = in_main_thread()
+        if use_signals:
+            prev_handler = create_signal_handler()
         success = False
         test_case_success_status = [False]
         if len(test_case_instances) != 0:
             test_case_success_status = [False] * len(test_case_instances)
         error = []
         weight = 0.0
+        evaluated_instances = []
 
         # Do whatever testing needed.
         try:
+            start = time.time()
+            self.prepare_evaluators(test_case_instances, fail_fast)
+            self.timing['prepare'] = time.time() - start
+
             # Run evaluator selection registry here
             for idx, test_case_instance in enumerate(test_case_instances):
                 test_case_success = False
+                evaluated_instances.append(test_case_instance)
+                tc_timing = test_case_instance.timing
+                prepared = tc_timing.get('file_copy', 0.0)
+                start = time.time()
                 test_case_instance.compile_code()
+                compiled = time.time()
+                copied = tc_timing.get('file_copy', 0.0)
                 eval_result = test_case_instance.check_code()
+                # Work done ahead in prepare is recorded by the instances.
+                self.timing['compile'] += \
+                    compiled - start - (copied - prepared) + \
+                    tc_timing.get('compile', 0.0)
+                self.timing['test_cases'].append(
+                    time.time() - compiled -
+                    (tc_timing.get('file_copy', 0.0) - copied) +
+                    tc_timing.get('run', 0.0)
+                )
                 test_case_success, err, mark_fraction = eval_result
                 if not isinstance(err, dict):
                     err = prettify_exceptions('Error', err)
@@ -151,11 +239,20 @@ class Grader(object):
                 else:
                     error.append(err)
                 test_case_success_status[idx] = test_case_success
+                if progress_callback is not None:
+                    progress_callback(dict(
+                        completed=idx + 1, total=len(test_case_instances),
+                        weight=weight, error=list(error)
+                    ))
+                if fail_fast and not test_case_success:
+                    break
 
             success = all(test_case_success_status)
 
-            for test_case_instance in test_case_instances:
+            start = time.time()
+            for test_case_instance in evaluated_instances:
                 test_case_instance.teardown()
+            self.timing['teardown'] = time.time() - start
 
         except TimeoutException:
             error.append(
@@ -182,10 +279,16 @@ class Grader(object):
                 )
         finally:
             # Set back any original signal handler.
-            set_original_signal_handler(prev_handler)
+            if use_signals:
+                set_original_signal_handler(prev_handler)
+            self.timing['file_copy'] = sum(
+                instance.timing.get('file_copy', 0.0)
+                for instance in evaluated_instances
+            )
 
         return success, error, weight
 
     def teardown(self):
         # Cancel the signal
-        delete_signal_handler()
+        if in_main_thread():
+            delete_signal_handler()
@@ -1,4 +1,6 @@
 #!/usr/bin/env python
+from collections import OrderedDict
+import hashlib
 import sys
 import traceback
 import os
@@ -9,6 +11,39 @@ from .file_utils import copy_files, delete_files
 from .base_evaluator import BaseEvaluator
 from .grader import TimeoutException
 from .error_messages import prettify_exceptions
+from .settings import MAX_CACHED_HOOKS
+
+
+# Compiled hook code keyed by a hash of the hook source. The hook code is
+# written by the instructor and is the same for every submission, so it is
+# compiled only once.
+_hook_code_objects = OrderedDict()
+
+
+def load_hook(hook_code):
+    """Return a new namespace with the hook code executed in it.
+
+    Only the compiled code is cached. It is executed in a fresh namespace on
+    every call so that no state, e.g. names the user code adds to the
+    globals or data the hook mutates, is seen by the next submission. The
+    modules the hook imports are cached in sys.modules already.
+    """
+    key = hashlib.sha1(hook_code.encode('utf-8')).hexdigest()
+    code = _hook_code_objects.get(key)
+    if code is None:
+        code = compile(hook_code, '<string>', mode='exec')
+        _hook_code_objects[key] = code
+        while len(_hook_code_objects) > MAX_CACHED_HOOKS:
+            _hook_code_objects.popitem(last=False)
+    else:
+        _hook_code_objects.move_to_end(key)
+    hook_scope = {}
+    exec(code, hook_scope)
+    return hook_scope
+
+
+def clear_hook_cache():
+    _hook_code_objects.clear()
 
 
 class HookEvaluator(BaseEvaluator):
@@ -56,15 +91,15 @@ class HookEvaluator(BaseEvaluator):
         or if the required permissions are not given to the file(s).
         """
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(self.file_paths)
         if self.assignment_files:
-            self.assign_files = copy_files(self.assignment_files)
+            with self.record_time('file_copy'):
+                self.assign_files = copy_files(self.assignment_files)
         success = False
         mark_fraction = 0.0
         try:
-            _tests = compile(self.hook_code, '<string>', mode='exec')
-            hook_scope = {}
-            exec(_tests, hook_scope)
+            hook_scope = load_hook(self.hook_code)
             check = hook_scope["check_answer"]
             try:
                 success, err, mark_fraction = check(self.user_answer)
@@ -13,6 +13,8 @@ from .error_messages import prettify_exceptions
 
 class JavaCodeEvaluator(BaseEvaluator):
     """Tests the Java code obtained from Code Server"""
+    thread_safe = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
         self.compiled_user_answer = None
@@ -41,7 +43,7 @@ class JavaCodeEvaluator(BaseEvaluator):
         if os.path.exists(self.test_code_path):
             os.remove(self.test_code_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
 
     def get_commands(self, clean_ref_code_path, user_code_directory):
         compile_command = 'javac  {0}'.format(self.submit_code_path),
@@ -68,7 +70,10 @@ class JavaCodeEvaluator(BaseEvaluator):
             self.write_to_submit_code_file(self.test_code_path, self.test_case)
             clean_ref_code_path = self.test_code_path
             if self.file_paths:
-                self.files = copy_files(self.file_paths)
+                with self.record_time('file_copy'):
+                    self.files = copy_files(
+                        self.file_paths, self.working_dir
+                    )
             if not isfile(clean_ref_code_path):
                 msg = "No file at %s or Incorrect path" % clean_ref_code_path
                 return False, msg
@@ -76,7 +81,7 @@ class JavaCodeEvaluator(BaseEvaluator):
                 msg = "No file at %s or Incorrect path" % self.submit_code_path
                 return False, msg
 
-            user_code_directory = os.getcwd() + '/'
+            user_code_directory = os.path.join(self.working_dir, '')
             ref_file_name = (clean_ref_code_path.split('/')[-1]).split('.')[0]
             self.user_output_path = self.set_file_paths(
                 user_code_directory, 'Test'
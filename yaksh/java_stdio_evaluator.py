@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 from __future__ import unicode_literals
+import shlex
 import subprocess
 import os
 from os.path import isfile
@@ -29,8 +30,10 @@ class JavaStdIOEvaluator(StdIOEvaluator):
     def teardown(self):
         if os.path.exists(self.submit_code_path):
             os.remove(self.submit_code_path)
+        if os.path.exists(self.user_output_path):
+            os.remove(self.user_output_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
 
     def set_file_paths(self, directory, file_name):
         output_path = "{0}{1}.class".format(directory, file_name)
@@ -41,13 +44,18 @@ class JavaStdIOEvaluator(StdIOEvaluator):
         return compile_command
 
     def compile_code(self):
+        if self.compiled:
+            return None
         self.submit_code_path = self.create_submit_code_file('Test.java')
         if not isfile(self.submit_code_path):
             msg = "No file at %s or Incorrect path" % self.submit_code_path
             return False, msg
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
-        user_code_directory = os.getcwd() + '/'
+            with self.record_time('file_copy'):
+                self.files = copy_files(
+                    self.file_paths, self.working_dir
+                )
+        user_code_directory = os.path.join(self.working_dir, '')
         self.write_to_submit_code_file(self.submit_code_path, self.user_answer)
         self.user_output_path = self.set_file_paths(user_code_directory,
                                                     'Test'
@@ -60,24 +68,20 @@ class JavaStdIOEvaluator(StdIOEvaluator):
                                                       )
         return self.compiled_user_answer
 
+    def get_run_command(self):
+        proc, stdnt_out, stdnt_stderr = self.compiled_user_answer
+        stdnt_stderr = self._remove_null_substitute_char(stdnt_stderr)
+        if stdnt_stderr == '' or "error" not in stdnt_stderr:
+            return "java -cp {0} Test".format(shlex.quote(self.working_dir))
+        return None
+
     def check_code(self):
         success = False
         mark_fraction = 0.0
         proc, stdnt_out, stdnt_stderr = self.compiled_user_answer
         stdnt_stderr = self._remove_null_substitute_char(stdnt_stderr)
         if stdnt_stderr == '' or "error" not in stdnt_stderr:
-            proc = subprocess.Popen("java Test",
-                                    shell=True,
-                                    stdin=subprocess.PIPE,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                    preexec_fn=os.setpgrp
-                                    )
-            success, err = self.evaluate_stdio(self.user_answer, proc,
-                                               self.expected_input,
-                                               self.expected_output
-                                               )
-            os.remove(self.user_output_path)
+            success, err = self.run_stdio("java Test")
         else:
             err = "Compilation Error:"
             try:
@@ -23,6 +23,18 @@ def create_evaluator_instance(metadata, test_case):
     return instance
 
 
+def is_thread_safe(metadata, test_case_data):
+    """Return True if all the evaluators needed for the test cases can be run
+    on a thread, i.e. they do all of their work in subprocesses.
+    """
+    registry = get_registry()
+    return all(
+        registry.get_class(metadata.get('language'),
+                           test_case.get('test_case_type')).thread_safe
+        for test_case in test_case_data
+    )
+
+
 class _LanguageRegistry(object):
     def __init__(self):
         self._register = {}
@@ -0,0 +1,441 @@
+'''
+   This command creates a synthetic institution: courses with modules,
+   lessons and quizzes with questions of every type, enrolled students and
+   their answer papers, answers and course statuses. It is meant to
+   reproduce production data volumes locally, e.g. for profiling.
+'''
+
+# python imports
+import json
+import random
+from datetime import timedelta
+
+# django imports
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+# local imports
+from yaksh.models import (
+    Answer, AnswerPaper, ArrangeTestCase, Course, CourseStatus,
+    FloatTestCase, HookTestCase, IntegerTestCase, LearningModule,
+    LearningUnit, Lesson, McqTestCase, Profile, Question, QuestionPaper, Quiz,
+    StandardTestCase, StdIOBasedTestCase, StringTestCase, TestCaseOrder,
+    create_group
+)
+
+
+# The kinds of questions created in turn, as the type of the question and
+# the type of its test cases.
+QUESTION_TYPES = [
+    ('mcq', 'mcqtestcase'), ('mcc', 'mcqtestcase'),
+    ('code', 'standardtestcase'), ('integer', 'integertestcase'),
+    ('string', 'stringtestcase'), ('float', 'floattestcase'),
+    ('arrange', 'arrangetestcase'), ('upload', None),
+    ('code', 'stdiobasedtestcase'), ('code', 'hooktestcase')
+]
+
+CORRECT_CODE = 'def add(a, b):\n    return a + b'
+WRONG_CODE = 'def add(a, b):\n    return a - b'
+CORRECT_STDIO_CODE = 'a, b = map(int, input().split())\nprint(a + b)'
+WRONG_STDIO_CODE = 'a, b = map(int, input().split())\nprint(a - b)'
+HOOK_CODE = (
+    'def check_answer(user_answer):\n'
+    '    exec(user_answer, globals())\n'
+    '    if add({0}, 1) == {1}:\n'
+    '        return True, "", 1.0\n'
+    '    return False, "Incorrect answer", 0.0\n'
+)
+
+
+def bulk_create(model, objects, batch_size):
+    """Insert ``objects`` and return them with their primary keys set, also
+    on the databases which do not return them from bulk inserts."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects, batch_size=batch_size)
+    last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    pks = model.objects.filter(pk__gt=last).order_by('pk').values_list(
+        'pk', flat=True
+    )
+    for obj, pk in zip(objects, pks):
+        obj.pk = pk
+    return objects
+
+
+def create_test_cases(question, test_case_type, index):
+    """Create the test cases of ``question`` and return them, the correct
+    ones first."""
+    if test_case_type == 'mcqtestcase':
+        correct = 1 if question.type == 'mcq' else 2
+        return [
+            McqTestCase.objects.create(
+                question=question, type='mcqtestcase',
+                options='Option {0}'.format(option), correct=option < correct
+            )
+            for option in range(4)
+        ]
+    if test_case_type == 'arrangetestcase':
+        return [
+            ArrangeTestCase.objects.create(
+                question=question, type='arrangetestcase',
+                options='Step {0}'.format(step)
+            )
+            for step in range(4)
+        ]
+    if test_case_type == 'standardtestcase':
+        return [
+            StandardTestCase.objects.create(
+                question=question, type='standardtestcase',
+                test_case='assert add({0}, {1}) == {2}'.format(
+                    index, case, index + case
+                )
+            )
+            for case in range(3)
+        ]
+    if test_case_type == 'stdiobasedtestcase':
+        return [
+            StdIOBasedTestCase.objects.create(
+                question=question, type='stdiobasedtestcase',
+                expected_input='{0} {1}'.format(index, case),
+                expected_output=str(index + case)
+            )
+            for case in range(3)
+        ]
+    if test_case_type == 'hooktestcase':
+        return [HookTestCase.objects.create(
+            question=question, type='hooktestcase',
+            hook_code=HOOK_CODE.format(index, index + 1)
+        )]
+    if test_case_type == 'integertestcase':
+        return [IntegerTestCase.objects.create(
+            question=question, type='integertestcase', correct=index
+        )]
+    if test_case_type == 'stringtestcase':
+        return [StringTestCase.objects.create(
+            question=question, type='stringtestcase',
+            correct='Answer {0}'.format(index), string_check='lower'
+        )]
+    if test_case_type == 'floattestcase':
+        return [FloatTestCase.objects.create(
+            question=question, type='floattestcase', correct=index + 0.5,
+            error_margin=0.1
+        )]
+    return []
+
+
+def answer_text(question, test_cases, correct):
+    """Return the text of a correct or a wrong answer to ``question``."""
+    if question.type == 'mcq':
+        option = test_cases[0] if correct else test_cases[-1]
+        return str(option.id)
+    if question.type == 'mcc':
+        options = test_cases[:2] if correct else test_cases[1:3]
+        return str([str(option.id) for option in options])
+    if question.type == 'arrange':
+        ids = [test_case.id for test_case in test_cases]
+        return str(ids if correct else ids[::-1])
+    if question.type == 'code':
+        if test_cases[0].type == 'stdiobasedtestcase':
+            return CORRECT_STDIO_CODE if correct else WRONG_STDIO_CODE
+        return CORRECT_CODE if correct else WRONG_CODE
+    if question.type == 'upload':
+        return 'ASSIGNMENT UPLOADED'
+    value = test_cases[0].correct
+    if question.type == 'string':
+        return value if correct else 'Wrong answer'
+    return str(value if correct else value + 1)
+
+
+class Command(BaseCommand):
+    help = 'Creates a synthetic institution with courses, students and ' \
+           'answer papers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefix', default='synthetic',
+            help='Prefix of the names of the users and courses created.'
+        )
+        parser.add_argument('--courses', type=int, default=2)
+        parser.add_argument(
+            '--modules', type=int, default=2, help='Modules per course.'
+        )
+        parser.add_argument(
+            '--lessons', type=int, default=2, help='Lessons per module.'
+        )
+        parser.add_argument(
+            '--quizzes', type=int, default=1, help='Quizzes per module.'
+        )
+        parser.add_argument(
+            '--questions', type=int, default=16,
+            help='Questions per quiz, of all the types in turn.'
+        )
+        parser.add_argument(
+            '--students', type=int, default=100,
+            help='Students, each enrolled in every course.'
+        )
+        parser.add_argument(
+            '--attempts', type=int, default=1,
+            help='Attempts of each student at each quiz.'
+        )
+        parser.add_argument(
+            '--inprogress', type=float, default=0.1,
+            help='Fraction of the last attempts which are in progress.'
+        )
+        parser.add_argument(
+            '--correct', type=float, default=0.7,
+            help='Probability of an answer to be correct.'
+        )
+        parser.add_argument('--seed', type=int, help='Random seed.')
+        parser.add_argument(
+            '--batch-size', type=int,
+            help='Rows per insert, the most the database allows by default.'
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(
+                username__startswith=options['prefix'] + '_').exists():
+            raise CommandError(
+                'Users with the prefix "{0}" already exist, choose another '
+                'prefix'.format(options['prefix'])
+            )
+        self.random = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.counts = {'papers': 0, 'answers': 0}
+        with transaction.atomic():
+            moderator = self.create_moderator()
+            students = self.create_students()
+            for index in range(options['courses']):
+                self.create_course(index, moderator, students)
+        self.stdout.write(self.style.SUCCESS(
+            'Created {0} courses, {1} students, {2} answer papers and {3} '
+            'answers'.format(options['courses'], len(students),
+                             self.counts['papers'], self.counts['answers'])
+        ))
+
+    def create_moderator(self):
+        prefix = self.options['prefix']
+        moderator = User.objects.create_user(
+            username='{0}_moderator'.format(prefix), password=prefix,
+            email='{0}_moderator@example.com'.format(prefix),
+            first_name='Synthetic', last_name='Moderator'
+        )
+        Profile.objects.create(
+            user=moderator, roll_number='0', institute=prefix,
+            department='Synthetic', position='Faculty', is_moderator=True,
+            is_email_verified=True
+        )
+        create_group('moderator', 'yaksh').user_set.add(moderator)
+        return moderator
+
+    def create_students(self):
+        prefix = self.options['prefix']
+        password = make_password(prefix)
+        students = bulk_create(User, [
+            User(username='{0}_student_{1}'.format(prefix, index),
+                 email='{0}_student_{1}@example.com'.format(prefix, index),
+                 first_name='Student', last_name=str(index),
+                 password=password)
+            for index in range(self.options['students'])
+        ], self.batch_size)
+        bulk_create(Profile, [
+            Profile(user=student, roll_number=str(index), institute=prefix,
+                    department='Synthetic', position='Student',
+                    is_email_verified=True)
+            for index, student in enumerate(students)
+        ], self.batch_size)
+        return students
+
+    def create_course(self, index, moderator, students):
+        prefix = self.options['prefix']
+        course = Course.objects.create(
+            name='{0} course {1}'.format(prefix, index),
+            enrollment='Open Enrollment', creator=moderator
+        )
+        course.students.add(*students)
+        units = []
+        for module_index in range(self.options['modules']):
+            module = LearningModule.objects.create(
+                name='{0} module {1}.{2}'.format(prefix, index, module_index),
+                description='Synthetic module', order=module_index,
+                creator=moderator, check_prerequisite=False
+            )
+            module_units = []
+            for lesson_index in range(self.options['lessons']):
+                lesson = Lesson.objects.create(
+                    name='{0} lesson {1}.{2}.{3}'.format(
+                        prefix, index, module_index, lesson_index
+                    ),
+                    description='Synthetic lesson', creator=moderator
+                )
+                module_units.append(LearningUnit.objects.create(
+                    order=len(module_units), type='lesson', lesson=lesson,
+                    check_prerequisite=False
+                ))
+            for quiz_index in range(self.options['quizzes']):
+                quiz = Quiz.objects.create(
+                    description='{0} quiz {1}.{2}.{3}'.format(
+                        prefix, index, module_index, quiz_index
+                    ),
+                    start_date_time=timezone.now() - timedelta(days=30),
+                    duration=60, attempts_allowed=-1, creator=moderator
+                )
+                module_units.append(LearningUnit.objects.create(
+                    order=len(module_units), type='quiz', quiz=quiz,
+                    check_prerequisite=False
+                ))
+                self.create_answerpapers(course, quiz, moderator, students)
+            module.learning_unit.add(*module_units)
+            course.learning_module.add(module)
+            units.extend(module_units)
+        self.create_course_statuses(course, units, students)
+
+    def create_questions(self, quiz, moderator):
+        questions, test_cases = [], {}
+        for index in range(self.options['questions']):
+            question_type, test_case_type = \
+                QUESTION_TYPES[index % len(QUESTION_TYPES)]
+            question = Question.objects.create(
+                summary='{0} question {1}'.format(quiz.description, index),
+                description='Synthetic {0} question'.format(question_type),
+                points=1.0, type=question_type, language='python',
+                snippet='def add(a, b):' if test_case_type in [
+                    'standardtestcase', 'hooktestcase'
+                ] else '',
+                user=moderator
+            )
+            questions.append(question)
+            test_cases[question.id] = create_test_cases(
+                question, test_case_type, index
+            )
+        return questions, test_cases
+
+    def create_answerpapers(self, course, quiz, moderator, students):
+        questions, test_cases = self.create_questions(quiz, moderator)
+        question_paper = QuestionPaper.objects.create(
+            quiz=quiz, total_marks=float(len(questions)),
+            fixed_question_order=','.join(str(q.id) for q in questions)
+        )
+        question_paper.fixed_questions.add(*questions)
+        questions_order = ','.join(str(q.id) for q in questions)
+        attempts = self.options['attempts']
+        now = timezone.now()
+        papers, paper_answers = [], []
+        for student in students:
+            inprogress = self.random.random() < self.options['inprogress']
+            for attempt in range(1, attempts + 1):
+                status = 'inprogress' if inprogress and \
+                    attempt == attempts else 'completed'
+                start_time = now - timedelta(days=attempts - attempt + 1)
+                if status == 'inprogress':
+                    start_time = now - timedelta(minutes=10)
+                    answered = questions[:len(questions) // 2]
+                else:
+                    answered = questions
+                answers = [
+                    self.make_answer(question, test_cases[question.id])
+                    for question in answered
+                ]
+                marks = sum(answer.marks for answer in answers)
+                percent = round(marks / len(questions) * 100, 2) \
+                    if questions else 0.0
+                papers.append(AnswerPaper(
+                    user=student, question_paper=question_paper,
+                    course=course, attempt_number=attempt,
+                    start_time=start_time,
+                    end_time=start_time + timedelta(minutes=quiz.duration),
+                    user_ip='127.0.0.1', status=status,
+                    marks_obtained=marks, percent=percent,
+                    passed=percent >= quiz.pass_criteria,
+                    questions_order=questions_order
+                ))
+                paper_answers.append(answers)
+        papers = bulk_create(AnswerPaper, papers, self.batch_size)
+        answers = bulk_create(Answer, [
+            answer for answers in paper_answers for answer in answers
+        ], self.batch_size)
+        self.counts['papers'] += len(papers)
+        self.counts['answers'] += len(answers)
+
+        answered_ids = [
+            {answer.question_id for answer in answers}
+            for answers in paper_answers
+        ]
+        self.bulk_create_through(AnswerPaper.questions.through, [
+            (paper.id, question.id)
+            for paper in papers for question in questions
+        ], 'question_id')
+        self.bulk_create_through(AnswerPaper.answers.through, [
+            (paper.id, answer.id)
+            for paper, answers in zip(papers, paper_answers)
+            for answer in answers
+        ], 'answer_id')
+        self.bulk_create_through(AnswerPaper.questions_answered.through, [
+            (paper.id, question.id)
+            for paper, answered in zip(papers, answered_ids)
+            for question in questions if question.id in answered
+        ], 'question_id')
+        self.bulk_create_through(AnswerPaper.questions_unanswered.through, [
+            (paper.id, question.id)
+            for paper, answered in zip(papers, answered_ids)
+            for question in questions if question.id not in answered
+        ], 'question_id')
+        shuffled = [
+            question for question in questions
+            if question.type == 'arrange' or (
+                question_paper.shuffle_testcases and
+                question.type in ['mcq', 'mcc']
+            )
+        ]
+        TestCaseOrder.objects.bulk_create([
+            TestCaseOrder(
+                answer_paper_id=paper.id, question=question,
+                order=self.shuffled_ids(test_cases[question.id])
+            )
+            for paper in papers for question in shuffled
+        ], batch_size=self.batch_size)
+
+    def shuffled_ids(self, test_cases):
+        ids = [str(test_case.id) for test_case in test_cases]
+        self.random.shuffle(ids)
+        return ','.join(ids)
+
+    def make_answer(self, question, test_cases):
+        correct = self.random.random() < self.options['correct']
+        if question.type == 'upload':
+            correct = False
+        return Answer(
+            question=question,
+            answer=answer_text(question, test_cases, correct),
+            error=json.dumps([]), correct=correct,
+            marks=question.points if correct else 0.0
+        )
+
+    def bulk_create_through(self, model, pairs, field):
+        model.objects.bulk_create([
+            model(**{'answerpaper_id': paper_id, field: pk})
+            for paper_id, pk in pairs
+        ], batch_size=self.batch_size)
+
+    def create_course_statuses(self, course, units, students):
+        progress = [self.random.randint(0, len(units)) for _ in students]
+        statuses = bulk_create(CourseStatus, [
+            CourseStatus(
+                course=course, user=student,
+                current_unit=units[min(done, len(units) - 1)]
+                if units else None,
+                percent_completed=int(done / len(units) * 100)
+                if units else 0
+            )
+            for student, done in zip(students, progress)
+        ], self.batch_size)
+        through = CourseStatus.completed_units.through
+        through.objects.bulk_create([
+            through(coursestatus_id=status.id, learningunit_id=unit.id)
+            for status, done in zip(statuses, progress)
+            for unit in units[:done]
+        ], batch_size=self.batch_size)
@@ -0,0 +1,135 @@
+'''
+   This command grades the answers to the code questions of a question paper,
+   or the jobs of a JSON lines file, on a local pool of processes instead of
+   the code server.
+'''
+
+# python imports
+import json
+
+# django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+# local imports
+from yaksh.batch_grader import grade_jobs
+from yaksh.models import Answer, AnswerPaper, CourseStatus, QuestionPaper
+
+
+class Command(BaseCommand):
+    help = 'Grades answers or jobs on a local pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--questionpaper', type=int,
+            help='Id of the question paper whose answers are regraded.'
+        )
+        parser.add_argument(
+            '--question', type=int, action='append', dest='questions',
+            help='Id of a question to regrade, all the code questions of '
+                 'the question paper by default.'
+        )
+        parser.add_argument(
+            '--jobs', help='JSON lines file of jobs, as made by '
+                           'Question.consolidate_answer_data, to grade.'
+        )
+        parser.add_argument(
+            '--output', help='File to write the results of the jobs to, '
+                             'one JSON line per job.'
+        )
+        parser.add_argument(
+            '--processes', type=int,
+            help='Number of processes, one per CPU by default.'
+        )
+        parser.add_argument(
+            '--as-nobody', action='store_true',
+            help='Run the jobs as the nobody user, like the code server. '
+                 'This needs root privileges.'
+        )
+
+    def handle(self, *args, **options):
+        if options['questionpaper'] is not None:
+            self.grade_questionpaper(options)
+        elif options['jobs'] and options['output']:
+            self.grade_file(options)
+        else:
+            raise CommandError(
+                'Give either --questionpaper or --jobs and --output'
+            )
+
+    def grade_file(self, options):
+        with open(options['jobs']) as f:
+            jobs = [(line_no, line) for line_no, line in enumerate(f, 1)
+                    if line.strip()]
+        n_success = 0
+        with open(options['output'], 'w') as f:
+            for line_no, result in grade_jobs(
+                    jobs, processes=options['processes'],
+                    as_nobody=options['as_nobody']):
+                n_success += bool(result.get('success'))
+                f.write(json.dumps(dict(line=line_no, result=result)) + '\n')
+        self.stdout.write(self.style.SUCCESS(
+            'Graded {0} jobs, {1} successful'.format(len(jobs), n_success)
+        ))
+
+    def grade_questionpaper(self, options):
+        try:
+            question_paper = QuestionPaper.objects.get(
+                id=options['questionpaper']
+            )
+        except QuestionPaper.DoesNotExist:
+            raise CommandError('Question paper "{0}" does not exist'.format(
+                options['questionpaper']
+            ))
+        papers = AnswerPaper.objects.filter(
+            question_paper=question_paper
+        ).select_related('user', 'course')
+        answers = Answer.objects.filter(
+            answerpaper__question_paper=question_paper, question__type='code'
+        ).select_related('question')
+        if options['questions']:
+            answers = answers.filter(question_id__in=options['questions'])
+        # Only the last answer of each paper to a question is graded, as
+        # when regrading.
+        last_answers = {}
+        for answer in answers.values('id', 'answerpaper', 'question'):
+            key = (answer['answerpaper'], answer['question'])
+            last_answers[key] = max(last_answers.get(key, 0), answer['id'])
+        answers = answers.in_bulk(list(last_answers.values()))
+
+        bundles, jobs = {}, []
+        for answer in answers.values():
+            question = answer.question
+            json_data = question.consolidate_answer_data(
+                answer.answer, by_reference=True
+            )
+            bundle_hash = json.loads(json_data)['metadata']['bundle_hash']
+            if bundle_hash not in bundles:
+                bundles[bundle_hash] = question.get_grading_bundle()[1]
+            jobs.append((answer.id, json_data))
+
+        # The processes are forked, they must not share the connections.
+        connections.close_all()
+        for answer_id, result in grade_jobs(
+                jobs, bundles, processes=options['processes'],
+                as_nobody=options['as_nobody']):
+            answers[answer_id].set_result(result)
+        Answer.objects.bulk_update(
+            list(answers.values()),
+            ['correct', 'error', 'marks', 'timing', 'grading_time'],
+            batch_size=500
+        )
+
+        paper_ids = set(paper_id for paper_id, _ in last_answers)
+        for paper in papers.filter(id__in=paper_ids):
+            paper.update_marks('completed')
+            course_status = CourseStatus.objects.filter(
+                user=paper.user, course=paper.course
+            )
+            if course_status.exists():
+                course_status.first().set_grade()
+        self.stdout.write(self.style.SUCCESS(
+            'Regraded {0} answers of {1} answer papers'.format(
+                len(answers), len(paper_ids)
+            )
+        ))
@@ -0,0 +1,133 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import ExitStack
+
+from django.db import connections
+
+from yaksh.settings import (
+    QUERY_BUDGET_SAMPLE_RATE, QUERY_BUDGETS, QUERY_BUDGET_WINDOW
+)
+
+logger = logging.getLogger(__name__)
+
+# The latest samples of each view of this process, by view name.
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+class _QueryRecorder(object):
+    """Database execute wrapper counting and timing the queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.time() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+def get_budget(view_name):
+    """Returns the maximum number of `queries` and seconds of `db_time`
+    allowed for a view, see QUERY_BUDGETS.
+    """
+    budget = dict(QUERY_BUDGETS.get('default', {}))
+    budget.update(QUERY_BUDGETS.get(view_name, {}))
+    return budget
+
+
+def get_summary():
+    """Returns the summary of the sampled requests of each view, the views
+    issuing the most queries first.
+    """
+    with _samples_lock:
+        samples = dict((view, list(view_samples))
+                       for view, view_samples in _samples.items())
+    summary = []
+    for view, view_samples in samples.items():
+        counts = [sample['queries'] for sample in view_samples]
+        db_times = [sample['db_time'] for sample in view_samples]
+        duplicates = Counter()
+        for sample in view_samples:
+            duplicates.update(sample['duplicates'])
+        summary.append(OrderedDict([
+            ('view', view),
+            ('requests', len(view_samples)),
+            ('mean_queries', sum(counts) / len(counts)),
+            ('max_queries', max(counts)),
+            ('mean_db_time', sum(db_times) / len(db_times)),
+            ('max_db_time', max(db_times)),
+            ('over_budget', sum(sample['over_budget']
+                                for sample in view_samples)),
+            ('budget', get_budget(view)),
+            ('duplicates', duplicates.most_common(5)),
+        ]))
+    summary.sort(key=lambda entry: entry['mean_queries'], reverse=True)
+    return summary
+
+
+def clear_summary():
+    with _samples_lock:
+        _samples.clear()
+
+
+class QueryBudgetMiddleware(object):
+    """ Middleware recording the number of queries, the time spent in the
+        database and the queries run more than once by a sample of the
+        requests, see QUERY_BUDGET_SAMPLE_RATE.
+        The requests exceeding the budget of their view, see QUERY_BUDGETS,
+        are logged and the latest samples of each view are summarized, see
+        `get_summary`.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if QUERY_BUDGET_SAMPLE_RATE <= 0 or \
+                random.random() >= QUERY_BUDGET_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = _QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else request.path
+        self.record(view, recorder)
+        return response
+
+    def record(self, view, recorder):
+        duplicates = dict((sql, count) for sql, count
+                          in recorder.statements.items() if count > 1)
+        budget = get_budget(view)
+        over_budget = (
+            recorder.count > budget.get('queries', float('inf')) or
+            recorder.time > budget.get('db_time', float('inf'))
+        )
+        if over_budget:
+            logger.warning(
+                '%s ran %d queries in %.3fs, over its budget %s. Most '
+                'repeated: %s', view, recorder.count, recorder.time, budget,
+                Counter(duplicates).most_common(3)
+            )
+        with _samples_lock:
+            view_samples = _samples.get(view)
+            if view_samples is None:
+                view_samples = _samples[view] = deque(
+                    maxlen=QUERY_BUDGET_WINDOW
+                )
+            view_samples.append(dict(
+                queries=recorder.count, db_time=recorder.time,
+                duplicates=duplicates, over_budget=over_budget
+            ))
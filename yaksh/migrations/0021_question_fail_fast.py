@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0020_release_0_21_0'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='fail_fast',
+            field=models.BooleanField(
+                default=True,
+                help_text='Stop checking at the first failing test case. '
+                          'Ignored if partial grading is enabled.'
+            ),
+        ),
+    ]
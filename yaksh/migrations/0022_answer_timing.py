@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0021_question_fail_fast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='timing',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='grading_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
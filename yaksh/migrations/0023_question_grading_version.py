@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('yaksh', '0022_answer_timing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='grading_version',
+            field=models.CharField(blank=True, default='', editable=False,
+                                   max_length=32),
+        ),
+    ]
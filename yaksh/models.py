@@ -1,5 +1,6 @@
 from __future__ import unicode_literals, division
 from datetime import datetime, timedelta
+import hashlib
 import uuid
 import json
 import random
@@ -9,10 +10,15 @@ from ruamel.yaml.comments import CommentedMap
 from random import sample
 from collections import Counter, defaultdict
 
-from django.db import models
+from django.db import connection, models
+from django.db.models import Avg, Count, Exists, Max, OuterRef, Q
 from django.contrib.auth.models import User, Group, Permission
-from django.core.exceptions import ValidationError
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models.constants import LOOKUP_SEP
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from taggit.managers import TaggableManager
 from django.utils import timezone
 from django.core.files import File
@@ -36,7 +42,9 @@ from django.template import Context, Template
 from yaksh.code_server import (
     submit, get_result as get_result_from_code_server
 )
-from yaksh.settings import SERVER_POOL_PORT, SERVER_HOST_NAME
+from yaksh.settings import (
+    SERVER_POOL_PORT, SERVER_HOST_NAME, GRADING_CACHE_TIMEOUT
+)
 from django.conf import settings
 from django.forms.models import model_to_dict
 from grades.models import GradingSystem
@@ -64,6 +72,9 @@ question_types = (
 
     )
 
+# Question types graded against an answer key instead of by the code server.
+OBJECTIVE_TYPES = ('mcq', 'mcc', 'integer', 'string', 'float', 'arrange')
+
 enrollment_methods = (
     ("default", "Enroll Request"),
     ("open", "Open Enrollment"),
@@ -248,6 +259,85 @@ def get_image_dir(instance, filename):
     ))
 
 
+def prefetch_test_cases(questions):
+    """Load the test cases of all the questions in one query.
+
+    The test cases are memoised on each question, where get_test_cases,
+    get_test_case and get_ordered_test_cases find them. Questions whose test
+    cases are already loaded are skipped.
+    """
+    questions = {question.id: question for question in questions
+                 if not hasattr(question, '_test_cases')}
+    if not questions:
+        return
+    types = [test_case_type for test_case_type, _ in test_case_types]
+    test_cases = TestCase.objects.filter(
+        question_id__in=list(questions), type__in=types
+    ).select_related(*types).order_by('id')
+    grouped = {question_id: {} for question_id in questions}
+    for test_case in test_cases:
+        concrete = getattr(test_case, test_case.type, None)
+        if concrete is None:
+            continue
+        concrete.question = questions[test_case.question_id]
+        grouped[test_case.question_id].setdefault(
+            test_case.type, []
+        ).append(concrete)
+    for question_id, by_type in grouped.items():
+        questions[question_id]._test_cases = [
+            test_case for same_type in by_type.values()
+            for test_case in same_type
+        ]
+
+
+def _has_values(test_case, values):
+    """Return whether the fields of the test case have the given values.
+    Related objects are compared by primary key and test cases without one
+    of the fields never match.
+    """
+    for name, value in values.items():
+        try:
+            if name == 'pk':
+                field = test_case._meta.pk
+            else:
+                field = test_case._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        if not field.concrete:
+            raise TypeError(
+                'Cannot match test cases on the reverse relation {0}, '
+                'use a lookup instead.'.format(name)
+            )
+        if field.is_relation:
+            if isinstance(value, models.Model):
+                value = value.pk
+            value = field.target_field.to_python(value)
+        else:
+            value = field.to_python(value)
+        if getattr(test_case, field.attname) != value:
+            return False
+    return True
+
+
+def _update_by_values(model, objects, fields):
+    """Save the given fields of the objects with one UPDATE per distinct
+    combination of their values.
+
+    When few combinations occur, as when regrading, this is much faster than
+    bulk_update which sends a CASE with a branch per object.
+    """
+    groups = defaultdict(list)
+    for obj in objects:
+        values = tuple(getattr(obj, field) for field in fields)
+        groups[values].append(obj.pk)
+    for values, pks in groups.items():
+        batch_size = connection.ops.bulk_batch_size(['pk'], pks)
+        for start in range(0, len(pks), batch_size):
+            model.objects.filter(
+                pk__in=pks[start:start + batch_size]
+            ).update(**dict(zip(fields, values)))
+
+
 ###############################################################################
 class CourseManager(models.Manager):
 
@@ -362,6 +452,27 @@ class QuizManager(models.Manager):
     def get_active_quizzes(self):
         return self.filter(active=True, is_trial=False)
 
+    def get_code_quizzes_starting(self, lead_time):
+        """Returns the active quizzes with code or upload questions which
+        start within `lead_time` (a timedelta) or are being taken, i.e.
+        started less than their duration ago. Each one is annotated with the
+        number of students of its courses as `n_students`.
+        """
+        now = timezone.now()
+        quizzes = self.get_active_quizzes().filter(
+            Q(questionpaper__fixed_questions__type__in=['code', 'upload']) |
+            Q(questionpaper__random_questions__questions__type__in=[
+                'code', 'upload'
+            ]),
+            start_date_time__lte=now + lead_time, end_date_time__gt=now
+        ).distinct().annotate(n_students=Count(
+            'learningunit__learning_unit__learning_module__students',
+            distinct=True
+        ))
+        return [quiz for quiz in quizzes
+                if quiz.start_date_time + timedelta(minutes=quiz.duration)
+                > now]
+
     def create_trial_quiz(self, user):
         """Creates a trial quiz for testing questions"""
         trial_quiz = self.create(
@@ -515,6 +626,14 @@ class Quiz(models.Model):
         )
         return demo_quiz
 
+    def get_code_questions(self):
+        """Returns the code and upload questions of the quiz."""
+        return Question.objects.filter(
+            Q(questionpaper__quiz=self) |
+            Q(questionset__questionpaper__quiz=self),
+            type__in=['code', 'upload']
+        ).distinct()
+
     def get_total_students(self, course):
         try:
             qp = self.questionpaper_set.get().id
@@ -1164,6 +1283,50 @@ class Course(models.Model):
         return self.name
 
 
+###############################################################################
+class CourseStatusManager(models.Manager):
+
+    def update_grades(self, course, user_ids):
+        ''' Recompute the percentage and the grade of the users of the course
+            who were given a grade, as set_grade does one user at a time.
+            These users completed the course so the completion of the course
+            is not checked again.'''
+        statuses = list(self.filter(
+            course=course, user_id__in=user_ids, grade__isnull=False
+        ))
+        quizzes = course.get_quizzes()
+        if not statuses or not quizzes:
+            return
+        best_marks = AnswerPaper.objects.get_best_of_attempts_marks(
+            quizzes, course.id
+        )
+        total_weightage = sum(quiz.weightage for quiz in quizzes)
+        out_of = {
+            quiz.id: quiz.questionpaper_set.first().total_marks
+            for quiz in quizzes
+        }
+        if course.grading_system is None:
+            grading_system = GradingSystem.objects.get(
+                name__contains='default'
+            )
+        else:
+            grading_system = course.grading_system
+        grades = {}
+        for status in statuses:
+            total = sum(
+                best_marks.get((quiz.id, status.user_id), 0.0) /
+                out_of[quiz.id] * quiz.weightage
+                for quiz in quizzes
+            )
+            status.percentage = (total/total_weightage)*100
+            if status.percentage not in grades:
+                grades[status.percentage] = grading_system.get_grade(
+                    status.percentage
+                )
+            status.grade = grades[status.percentage]
+        _update_by_values(self.model, statuses, ['percentage', 'grade'])
+
+
 ###############################################################################
 class CourseStatus(models.Model):
     completed_units = models.ManyToManyField(LearningUnit,
@@ -1177,6 +1340,8 @@ class CourseStatus(models.Model):
     percentage = models.FloatField(default=0.0)
     percent_completed = models.IntegerField(default=0)
 
+    objects = CourseStatusManager()
+
     def get_grade(self):
         return self.grade
 
@@ -1321,6 +1486,19 @@ class Question(models.Model):
     # Does this question allow partial grading
     partial_grading = models.BooleanField(default=False)
 
+    # Stop grading at the first failing test case, only used when the
+    # question does not allow partial grading
+    fail_fast = models.BooleanField(
+        default=True,
+        help_text="Stop checking at the first failing test case. "
+                  "Ignored if partial grading is enabled."
+    )
+
+    # Changes whenever the question, its test cases or its files are saved,
+    # see change_grading_version. Cached grading data is keyed by it.
+    grading_version = models.CharField(max_length=32, default='',
+                                       blank=True, editable=False)
+
     # Check assignment upload based question
     grade_assignment_upload = models.BooleanField(default=False)
 
@@ -1365,25 +1543,148 @@ class Question(models.Model):
         ]
     }
 
-    def consolidate_answer_data(self, user_answer, user=None):
-        question_data = {}
+    def _get_grading_data(self):
+        test_case_data = [test.get_field_value()
+                          for test in self.get_test_cases()]
         metadata = {}
-        test_case_data = []
-
-        test_cases = self.get_test_cases()
-
-        for test in test_cases:
-            test_case_as_dict = test.get_field_value()
-            test_case_data.append(test_case_as_dict)
-
-        question_data['test_case_data'] = test_case_data
-        metadata['user_answer'] = user_answer
         metadata['language'] = self.language
         metadata['partial_grading'] = self.partial_grading
+        metadata['fail_fast'] = self.fail_fast and not self.partial_grading
         files = FileUpload.objects.filter(question=self)
         if files:
             metadata['file_paths'] = [(file.file.path, file.extract)
                                       for file in files]
+        return {'test_case_data': test_case_data, 'metadata': metadata}
+
+    def _get_versioned(self, name, build):
+        """Returns the value built by ``build`` for the current grading
+        version of the question.
+
+        The value is built once per version, kept in the Django cache so
+        that all workers share it, and memoised on the instance.
+        """
+        attribute = '_' + name
+        value = self.__dict__.get(attribute)
+        if value is not None:
+            return value
+        key = 'yaksh:{0}:{1}:{2}'.format(name, self.id, self.grading_version)
+        value = cache.get(key) if self.id else None
+        if value is None:
+            value = build()
+            if self.id:
+                cache.set(key, value, GRADING_CACHE_TIMEOUT)
+        self.__dict__[attribute] = value
+        return value
+
+    def _build_grading_payload(self):
+        grading_data = self._get_grading_data()
+        bundle_json = json.dumps(grading_data, sort_keys=True)
+        return {
+            'hash': hashlib.sha1(bundle_json.encode('utf-8')).hexdigest(),
+            'json': bundle_json,
+            'max_weight': sum(
+                test_case.get('weight', 0.0)
+                for test_case in grading_data['test_case_data']
+            ),
+        }
+
+    def _get_grading_payload(self):
+        """Returns a dict with the hash and the JSON of the grading bundle
+        and the maximum test case weight of the question.
+        """
+        return self._get_versioned(
+            'grading_payload', self._build_grading_payload
+        )
+
+    def _build_answer_key(self):
+        test_cases = self.get_test_cases()
+        if self.type in ('mcq', 'mcc'):
+            return {'correct': frozenset(
+                str(test_case.id) for test_case in test_cases
+                if test_case.correct
+            )}
+        if self.type == 'integer':
+            return {'correct': frozenset(
+                int(test_case.correct) for test_case in test_cases
+            )}
+        if self.type == 'string':
+            return {
+                'exact': frozenset(
+                    tuple(test_case.correct.splitlines())
+                    for test_case in test_cases
+                    if test_case.string_check != 'lower'
+                ),
+                'lower': frozenset(
+                    tuple(test_case.correct.lower().splitlines())
+                    for test_case in test_cases
+                    if test_case.string_check == 'lower'
+                ),
+            }
+        if self.type == 'float':
+            return {'tolerances': [
+                (test_case.correct, test_case.error_margin)
+                for test_case in test_cases
+            ]}
+        if self.type == 'arrange':
+            return {'order': sorted(test_case.id for test_case in test_cases)}
+        return {}
+
+    def get_answer_key(self):
+        """Returns the answer key of an objective question, i.e. the data
+        `is_correct_answer` checks answers against.
+        """
+        return self._get_versioned('answer_key', self._build_answer_key)
+
+    def is_correct_answer(self, user_answer):
+        """Returns whether ``user_answer`` is a correct answer to this
+        objective question, without querying the database once the answer
+        key is cached.
+
+        Raises ValueError if an integer or float answer is not a number.
+        """
+        key = self.get_answer_key()
+        if self.type == 'mcq':
+            return user_answer.strip() in key['correct']
+        if self.type == 'mcc':
+            return set(user_answer) == key['correct']
+        if self.type == 'integer':
+            return int(user_answer) in key['correct']
+        if self.type == 'string':
+            return (tuple(user_answer.splitlines()) in key['exact'] or
+                    tuple(user_answer.lower().splitlines()) in key['lower'])
+        if self.type == 'float':
+            user_answer = float(user_answer)
+            return any(abs(correct - user_answer) <= error_margin
+                       for correct, error_margin in key['tolerances'])
+        if self.type == 'arrange':
+            return user_answer == key['order']
+        return False
+
+    def get_grading_bundle(self):
+        """Returns the hash and the JSON of the data needed to grade any
+        answer to this question, i.e. its test cases, files and grading
+        options. The hash changes whenever any of these change.
+        """
+        payload = self._get_grading_payload()
+        return payload['hash'], payload['json']
+
+    def consolidate_answer_data(self, user_answer, user=None,
+                                by_reference=False):
+        """Returns the JSON data of a job grading the answer.
+
+        If `by_reference` is True, the job refers to the grading bundle of
+        the question by its hash instead of holding the test cases, see
+        `get_grading_bundle`.
+        """
+        if by_reference:
+            bundle_hash, bundle_json = self.get_grading_bundle()
+            question_data = {'metadata': {'language': self.language,
+                                          'bundle_hash': bundle_hash}}
+        else:
+            question_data = json.loads(self._get_grading_payload()['json'])
+        metadata = question_data['metadata']
+        metadata['user_answer'] = user_answer
+        metadata['question_id'] = self.id
         if self.type == "upload":
             assignment_files = AssignmentUpload.objects.filter(
                 assignmentQuestion=self, user=user
@@ -1391,7 +1692,6 @@ class Question(models.Model):
             if assignment_files:
                 metadata['assign_files'] = [(file.assignmentFile.path, False)
                                             for file in assignment_files]
-        question_data['metadata'] = metadata
 
         return json.dumps(question_data)
 
@@ -1399,6 +1699,7 @@ class Question(models.Model):
         questions = Question.objects.filter(id__in=question_ids,
                                             user_id=user.id, active=True
                                             )
+        prefetch_test_cases(questions)
         questions_dict = []
         zip_file_name = string_io()
         zip_file = zipfile.ZipFile(zip_file_name, "a")
@@ -1450,6 +1751,19 @@ class Question(models.Model):
         return msg
 
     def get_test_cases(self, **kwargs):
+        """Returns the test cases of the question whose fields have the
+        values given as keyword arguments.
+
+        Plain field values are matched against the loaded test cases,
+        lookups such as ``id__in`` are left to the database.
+        """
+        if any(LOOKUP_SEP in name for name in kwargs):
+            return self._query_test_cases(**kwargs)
+        prefetch_test_cases([self])
+        return [test_case for test_case in self._test_cases
+                if _has_values(test_case, kwargs)]
+
+    def _query_test_cases(self, **kwargs):
         tc_list = []
         for tc in self.testcase_set.values_list("type", flat=True).distinct():
             test_case_ctype = ContentType.objects.get(app_label="yaksh",
@@ -1462,31 +1776,22 @@ class Question(models.Model):
         return tc_list
 
     def get_test_cases_as_dict(self, **kwargs):
-        tc_list = []
-        for tc in self.testcase_set.values_list("type", flat=True).distinct():
-            test_case_ctype = ContentType.objects.get(app_label="yaksh",
-                                                      model=tc)
-            test_case = test_case_ctype.get_all_objects_for_this_type(
-                question=self,
-                **kwargs
-            )
-            for tc in test_case:
-                tc_list.append(model_to_dict(tc))
-            return tc_list
+        return [model_to_dict(test_case)
+                for test_case in self.get_test_cases(**kwargs)]
 
     def get_test_case(self, **kwargs):
-        for tc in self.testcase_set.all():
-            test_case_type = tc.type
-            test_case_ctype = ContentType.objects.get(
-                app_label="yaksh",
-                model=test_case_type
+        test_cases = self.get_test_cases(**kwargs)
+        if not test_cases:
+            raise TestCase.DoesNotExist(
+                'No test case of question {0} matches {1}'.format(
+                    self.id, kwargs)
             )
-            test_case = test_case_ctype.get_object_for_this_type(
-                question=self,
-                **kwargs
+        if len(test_cases) > 1:
+            raise TestCase.MultipleObjectsReturned(
+                '{0} test cases of question {1} match {2}'.format(
+                    len(test_cases), self.id, kwargs)
             )
-
-        return test_case
+        return test_cases[0]
 
     def get_ordered_test_cases(self, answerpaper):
         try:
@@ -1500,11 +1805,7 @@ class Question(models.Model):
             return self.get_test_cases()
 
     def get_maximum_test_case_weight(self, **kwargs):
-        max_weight = 0.0
-        for test_case in self.get_test_cases():
-            max_weight += test_case.weight
-
-        return max_weight
+        return self._get_grading_payload()['max_weight']
 
     def _add_and_get_files(self, zip_file):
         files = FileUpload.objects.filter(question=self)
@@ -1657,12 +1958,41 @@ class Answer(models.Model):
     # Whether skipped or not.
     skipped = models.BooleanField(default=False)
 
+    # Time breakdown of the auto-checking as returned by the code server.
+    timing = models.TextField(null=True, blank=True)
+
+    # Total time in seconds taken to auto-check the answer.
+    grading_time = models.FloatField(null=True, blank=True)
+
     def set_marks(self, marks):
         if marks > self.question.points:
             self.marks = self.question.points
         else:
             self.marks = marks
 
+    def set_timing(self, timing):
+        """Store the grading time breakdown returned by the code server"""
+        if timing:
+            self.timing = json.dumps(timing)
+            self.grading_time = timing.get('total')
+
+    def set_result(self, result):
+        """Store the result of grading the answer, see `Grader.evaluate`,
+        and the marks it earns.
+        """
+        question = self.question
+        self.correct = result.get('success')
+        self.error = json.dumps(result.get('error'))
+        self.set_timing(result.get('timing'))
+        if question.partial_grading and question.type == 'code':
+            max_weight = question.get_maximum_test_case_weight()
+            factor = result['weight']/max_weight
+            self.marks = question.points * factor
+        elif result.get('success'):
+            self.marks = question.points
+        else:
+            self.marks = 0
+
     def __str__(self):
         return "Answer for question {0}".format(self.question.summary)
 
@@ -1800,7 +2130,9 @@ class QuestionPaper(models.Model):
             ans_paper.save()
             questions = self._get_questions_for_answerpaper()
             ans_paper.questions.add(*questions)
+            prefetch_test_cases(questions)
             question_ids = []
+            testcase_orders = {}
             for question in questions:
                 question_ids.append(str(question.id))
                 if (question.type == "arrange") or (
@@ -1810,12 +2142,10 @@ class QuestionPaper(models.Model):
                     random.shuffle(testcases)
                     testcases_ids = ",".join([str(tc.id) for tc in testcases]
                                              )
-                    if not TestCaseOrder.objects.filter(
-                         answer_paper=ans_paper, question=question
-                         ).exists():
-                        TestCaseOrder.objects.create(
-                            answer_paper=ans_paper, question=question,
-                            order=testcases_ids)
+                    testcase_orders.setdefault(question.id, TestCaseOrder(
+                        answer_paper=ans_paper, question=question,
+                        order=testcases_ids))
+            TestCaseOrder.objects.bulk_create(testcase_orders.values())
 
             ans_paper.questions_order = ",".join(question_ids)
             ans_paper.save()
@@ -1877,8 +2207,9 @@ class QuestionPaper(models.Model):
         ques = []
         if self.fixed_question_order:
             que_order = self.fixed_question_order.split(',')
+            questions = self.fixed_questions.in_bulk(que_order)
             for que_id in que_order:
-                ques.append(self.fixed_questions.get(id=que_id))
+                ques.append(questions[int(que_id)])
         else:
             ques = list(self.fixed_questions.all())
         return ques
@@ -1925,12 +2256,9 @@ class AnswerPaperManager(models.Manager):
         papers = self.filter(question_paper_id=questionpaper_id,
                              course_id=course_id,
                              attempt_number=attempt_number, status=status)
-        all_questions = list()
-        questions = list()
-        for paper in papers:
-            all_questions += paper.get_questions()
-        for question in all_questions:
-            questions.append(question.id)
+        questions = self.model.questions.through.objects.filter(
+            answerpaper__in=papers, question__active=True
+        ).values_list('question_id', flat=True)
         return Counter(questions)
 
     def get_all_questions_answered(self, questionpaper_id, attempt_number,
@@ -1939,12 +2267,16 @@ class AnswerPaperManager(models.Manager):
         papers = self.filter(question_paper_id=questionpaper_id,
                              course_id=course_id,
                              attempt_number=attempt_number, status=status)
-        questions_answered = list()
-        for paper in papers:
-            for question in filter(None, paper.get_questions_answered()):
-                if paper.is_answer_correct(question):
-                    questions_answered.append(question.id)
-        return Counter(questions_answered)
+        correct = set(self.model.answers.through.objects.filter(
+            answerpaper__in=papers, answer__correct=True
+        ).values_list('answerpaper_id', 'answer__question_id'))
+        answered = self.model.questions_answered.through.objects.filter(
+            answerpaper__in=papers
+        ).values_list('answerpaper_id', 'question_id')
+        return Counter(
+            question_id for paper_id, question_id in answered
+            if (paper_id, question_id) in correct
+        )
 
     def get_attempt_numbers(self, questionpaper_id, course_id,
                             status='completed'):
@@ -1998,6 +2330,25 @@ class AnswerPaperManager(models.Manager):
                 question_stats[question] = [0, questions[question.id]]
         return question_stats
 
+    def get_grading_time_statistics(self, questionpaper_id, attempt_number,
+                                    course_id, status='completed'):
+        ''' Return dict with question id as key and a dict with the number of
+            timed answers, the average and the maximum time in seconds the
+            code server took to grade them as value'''
+        answers = Answer.objects.filter(
+            answerpaper__question_paper_id=questionpaper_id,
+            answerpaper__attempt_number=attempt_number,
+            answerpaper__course_id=course_id,
+            answerpaper__status=status,
+            grading_time__isnull=False
+        ).values('question').annotate(
+            count=Count('id'), average=Avg('grading_time'),
+            maximum=Max('grading_time')
+        ).order_by()
+        return {
+            stats.pop('question'): stats for stats in answers
+        }
+
     def _get_answerpapers_for_quiz(self, questionpaper_id, course_id,
                                    status=False):
         if not status:
@@ -2070,6 +2421,116 @@ class AnswerPaperManager(models.Manager):
         data['questionpaperid'] = questionpaper_id
         return data
 
+    def get_best_of_attempts_marks(self, quizzes, course_id):
+        ''' Return a dict with (quiz id, user id) as key and the best marks
+            of the user in the quiz as value'''
+        papers = self.filter(
+            question_paper__quiz__in=quizzes, course_id=course_id
+        ).values('question_paper__quiz', 'user').annotate(
+            best=Max('marks_obtained')
+        ).order_by()
+        return {
+            (paper['question_paper__quiz'], paper['user']): paper['best']
+            for paper in papers
+        }
+
+    def get_per_question_scores(self, answerpapers):
+        ''' Return a dict with answerpaper id as key and a dict of question
+            id and the score of get_per_question_score as value'''
+        scores = defaultdict(dict)
+        questions = self.model.questions.through.objects.filter(
+            answerpaper__in=answerpapers, question__active=True
+        ).values_list('answerpaper_id', 'question_id')
+        for paper_id, question_id in questions:
+            scores[paper_id][question_id] = 0
+        answers = self.model.answers.through.objects.filter(
+            answerpaper__in=answerpapers
+        ).order_by('answer_id').values_list(
+            'answerpaper_id', 'answer__question_id', 'answer__marks'
+        )
+        for paper_id, question_id, marks in answers:
+            if question_id in scores[paper_id]:
+                scores[paper_id][question_id] = marks
+        return scores
+
+    def get_marks_obtained(self, answerpapers):
+        ''' Return a dict with answerpaper id as key and the total marks
+            earned in the paper, as summed by _update_marks_obtained, as
+            value'''
+        in_paper = self.model.questions.through.objects.filter(
+            answerpaper_id=OuterRef('answerpaper_id'),
+            question_id=OuterRef('answer__question_id')
+        )
+        best_marks = self.model.answers.through.objects.filter(
+            answerpaper__in=answerpapers
+        ).annotate(in_paper=Exists(in_paper)).filter(in_paper=True).values(
+            'answerpaper_id', 'answer__question_id'
+        ).annotate(best=Max('answer__marks')).order_by().values_list(
+            'answerpaper_id', 'best'
+        )
+        totals = defaultdict(float)
+        for paper_id, best in best_marks:
+            totals[paper_id] += best
+        return totals
+
+    def regrade_objective_question(self, question, answerpapers):
+        ''' Regrade the last answer to an objective question in each of the
+            answerpapers against the answer key of the question, as
+            AnswerPaper.regrade does one paper at a time, and update the
+            marks of the papers. Return the papers regraded.'''
+        papers = {
+            paper.id: paper
+            for paper in answerpapers.select_related('question_paper__quiz')
+        }
+        # Filtering on the paper ids in SQL makes SQLite probe every id for
+        # each answer, so the answers of their question papers are scanned
+        # and matched to the papers here.
+        last_answers = {}
+        answered = self.model.answers.through.objects.filter(
+            answerpaper__question_paper_id__in={
+                paper.question_paper_id for paper in papers.values()
+            },
+            answer__question=question
+        ).values_list('answerpaper_id', 'answer_id')
+        for paper_id, answer_id in answered:
+            if paper_id in papers and \
+                    answer_id > last_answers.get(paper_id, 0):
+                last_answers[paper_id] = answer_id
+        graded = []
+        regraded = []
+        answers = Answer.objects.in_bulk(list(last_answers.values()))
+        for paper_id, answer_id in last_answers.items():
+            answer = answers[answer_id]
+            user_answer = answer.answer
+            try:
+                if question.type in ['mcc', 'arrange']:
+                    user_answer = literal_eval(user_answer)
+                    if type(user_answer) is not list:
+                        continue
+                correct = question.is_correct_answer(user_answer)
+            except Exception:
+                continue
+            answer.question = question
+            answer.set_result({
+                'success': correct, 'weight': 0.0,
+                'error': ['Correct answer' if correct else 'Incorrect answer']
+            })
+            graded.append(answer)
+            regraded.append(papers[paper_id])
+        _update_by_values(Answer, graded, ['correct', 'error', 'marks'])
+
+        totals = self.get_marks_obtained(answerpapers)
+        for paper in regraded:
+            paper.marks_obtained = totals.get(paper.id, 0)
+            paper._update_percent()
+            paper._update_passed()
+            paper._update_status('completed')
+        _update_by_values(
+            self.model, regraded,
+            ['marks_obtained', 'percent', 'passed', 'status']
+        )
+        return regraded
+
     def get_user_best_of_attempts_marks(self, quiz, user_id, course_id):
         best_attempt = 0.0
         papers = self.filter(question_paper__quiz_id=quiz.id,
@@ -2217,8 +2678,8 @@ class AnswerPaper(models.Model):
         """Get all questions in a specific order for answerpaper"""
         if self.questions_order:
             que_ids = [int(q_id) for q_id in self.questions_order.split(',')]
-            questions = [self.questions.get(id=que_id)
-                         for que_id in que_ids]
+            all_questions = self.questions.in_bulk(que_ids)
+            questions = [all_questions[que_id] for que_id in que_ids]
         else:
             questions = list(self.questions.all())
         return questions
@@ -2247,13 +2708,12 @@ class AnswerPaper(models.Model):
 
     def _update_marks_obtained(self):
         """Updates the total marks earned by student for this paper."""
-        marks = 0
-        for question in self.questions.all():
-            marks_list = [a.marks
-                          for a in self.answers.filter(question=question)]
-            max_marks = max(marks_list) if marks_list else 0.0
-            marks += max_marks
-        self.marks_obtained = marks
+        max_marks = self.answers.filter(
+            question__in=self.questions.all()
+        ).values('question').annotate(
+            max_marks=Max('marks')
+        ).order_by().values_list('max_marks', flat=True)
+        self.marks_obtained = sum(max_marks)
 
     def _update_percent(self):
         """Updates the percent gained by the student for this paper."""
@@ -2357,67 +2817,21 @@ class AnswerPaper(models.Model):
         result = {'success': False, 'error': ['Incorrect answer'],
                   'weight': 0.0}
         if user_answer is not None:
-            if question.type == 'mcq':
-                expected_answer = question.get_test_case(correct=True).id
-                if user_answer.strip() == str(expected_answer).strip():
-                    result['success'] = True
-                    result['error'] = ['Correct answer']
-
-            elif question.type == 'mcc':
-                expected_answers = []
-                for opt in question.get_test_cases(correct=True):
-                    expected_answers.append(str(opt.id))
-                if set(user_answer) == set(expected_answers):
-                    result['success'] = True
-                    result['error'] = ['Correct answer']
-
-            elif question.type == 'integer':
-                expected_answers = []
-                for tc in question.get_test_cases():
-                    expected_answers.append(int(tc.correct))
-                if int(user_answer) in expected_answers:
-                    result['success'] = True
-                    result['error'] = ['Correct answer']
-
-            elif question.type == 'string':
-                tc_status = []
-                for tc in question.get_test_cases():
-                    if tc.string_check == "lower":
-                        if tc.correct.lower().splitlines()\
-                           == user_answer.lower().splitlines():
-                            tc_status.append(True)
-                    else:
-                        if tc.correct.splitlines()\
-                           == user_answer.splitlines():
-                            tc_status.append(True)
-                if any(tc_status):
-                    result['success'] = True
-                    result['error'] = ['Correct answer']
-
-            elif question.type == 'float':
-                user_answer = float(user_answer)
-                tc_status = []
-                user_answer = float(user_answer)
-                for tc in question.get_test_cases():
-                    if abs(tc.correct - user_answer) <= tc.error_margin:
-                        tc_status.append(True)
-                if any(tc_status):
-                    result['success'] = True
-                    result['error'] = ['Correct answer']
-
-            elif question.type == 'arrange':
-                testcase_ids = sorted(
-                                  [tc.id for tc in question.get_test_cases()]
-                                  )
-                if user_answer == testcase_ids:
+            if question.type in OBJECTIVE_TYPES:
+                if question.is_correct_answer(user_answer):
                     result['success'] = True
                     result['error'] = ['Correct answer']
 
             elif question.type == 'code' or question.type == "upload":
                 user_dir = self.user.profile.get_user_dir()
                 url = '{0}:{1}'.format(SERVER_HOST_NAME, server_port)
-                submit(url, uid, json_data, user_dir)
+                submitted = submit(
+                    url, uid, json_data, user_dir, course=self.course_id,
+                    user=self.user_id, bundle=question.get_grading_bundle
+                )
                 result = {'uid': uid, 'status': 'running'}
+                if submitted.get('eta'):
+                    result['eta'] = submitted['eta']
         return result
 
     def regrade(self, question_id, server_port=SERVER_POOL_PORT):
@@ -2451,8 +2865,9 @@ class AnswerPaper(models.Model):
                         )
         else:
             answer = user_answer.answer
-        json_data = question.consolidate_answer_data(answer) \
-            if question.type == 'code' else None
+        json_data = question.consolidate_answer_data(
+            answer, by_reference=True
+        ) if question.type == 'code' else None
         result = self.validate_answer(answer, question,
                                       json_data, user_answer.id,
                                       server_port=server_port
@@ -2462,23 +2877,8 @@ class AnswerPaper(models.Model):
             check_result = get_result_from_code_server(url, result['uid'],
                                                        block=True
                                                        )
-            result = json.loads(check_result.get('result'))
-        user_answer.correct = result.get('success')
-        user_answer.error = json.dumps(result.get('error'))
-        if result.get('success'):
-            if question.partial_grading and question.type == 'code':
-                max_weight = question.get_maximum_test_case_weight()
-                factor = result['weight']/max_weight
-                user_answer.marks = question.points * factor
-            else:
-                user_answer.marks = question.points
-        else:
-            if question.partial_grading and question.type == 'code':
-                max_weight = question.get_maximum_test_case_weight()
-                factor = result['weight']/max_weight
-                user_answer.marks = question.points * factor
-            else:
-                user_answer.marks = 0
+            result = check_result.get('result')
+        user_answer.set_result(result)
         user_answer.save()
         self.update_marks('completed')
         return True, msg
@@ -2712,3 +3112,37 @@ class Comment(ForumBase):
     def __str__(self):
         return 'Comment by {0}: {1}'.format(self.creator.username,
                                             self.post_field.title)
+
+
+@receiver(pre_save, sender=Question)
+def new_grading_version(sender, instance, **kwargs):
+    """Gives a question being saved a new grading version."""
+    instance.grading_version = uuid.uuid4().hex
+    instance.__dict__.pop('_grading_payload', None)
+    instance.__dict__.pop('_answer_key', None)
+
+
+def change_grading_version(sender, instance, **kwargs):
+    """Gives the question of a saved or deleted test case or file a new
+    grading version, so that its cached grading data is rebuilt.
+
+    The question instance the test case or file refers to, if loaded, is
+    updated too and forgets its memoised test cases.
+    """
+    if instance.question_id is None:
+        return
+    version = uuid.uuid4().hex
+    Question.objects.filter(id=instance.question_id).update(
+        grading_version=version
+    )
+    question = instance._state.fields_cache.get('question')
+    if question is not None:
+        question.grading_version = version
+        question.__dict__.pop('_grading_payload', None)
+        question.__dict__.pop('_answer_key', None)
+        question.__dict__.pop('_test_cases', None)
+
+
+for model in [FileUpload, TestCase] + TestCase.__subclasses__():
+    post_save.connect(change_grading_version, sender=model)
+    post_delete.connect(change_grading_version, sender=model)
@@ -33,7 +33,8 @@ class PythonAssertionEvaluator(BaseEvaluator):
 
     def compile_code(self):
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(self.file_paths)
         if self.exec_scope:
             return None
         else:
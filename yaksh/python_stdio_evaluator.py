@@ -45,7 +45,8 @@ class PythonStdIOEvaluator(BaseEvaluator):
 
     def compile_code(self):
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(self.file_paths)
         submitted = compile(self.user_answer, '<string>', mode='exec')
         self.expected_output = self.expected_output.replace('\r', '')
         if self.expected_input:
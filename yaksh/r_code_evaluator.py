@@ -12,6 +12,8 @@ from .error_messages import prettify_exceptions
 
 class RCodeEvaluator(BaseEvaluator):
     """Tests the R code obtained from Code Server"""
+    thread_safe = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
         self.submit_code_path = ""
@@ -33,13 +35,16 @@ class RCodeEvaluator(BaseEvaluator):
         if os.path.exists(self.test_code_path):
             os.remove(self.test_code_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
 
     def check_code(self):
         self.submit_code_path = self.create_submit_code_file('function.r')
         self.test_code_path = self.create_submit_code_file('main.r')
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(
+                    self.file_paths, self.working_dir
+                )
         clean_ref_path = self.test_code_path
         self.user_answer, terminate_commands = \
             self._remove_r_quit(self.user_answer.lstrip())
@@ -11,6 +11,8 @@ from .file_utils import copy_files, delete_files
 
 class ScilabCodeEvaluator(BaseEvaluator):
     """Tests the Scilab code obtained from Code Server"""
+    thread_safe = True
+
     def __init__(self, metadata, test_case_data):
         self.files = []
         self.submit_code_path = ""
@@ -32,13 +34,16 @@ class ScilabCodeEvaluator(BaseEvaluator):
         if os.path.exists(self.test_code_path):
             os.remove(self.test_code_path)
         if self.files:
-            delete_files(self.files)
+            delete_files(self.files, self.working_dir)
 
     def check_code(self):
         self.submit_code_path = self.create_submit_code_file('function.sci')
         self.test_code_path = self.create_submit_code_file('main.sci')
         if self.file_paths:
-            self.files = copy_files(self.file_paths)
+            with self.record_time('file_copy'):
+                self.files = copy_files(
+                    self.file_paths, self.working_dir
+                )
         clean_ref_path = self.test_code_path
         self.user_answer, terminate_commands = \
             self._remove_scilab_exit(self.user_answer.lstrip())
@@ -2,11 +2,89 @@
 settings for yaksh app.
 """
 
+import json
+
 from decouple import config
 
 # The number of code server processes to run..
 N_CODE_SERVERS = config('N_CODE_SERVERS', default=5, cast=int)
 
+# Number of jobs each code server grades concurrently on threads. Only jobs
+# whose evaluators run in subprocesses (C, C++, Java, Bash, R, Scilab) are
+# run on threads, the default of 1 disables threading.
+N_CODE_SERVER_THREADS = config('N_CODE_SERVER_THREADS', default=1, cast=int)
+
+# Separate pools of code servers for groups of languages, as a JSON object
+# mapping a pool name to its "languages", number of "servers" and optionally
+# "threads", e.g. {"java": {"languages": ["java"], "servers": 2}}. Each pool
+# has its own queue, languages without a pool are graded by the
+# N_CODE_SERVERS default servers.
+CODE_SERVER_POOLS = config('CODE_SERVER_POOLS', default='{}', cast=json.loads)
+
+# Weight and quota of the courses sharing the code servers, as a JSON object
+# mapping a course id to its "weight" (1 by default) and "quota", the maximum
+# number of its jobs queued on or run by the servers at a time (0, no limit,
+# by default). A "default" entry applies to the courses not listed, e.g.
+# {"default": {"quota": 20}, "12": {"weight": 2}}.
+CODE_SERVER_COURSE_SHARES = config(
+    'CODE_SERVER_COURSE_SHARES', default='{}', cast=json.loads
+)
+
+# Jobs and results exchanged with the code servers are compressed when they
+# are larger than this many bytes.
+CODE_SERVER_COMPRESS_MIN_SIZE = config(
+    'CODE_SERVER_COMPRESS_MIN_SIZE', default=16384, cast=int
+)
+
+# Maximum number of grading bundles, i.e. the test cases of a question, kept
+# by the code server pool and by each code server process.
+CODE_SERVER_MAX_BUNDLES = config(
+    'CODE_SERVER_MAX_BUNDLES', default=512, cast=int
+)
+
+# File to which the code server records the jobs and their results, for
+# them to be replayed with yaksh.benchmarks.replay. Nothing is recorded by
+# default.
+CODE_SERVER_RECORD_FILE = config('CODE_SERVER_RECORD_FILE', default='')
+
+# Before a quiz with code questions starts and while it is taken, the code
+# server pools grading its languages are scaled up to one server per this
+# many students of its courses, up to the maximum number of servers, from
+# this many minutes before the start.
+CODE_SERVER_PRESCALE_LEAD_TIME = config(
+    'CODE_SERVER_PRESCALE_LEAD_TIME', default=10, cast=int
+)
+CODE_SERVER_STUDENTS_PER_SERVER = config(
+    'CODE_SERVER_STUDENTS_PER_SERVER', default=40, cast=int
+)
+CODE_SERVER_MAX_PRESCALE_SERVERS = config(
+    'CODE_SERVER_MAX_PRESCALE_SERVERS', default=20, cast=int
+)
+
+# Maximum number of stdio test cases of a submission run concurrently.
+STDIO_MAX_CONCURRENCY = config('STDIO_MAX_CONCURRENCY', default=4, cast=int)
+
+# Maximum number of compiled hook test cases cached by each code server
+# process.
+MAX_CACHED_HOOKS = config('MAX_CACHED_HOOKS', default=256, cast=int)
+
+# Fraction of the requests whose database queries are counted and timed
+# by the QueryBudgetMiddleware, 0 turns it off. The requests of a view
+# running more queries or spending more seconds in the database than its
+# budget are logged. QUERY_BUDGETS maps view names, e.g. "yaksh:monitor", to
+# their "queries" and "db_time" budgets, a "default" entry applies to all
+# the views, e.g. {"default": {"queries": 100}, "yaksh:monitor":
+# {"queries": 300, "db_time": 1.0}}. The summary of the latest
+# QUERY_BUDGET_WINDOW requests of each view is shown to the superusers.
+QUERY_BUDGET_SAMPLE_RATE = config(
+    'QUERY_BUDGET_SAMPLE_RATE', default=0.0, cast=float
+)
+QUERY_BUDGETS = config(
+    'QUERY_BUDGETS', default='{"default": {"queries": 100}}',
+    cast=json.loads
+)
+QUERY_BUDGET_WINDOW = config('QUERY_BUDGET_WINDOW', default=100, cast=int)
+
 # The server pool port.  This is the server which returns available server
 # ports so as to minimize load.  This is some random number where no other
 # service is running.  It should be > 1024 and less < 65535 though.
@@ -18,6 +96,19 @@ SERVER_HOST_NAME = config('SERVER_HOST_NAME', default='http://localhost')
 # Timeout for the code to run in seconds.  This is an integer!
 SERVER_TIMEOUT = config('SERVER_TIMEOUT', default=4, cast=int)
 
+# Maximum number of instructor reference outputs (bash test cases) cached by
+# each code server process.
+MAX_CACHED_REFERENCE_OUTPUTS = config(
+    'MAX_CACHED_REFERENCE_OUTPUTS', default=256, cast=int
+)
+
+# Seconds the grading bundle of a question is kept in the Django cache. The
+# cache key holds the grading version of the question, which changes with
+# its test cases, files and grading options, so entries never go stale.
+GRADING_CACHE_TIMEOUT = config(
+    'GRADING_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int
+)
+
 # The root of the URL, for example you might be in the situation where you
 # are not hosted as host.org/exam/  but as host.org/foo/exam/ for whatever
 # reason set this to the root you have to serve at.  In the above example
@@ -6,10 +6,27 @@ function reset_values() {
     request_status = "initial";
     count = 0;
 }
-function check_state(state, uid) {
+function poll_delay(eta) {
+    // Poll again around the time the code server expects the job to be
+    // done, within 1 and 5 seconds.
+    if (!eta) {
+        return 2000;
+    }
+    return Math.min(Math.max(eta.finish_in * 1000, 1000), 5000);
+}
+
+function check_state(state, uid, progress, eta) {
     if ((state == "running" || state == "not started") && count < MAX_COUNT) {
         count++;
-        setTimeout(function() {get_result(uid);}, 2000);
+        if (progress) {
+            notify("Evaluated " + progress.completed + " of " +
+                   progress.total + " test cases.");
+        } else if (eta && eta.position > 0) {
+            notify("Waiting in queue at position " + eta.position +
+                   ", expected to be checked in about " +
+                   Math.ceil(eta.finish_in) + " seconds.");
+        }
+        setTimeout(function() {get_result(uid);}, poll_delay(eta));
     } else if (state == "unknown") {
         reset_values();
         notify("Request timeout. Try again later.");
@@ -64,7 +81,7 @@ function response_handler(method_type, content_type, data, uid){
           if(method_type === "POST") {
               uid = res.uid;
           }
-          check_state(request_status, uid);
+          check_state(request_status, uid, res.progress, res.eta);
         }
         else{
           unlock_screen();
@@ -1,14 +1,131 @@
 from __future__ import unicode_literals
 import os
+import shutil
 import signal
+import subprocess
+import tempfile
+import time
 
 # Local imports
-from .base_evaluator import BaseEvaluator
+from .base_evaluator import BaseEvaluator, kill_process_group, run_coroutines
+from .file_utils import copy_files
 from .grader import TimeoutException
 from .error_messages import compare_outputs
+from .settings import STDIO_MAX_CONCURRENCY
 
 
 class StdIOEvaluator(BaseEvaluator):
+    thread_safe = True
+
+    # Attributes specific to a test case, everything else is shared between
+    # the test cases of a submission once the code is compiled.
+    test_case_attributes = ('expected_input', 'expected_output', 'weight',
+                            'hidden', 'compiled', 'stdio_output', '_timing')
+
+    compiled = False
+    stdio_output = None
+
+    @classmethod
+    def prepare(cls, instances, fail_fast=False):
+        """Compile the submission once for all the stdio test cases and run
+        the program against every expected input, at most
+        STDIO_MAX_CONCURRENCY runs at a time. Each run gets its own process
+        group, timeout and scratch directory with a fresh copy of the
+        supporting files. The outputs are compared later in `check_code`.
+
+        With `fail_fast`, the inputs are run in batches and the remaining
+        batches are skipped once an output is wrong.
+        """
+        first = instances[0]
+        copied = first.timing.get('file_copy', 0.0)
+        start = time.time()
+        first.compile_code()
+        first.timing['compile'] = time.time() - start - \
+            (first.timing.get('file_copy', 0.0) - copied)
+        first.compiled = True
+        for instance in instances[1:]:
+            instance.share_compilation(first)
+        command = first.get_run_command()
+        if command is None:
+            return
+        batch_size = STDIO_MAX_CONCURRENCY if fail_fast else len(instances)
+        for idx in range(0, len(instances), batch_size):
+            batch = instances[idx:idx + batch_size]
+            cls._run_stdio_batch(command, batch)
+            if fail_fast and not all(
+                    instance._compare_stdio_output(instance.stdio_output)[0]
+                    for instance in batch):
+                break
+
+    @classmethod
+    def _run_stdio_batch(cls, command, instances):
+        run_dirs = []
+        try:
+            for instance in instances:
+                run_dir = tempfile.mkdtemp(dir=instance.working_dir)
+                run_dirs.append(run_dir)
+                if instance.file_paths:
+                    with instance.record_time('file_copy'):
+                        copy_files(instance.file_paths, run_dir)
+            results = run_coroutines(
+                [instance._run_stdio_async(command, run_dir)
+                 for instance, run_dir in zip(instances, run_dirs)],
+                STDIO_MAX_CONCURRENCY
+            )
+        finally:
+            for run_dir in run_dirs:
+                shutil.rmtree(run_dir, ignore_errors=True)
+        for instance, (proc, stdout, stderr) in zip(instances, results):
+            instance.stdio_output = stdout
+
+    async def _run_stdio_async(self, command, run_dir):
+        with self.record_time('run'):
+            return await self._run_command_async(
+                command, shell=True, input=self.get_stdin(),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, cwd=run_dir
+            )
+
+    def share_compilation(self, other):
+        """Reuse the compiled submission of another test case"""
+        for name, value in other.__dict__.items():
+            if name not in self.test_case_attributes:
+                setattr(self, name, value)
+        self.compiled = True
+
+    def get_run_command(self):
+        """Return the shell command running the compiled submission or None
+        if it did not compile, in which case `check_code` reports it. The
+        command is run from a scratch directory so it must not use paths
+        relative to the working directory.
+        """
+        return None
+
+    def get_stdin(self):
+        """Return the standard input fed to the program"""
+        if self.expected_input:
+            return '{0}\n'.format(self.expected_input.replace(",", " "))
+        return None
+
+    def run_stdio(self, command):
+        """Run the command with the expected input, unless it was already
+        run in `prepare`, and compare its output with the expected output.
+        """
+        if self.stdio_output is not None:
+            return self._compare_stdio_output(self.stdio_output)
+        proc = subprocess.Popen(command,
+                                shell=True,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                cwd=self.working_dir,
+                                start_new_session=True
+                                )
+        return self.evaluate_stdio(self.user_answer, proc,
+                                   self.expected_input,
+                                   self.expected_output
+                                   )
+
     def evaluate_stdio(self, user_answer, proc,
                        expected_input, expected_output):
         success = False
@@ -17,11 +134,17 @@ class StdIOEvaluator(BaseEvaluator):
                 ip = expected_input.replace(",", " ")
                 encoded_input = '{0}\n'.format(ip).encode('utf-8')
                 user_output_bytes, output_err_bytes = proc.communicate(
-                                                           encoded_input
-                                                           )
+                    encoded_input, timeout=self.get_timeout()
+                )
             else:
-                user_output_bytes, output_err_bytes = proc.communicate()
+                user_output_bytes, output_err_bytes = proc.communicate(
+                    timeout=self.get_timeout()
+                )
             user_output = user_output_bytes.decode('utf-8')
+        except subprocess.TimeoutExpired:
+            kill_process_group(proc.pid)
+            proc.wait()
+            raise TimeoutException('Code took too long to run.')
         except TimeoutException:
             os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
             raise
@@ -31,3 +154,8 @@ class StdIOEvaluator(BaseEvaluator):
                                        expected_input
                                        )
         return success, err
+
+    def _compare_stdio_output(self, user_output):
+        expected_output = self.expected_output.replace("\r", "")
+        return compare_outputs(expected_output, user_output,
+                               self.expected_input)
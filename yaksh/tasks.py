@@ -1,5 +1,8 @@
 # Python Imports
 from __future__ import absolute_import, unicode_literals
+from collections import OrderedDict
+from datetime import timedelta
+import math
 from textwrap import dedent
 
 # Django and celery imports
@@ -8,7 +11,16 @@ from django.urls import reverse
 from django.shortcuts import get_object_or_404
 
 # Local imports
-from .models import Course, QuestionPaper, Quiz, AnswerPaper, CourseStatus
+from . import code_server
+from .models import (
+    Course, QuestionPaper, Quiz, AnswerPaper, CourseStatus, Question,
+    OBJECTIVE_TYPES
+)
+from .settings import (
+    SERVER_HOST_NAME, SERVER_POOL_PORT, CODE_SERVER_POOLS,
+    CODE_SERVER_PRESCALE_LEAD_TIME, CODE_SERVER_STUDENTS_PER_SERVER,
+    CODE_SERVER_MAX_PRESCALE_SERVERS
+)
 from notifications_plugin.models import NotificationMessage, Notification
 
 
@@ -54,12 +66,22 @@ def regrade_papers(data):
             answerpapers = AnswerPaper.objects.filter(
                 questions=question_id,
                 question_paper_id=questionpaper_id, course_id=course_id)
-            for answerpaper in answerpapers:
-                answerpaper.regrade(question_id)
-                course_status = CourseStatus.objects.filter(
-                    user=answerpaper.user, course=answerpaper.course)
-                if course_status.exists():
-                    course_status.first().set_grade()
+            question = Question.objects.get(id=question_id)
+            if question.type in OBJECTIVE_TYPES:
+                regraded = AnswerPaper.objects.regrade_objective_question(
+                    question, answerpapers
+                )
+                CourseStatus.objects.update_grades(
+                    Course.objects.get(id=course_id),
+                    {answerpaper.user_id for answerpaper in regraded}
+                )
+            else:
+                for answerpaper in answerpapers:
+                    answerpaper.regrade(question_id)
+                    course_status = CourseStatus.objects.filter(
+                        user=answerpaper.user, course=answerpaper.course)
+                    if course_status.exists():
+                        course_status.first().set_grade()
 
         message = dedent("""
             Quiz re-evaluation is complete.
@@ -80,3 +102,44 @@ def regrade_papers(data):
     notification = Notification.objects.add_single_notification(
         user_id, nm.id
     )
+
+
+@shared_task
+def prescale_code_servers():
+    """Scale up the code server pools grading the languages of the quizzes
+    with code questions which are about to start or being taken, and have
+    their idle servers load the test cases of these questions ahead.
+
+    This runs every minute, the pools are scaled for a few minutes so that
+    they go back to their size once the quizzes are over.
+    """
+    language_pools = {}
+    for name, pool in CODE_SERVER_POOLS.items():
+        for language in pool['languages']:
+            language_pools[language] = name
+    url = '{0}:{1}'.format(SERVER_HOST_NAME, SERVER_POOL_PORT)
+    students = OrderedDict()
+    bundle_hashes = OrderedDict()
+    quizzes = Quiz.objects.get_code_quizzes_starting(
+        timedelta(minutes=CODE_SERVER_PRESCALE_LEAD_TIME)
+    )
+    for quiz in quizzes:
+        pools = set()
+        for question in quiz.get_code_questions():
+            pools.add(language_pools.get(question.language,
+                                         code_server.DEFAULT_POOL))
+            bundle_hash, bundle_json = question.get_grading_bundle()
+            if bundle_hash not in bundle_hashes and \
+                    not code_server.has_bundle(url, bundle_hash):
+                code_server.put_bundle(url, bundle_hash, bundle_json)
+            bundle_hashes[bundle_hash] = True
+        for name in pools:
+            students[name] = students.get(name, 0) + quiz.n_students
+    servers = {
+        name: min(CODE_SERVER_MAX_PRESCALE_SERVERS,
+                  math.ceil(n / CODE_SERVER_STUDENTS_PER_SERVER))
+        for name, n in students.items()
+    }
+    if servers:
+        code_server.scale(url, servers, ttl=3 * 60,
+                          bundles=list(bundle_hashes))
@@ -5,10 +5,16 @@ from yaksh.models import User, Profile, Question, Quiz, QuestionPaper,\
     QuestionSet, AnswerPaper, Answer, Course, StandardTestCase,\
     StdIOBasedTestCase, FileUpload, McqTestCase, AssignmentUpload,\
     LearningModule, LearningUnit, Lesson, LessonFile, CourseStatus, \
-    create_group, legend_display_types, Post, Comment
+    create_group, legend_display_types, Post, Comment, TestCase, \
+    prefetch_test_cases, StringTestCase, FloatTestCase
 from yaksh.code_server import (
     ServerPool, get_result as get_result_from_code_server
     )
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management.base import CommandError
+from io import StringIO
 import json
 import ruamel.yaml as yaml
 from datetime import datetime, timedelta
@@ -730,6 +736,42 @@ class QuizTestCases(unittest.TestCase):
         for quiz in quizzes:
             self.assertTrue(quiz.active)
 
+    def test_get_code_quizzes_starting(self):
+        # Given
+        question = Question.objects.get(summary='Q1')
+        module = LearningModule.objects.create(
+            name='LM3', description='module three', creator=self.creator
+        )
+        quizzes = []
+        for minutes in (5, 120):
+            quiz = Quiz.objects.create(
+                start_date_time=timezone.now() + timedelta(minutes=minutes),
+                duration=30, description='starting quiz'
+            )
+            question_paper = QuestionPaper.objects.create(quiz=quiz)
+            question_paper.fixed_questions.add(question)
+            unit = LearningUnit.objects.create(order=1, quiz=quiz,
+                                               type='quiz')
+            module.learning_unit.add(unit)
+            quizzes.append(quiz)
+        self.course.learning_module.add(module)
+        n_students = self.course.students.count()
+
+        # When
+        starting = Quiz.objects.get_code_quizzes_starting(
+            timedelta(minutes=10)
+        )
+
+        # Then
+        self.assertEqual(starting, [quizzes[0]])
+        self.assertEqual(starting[0].n_students, n_students)
+        self.assertEqual(list(quizzes[0].get_code_questions()), [question])
+        self.assertEqual(list(self.quiz3.get_code_questions()), [])
+        self.course.learning_module.remove(module)
+        module.delete()
+        for quiz in quizzes:
+            quiz.delete()
+
     def test_create_trial_quiz(self):
         """Test to check if trial quiz is created"""
         trial_quiz = Quiz.objects.create_trial_quiz(self.creator)
@@ -1406,7 +1448,7 @@ class AnswerPaperTestCases(unittest.TestCase):
         check_result = get_result_from_code_server(url, get_result['uid'],
                                                    block=True
                                                    )
-        result = json.loads(check_result.get('result'))
+        result = check_result.get('result')
 
         # Then
         self.assertTrue(result['success'])
@@ -1474,6 +1516,49 @@ class AnswerPaperTestCases(unittest.TestCase):
         self.assertEqual(self.answer.marks, 0)
         self.assertFalse(self.answer.correct)
 
+    def test_regrade_objective_question(self):
+        # Given
+        wrong_answer = Answer.objects.create(
+            question=self.question2, answer='b', correct=True, marks=1
+        )
+        self.answerpaper.answers.add(wrong_answer)
+        answerpapers = AnswerPaper.objects.filter(id=self.answerpaper.id)
+
+        # When
+        regraded = AnswerPaper.objects.regrade_objective_question(
+            self.question2, answerpapers
+        )
+
+        # Then
+        wrong_answer.refresh_from_db()
+        self.assertEqual(regraded, [self.answerpaper])
+        self.assertFalse(wrong_answer.correct)
+        self.assertEqual(wrong_answer.marks, 0)
+
+        # Given
+        right_answer = Answer.objects.create(
+            question=self.question2, answer=str(self.mcq_based_testcase.id),
+            correct=False, marks=0
+        )
+        self.answerpaper.answers.add(right_answer)
+
+        # When
+        AnswerPaper.objects.regrade_objective_question(
+            self.question2, answerpapers
+        )
+
+        # Then
+        right_answer.refresh_from_db()
+        answerpaper = AnswerPaper.objects.get(id=self.answerpaper.id)
+        expected = AnswerPaper.objects.get(id=self.answerpaper.id)
+        expected._update_marks_obtained()
+        self.assertTrue(right_answer.correct)
+        self.assertEqual(right_answer.marks, self.question2.points)
+        self.assertEqual(answerpaper.marks_obtained, expected.marks_obtained)
+        self.assertEqual(answerpaper.status, 'completed')
+        wrong_answer.delete()
+        right_answer.delete()
+
     def test_mcq_incorrect_answer(self):
         # Given
         mcq_answer = 'b'
@@ -1677,6 +1762,36 @@ class AnswerPaperTestCases(unittest.TestCase):
         self.answer_wrong.set_marks(10.0)
         self.assertEqual(self.answer_wrong.marks, 1.0)
 
+    def test_set_timing(self):
+        # Given
+        answer = Answer.objects.create(question=self.question4,
+                                       answer="timed answer")
+        timing = {'setup': 0.1, 'compile': 0.5, 'test_cases': [0.2, 0.2],
+                  'total': 1.5}
+
+        other_answer = Answer.objects.create(question=self.question4,
+                                             answer="other paper",
+                                             grading_time=10.0)
+        self.answerpaper.answers.add(answer)
+
+        # When
+        answer.set_timing(timing)
+        answer.save()
+        stats = AnswerPaper.objects.get_grading_time_statistics(
+            self.question_paper.id, self.answerpaper.attempt_number,
+            self.course.id, status=self.answerpaper.status
+        )
+
+        # Then
+        self.assertEqual(json.loads(answer.timing), timing)
+        self.assertEqual(answer.grading_time, 1.5)
+        self.assertEqual(stats, {self.question4.id: {
+            'count': 1, 'average': 1.5, 'maximum': 1.5
+        }})
+        self.answerpaper.answers.remove(answer)
+        answer.delete()
+        other_answer.delete()
+
     def test_get_latest_answer(self):
         latest_answer = self.answerpaper.get_latest_answer(self.question1.id)
         self.assertEqual(latest_answer.id, self.answer1.id)
@@ -2060,6 +2175,220 @@ class TestCaseTestCases(unittest.TestCase):
                          exp_data['metadata']['user_answer'])
         self.assertEqual(actual_data['test_case_data'],
                          exp_data['test_case_data'])
+        self.assertTrue(actual_data['metadata']['fail_fast'])
+        self.assertEqual(actual_data['metadata']['question_id'],
+                         self.question1.id)
+
+    def test_consolidate_answer_data_with_partial_grading(self):
+        """ Test fail fast is disabled for partially graded questions """
+        self.question1.partial_grading = True
+        result = self.question1.consolidate_answer_data(
+            user_answer="demo_answer"
+        )
+        self.question1.partial_grading = False
+        actual_data = json.loads(result)
+        self.assertFalse(actual_data['metadata']['fail_fast'])
+
+    def test_consolidate_answer_data_by_reference(self):
+        """ Test the job refers to the grading bundle of the question """
+        # Given
+        bundle_hash, bundle_json = self.question1.get_grading_bundle()
+
+        # When
+        result = json.loads(self.question1.consolidate_answer_data(
+            user_answer="demo_answer", by_reference=True
+        ))
+        self.assertion_testcase.test_case = 'assert myfunc(1, 2) == 3'
+        self.assertion_testcase.save()
+        new_hash, new_json = self.question1.get_grading_bundle()
+        self.assertion_testcase.test_case = 'assert myfunc(12, 13) == 15'
+        self.assertion_testcase.save()
+
+        # Then
+        self.assertNotIn('test_case_data', result)
+        self.assertEqual(result['metadata']['bundle_hash'], bundle_hash)
+        self.assertEqual(result['metadata']['question_id'],
+                         self.question1.id)
+        self.assertEqual(result['metadata']['user_answer'], 'demo_answer')
+        self.assertEqual(json.loads(bundle_json)['test_case_data'],
+                         json.loads(self.answer_data_json)['test_case_data'])
+        self.assertNotEqual(new_hash, bundle_hash)
+
+    def test_prefetch_test_cases(self):
+        """ Test the test cases of many questions load in one query """
+        # Given
+        questions = list(Question.objects.filter(
+            id__in=[self.question1.id, self.question2.id]
+        ).order_by('id'))
+        StandardTestCase.objects.create(
+            question=self.question2, test_case='assert myfunc() == 0',
+            type='standardtestcase'
+        )
+
+        # When
+        with CaptureQueriesContext(connection) as queries:
+            prefetch_test_cases(questions)
+            test_cases = [question.get_test_cases() for question in questions]
+            prefetch_test_cases(questions)
+
+        # Then
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([len(cases) for cases in test_cases], [1, 1])
+        self.assertIsInstance(test_cases[0][0], StandardTestCase)
+        self.assertEqual(test_cases[0][0].id, self.assertion_testcase.id)
+        self.assertIs(test_cases[0][0].question, questions[0])
+        self.assertEqual(test_cases[1][0].test_case, 'assert myfunc() == 0')
+
+    def test_get_test_case(self):
+        """ Test a test case is found among the memoised ones """
+        # Given
+        question = Question.objects.get(id=self.question1.id)
+
+        # When
+        test_case = question.get_test_case(id=self.assertion_testcase.id)
+        with CaptureQueriesContext(connection) as queries:
+            same_test_case = question.get_test_case(
+                id=str(self.assertion_testcase.id)
+            )
+            test_cases = question.get_test_cases(hidden=True)
+
+        # Then
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(test_case.test_case, 'assert myfunc(12, 13) == 15')
+        self.assertIs(same_test_case, test_case)
+        self.assertEqual(test_cases, [])
+        with self.assertRaises(TestCase.DoesNotExist):
+            question.get_test_case(id=0)
+
+    def test_get_test_cases_by_related_object_and_lookup(self):
+        """ Test test cases are found by related object and by lookup """
+        # Given
+        question = Question.objects.get(id=self.question1.id)
+        test_case_id = self.assertion_testcase.id
+
+        # When
+        by_question = question.get_test_cases(question=question)
+        by_question_id = question.get_test_cases(question=question.id)
+        by_other_question = question.get_test_cases(question=self.question2)
+        by_id_lookup = question.get_test_cases(id__in=[test_case_id, 0])
+        by_type_lookup = question.get_test_cases(type__startswith='standard')
+        by_related_lookup = question.get_test_cases(question__id=question.id)
+
+        # Then
+        self.assertEqual(by_question, [self.assertion_testcase])
+        self.assertEqual(by_question_id, [self.assertion_testcase])
+        self.assertEqual(by_other_question, [])
+        self.assertEqual(by_id_lookup, [self.assertion_testcase])
+        self.assertEqual(by_type_lookup, [self.assertion_testcase])
+        self.assertEqual(by_related_lookup, [self.assertion_testcase])
+
+    def test_test_cases_forgotten_on_change(self):
+        """ Test the memoised test cases are dropped when they change """
+        # Given
+        question = Question.objects.get(id=self.question1.id)
+        self.assertEqual(len(question.get_test_cases()), 1)
+
+        # When
+        test_case = StandardTestCase.objects.create(
+            question=question, test_case='assert myfunc(1, 1) == 2',
+            type='standardtestcase'
+        )
+        added = question.get_test_cases()
+        test_case.delete()
+
+        # Then
+        self.assertEqual(len(added), 2)
+        self.assertEqual(len(question.get_test_cases()), 1)
+
+    def test_grading_version_changes_with_test_cases(self):
+        """ Test the grading version changes when a test case changes """
+        # Given
+        question = Question.objects.get(id=self.question1.id)
+        version = question.grading_version
+
+        # When
+        test_case = StandardTestCase.objects.create(
+            question=question, test_case='assert myfunc(1, 1) == 2',
+            type='standardtestcase', weight=2.0
+        )
+        added = question.grading_version
+        stored = Question.objects.get(id=question.id).grading_version
+        weight = question.get_maximum_test_case_weight()
+        test_case.delete()
+
+        # Then
+        self.assertNotEqual(added, version)
+        self.assertEqual(stored, added)
+        self.assertEqual(weight, 3.0)
+        self.assertNotEqual(question.grading_version, added)
+        self.assertEqual(question.get_maximum_test_case_weight(), 1.0)
+
+    def test_grading_payload_cached(self):
+        """ Test the grading bundle is read from the cache """
+        # Given
+        bundle = self.question1.get_grading_bundle()
+        question = Question.objects.get(id=self.question1.id)
+
+        # When
+        with CaptureQueriesContext(connection) as queries:
+            cached = question.get_grading_bundle()
+            weight = question.get_maximum_test_case_weight()
+
+        # Then
+        self.assertEqual(cached, bundle)
+        self.assertEqual(weight, 1.0)
+        self.assertEqual(len(queries), 0)
+
+    def test_is_correct_answer(self):
+        """ Test objective answers are checked against the answer key """
+        # Given
+        mcc = Question.objects.create(
+            summary='Demo mcc', language='Python', type='mcc',
+            description='Pick the odd numbers', points=1.0, user=self.user
+        )
+        options = [
+            McqTestCase.objects.create(
+                question=mcc, options=str(number), correct=number % 2 == 1,
+                type='mcqtestcase'
+            )
+            for number in range(4)
+        ]
+        string = Question.objects.create(
+            summary='Demo string', language='Python', type='string',
+            description='Name the language', points=1.0, user=self.user
+        )
+        StringTestCase.objects.create(
+            question=string, correct='Python', string_check='lower',
+            type='stringtestcase'
+        )
+        decimal = Question.objects.create(
+            summary='Demo float', language='Python', type='float',
+            description='Give pi', points=1.0, user=self.user
+        )
+        FloatTestCase.objects.create(
+            question=decimal, correct=3.14, error_margin=0.01,
+            type='floattestcase'
+        )
+        mcc = Question.objects.get(id=mcc.id)
+        mcc.get_answer_key()
+
+        # When
+        with CaptureQueriesContext(connection) as queries:
+            mcc_correct = mcc.is_correct_answer(
+                [str(options[3].id), str(options[1].id)]
+            )
+            mcc_wrong = mcc.is_correct_answer([str(options[1].id)])
+
+        # Then
+        self.assertTrue(mcc_correct)
+        self.assertFalse(mcc_wrong)
+        self.assertEqual(len(queries), 0)
+        self.assertTrue(string.is_correct_answer('PYTHON'))
+        self.assertFalse(string.is_correct_answer('Java'))
+        self.assertTrue(decimal.is_correct_answer('3.145'))
+        self.assertFalse(decimal.is_correct_answer('3.2'))
+        with self.assertRaises(ValueError):
+            decimal.is_correct_answer('pi')
 
 
 class AssignmentUploadTestCases(unittest.TestCase):
@@ -2222,6 +2551,30 @@ class CourseStatusTestCases(unittest.TestCase):
         # Test get course grade after completion
         self.assertEqual(self.course.get_grade(self.answerpaper1.user), 'B')
 
+    def test_update_grades(self):
+        # Given
+        self.course_status.completed_units.add(self.unit_1_quiz)
+        self.course_status.completed_units.add(self.unit_2_quiz)
+        self.answerpaper1.marks_obtained = 1
+        self.answerpaper1.save()
+        self.answerpaper2.marks_obtained = 0
+        self.answerpaper2.save()
+        self.course_status.set_grade()
+        self.answerpaper1.marks_obtained = 0
+        self.answerpaper1.save()
+        self.answerpaper2.marks_obtained = 1
+        self.answerpaper2.save()
+
+        # When
+        CourseStatus.objects.update_grades(
+            self.course, [self.answerpaper1.user_id]
+        )
+
+        # Then
+        course_status = CourseStatus.objects.get(id=self.course_status.id)
+        self.assertEqual(round(course_status.percentage, 2), 66.67)
+        self.assertEqual(course_status.get_grade(), 'B')
+
 
 class FileUploadTestCases(unittest.TestCase):
     def setUp(self):
@@ -2366,3 +2719,150 @@ class CommentModelTestCases(unittest.TestCase):
         self.course.delete()
         self.post1.delete()
         self.comment1.delete()
+
+
+class GradeAnswersCommandTestCases(unittest.TestCase):
+    def setUp(self):
+        settings.code_evaluators['python']['standardtestcase'] = \
+            "yaksh.python_assertion_evaluator.PythonAssertionEvaluator"
+        self.user = User.objects.get(username='creator')
+        self.course = Course.objects.get(name="Python Course")
+        self.quiz = Quiz.objects.get(description='demo quiz 1')
+        self.question = Question.objects.create(
+            summary='Add', points=2, type='code', language='python',
+            user=self.user
+        )
+        StandardTestCase.objects.create(
+            question=self.question, test_case='assert add(1, 2) == 3',
+            type='standardtestcase'
+        )
+        self.question_paper = QuestionPaper.objects.create(
+            quiz=self.quiz, total_marks=2
+        )
+        self.question_paper.fixed_questions.add(self.question)
+        self.answerpaper = AnswerPaper.objects.create(
+            user=self.user, question_paper=self.question_paper,
+            start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(minutes=20),
+            user_ip='127.0.0.1', course=self.course, attempt_number=1
+        )
+        self.answerpaper.questions.add(self.question)
+        self.old_answer = Answer.objects.create(
+            question=self.question, answer='def add(a, b):\n    return 0',
+            error=json.dumps([])
+        )
+        self.answer = Answer.objects.create(
+            question=self.question,
+            answer='def add(a, b):\n    return a + b',
+            error=json.dumps([])
+        )
+        self.answerpaper.answers.add(self.old_answer, self.answer)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        settings.code_evaluators['python']['standardtestcase'] = \
+            "python_assertion_evaluator.PythonAssertionEvaluator"
+        self.answerpaper.delete()
+        self.question_paper.delete()
+        self.question.delete()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_grade_questionpaper(self):
+        # When
+        call_command('grade_answers', questionpaper=self.question_paper.id,
+                     processes=1, stdout=StringIO())
+
+        # Then
+        self.answer.refresh_from_db()
+        self.old_answer.refresh_from_db()
+        self.answerpaper.refresh_from_db()
+        self.assertTrue(self.answer.correct)
+        self.assertEqual(self.answer.marks, 2)
+        self.assertIsNotNone(self.answer.grading_time)
+        self.assertFalse(self.old_answer.correct)
+        self.assertIsNone(self.old_answer.grading_time)
+        self.assertEqual(self.answerpaper.marks_obtained, 2)
+        self.assertEqual(self.answerpaper.status, 'completed')
+
+    def test_grade_jobs_file(self):
+        # Given
+        jobs = os.path.join(self.tmp_dir, 'jobs.jsonl')
+        output = os.path.join(self.tmp_dir, 'results.jsonl')
+        with open(jobs, 'w') as f:
+            for answer in (self.answer, self.old_answer):
+                f.write(self.question.consolidate_answer_data(
+                    answer.answer
+                ) + '\n')
+
+        # When
+        call_command('grade_answers', jobs=jobs, output=output,
+                     processes=2, stdout=StringIO())
+
+        # Then
+        with open(output) as f:
+            results = [json.loads(line) for line in f]
+        self.assertEqual([r['line'] for r in results], [1, 2])
+        self.assertEqual([r['result']['success'] for r in results],
+                         [True, False])
+
+
+class CreateDatasetCommandTestCases(unittest.TestCase):
+    def tearDown(self):
+        User.objects.filter(username__startswith='dataset_').delete()
+
+    def test_create_dataset(self):
+        # When
+        call_command('create_dataset', prefix='dataset', courses=2,
+                     modules=2, lessons=1, quizzes=1, questions=10,
+                     students=5, attempts=2, inprogress=0.5, seed=1,
+                     stdout=StringIO())
+
+        # Then
+        courses = Course.objects.filter(name__startswith='dataset course')
+        self.assertEqual(courses.count(), 2)
+        course = courses.first()
+        self.assertEqual(course.students.count(), 5)
+        self.assertEqual(len(course.get_quizzes()), 2)
+        self.assertEqual(len(course.get_learning_units()), 4)
+        papers = AnswerPaper.objects.filter(course__in=courses)
+        self.assertEqual(papers.count(), 2 * 2 * 5 * 2)
+        self.assertEqual(
+            set(papers.values_list('status', flat=True)),
+            {'completed', 'inprogress'}
+        )
+        questions = Question.objects.filter(
+            user__username='dataset_moderator'
+        )
+        self.assertEqual(
+            set(questions.values_list('type', flat=True)),
+            {'mcq', 'mcc', 'code', 'integer', 'string', 'float', 'arrange',
+             'upload'}
+        )
+        self.assertEqual(
+            set(TestCase.objects.filter(
+                question__in=questions.filter(type='code')
+            ).values_list('type', flat=True)),
+            {'standardtestcase', 'stdiobasedtestcase', 'hooktestcase'}
+        )
+        for paper in papers.filter(status='completed')[:4]:
+            self.assertEqual(paper.questions.count(), 10)
+            self.assertEqual(paper.answers.count(), 10)
+            self.assertEqual(paper.questions_unanswered.count(), 0)
+            marks = paper.marks_obtained
+            paper._update_marks_obtained()
+            self.assertEqual(paper.marks_obtained, marks)
+        paper = papers.filter(status='inprogress').first()
+        self.assertEqual(paper.answers.count(), 5)
+        self.assertEqual(paper.questions_unanswered.count(), 5)
+        self.assertEqual(
+            CourseStatus.objects.filter(course__in=courses).count(), 10
+        )
+
+    def test_create_dataset_existing_prefix(self):
+        # Given
+        User.objects.create_user(username='dataset_student_0')
+
+        # When / Then
+        with self.assertRaises(CommandError):
+            call_command('create_dataset', prefix='dataset',
+                         stdout=StringIO())
@@ -0,0 +1,294 @@
+"""Query count bounds of the busiest views.
+
+Each test requests a view against a small and a large institution built by
+``build_institution`` and checks that the number of queries stays within an
+absolute bound and does not grow with the number of students or questions.
+A failing test here usually means that an N+1 pattern has crept back in.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytz
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from yaksh.management.commands.create_dataset import (
+    QUESTION_TYPES, answer_text, create_test_cases
+)
+from yaksh.models import (
+    Answer, AnswerPaper, Course, CourseStatus, LearningModule, LearningUnit,
+    Profile, Question, QuestionPaper, QuestionSet, Quiz
+)
+
+
+SMALL = {'students': 10, 'questions': 10, 'attempts': 2}
+LARGE = {'students': 200, 'questions': 50, 'attempts': 2}
+
+# Number of queries the large institution may need over the small one.
+SLACK = 3
+
+PASSWORD = 'demo'
+
+
+def build_institution(name, moderator, students, questions, attempts):
+    """Create a course with ``students`` students who each completed
+    ``attempts`` attempts of a quiz with ``questions`` questions.
+
+    Half the questions are fixed and the other half are drawn from two
+    question sets. Rows are bulk inserted so that large institutions stay
+    cheap to build.
+    """
+    tzone = pytz.timezone('UTC')
+    course = Course.objects.create(
+        name='{0} course'.format(name), enrollment='Open Enrollment',
+        creator=moderator
+    )
+    quiz = Quiz.objects.create(
+        start_date_time=datetime(2014, 10, 9, 10, 8, 15, 0, tzone),
+        end_date_time=datetime(2199, 10, 9, 10, 8, 15, 0, tzone),
+        duration=30, active=True, instructions='Demo Instructions',
+        attempts_allowed=-1, time_between_attempts=0,
+        description='{0} quiz'.format(name), pass_criteria=40,
+        creator=moderator
+    )
+    unit = LearningUnit.objects.create(order=1, type='quiz', quiz=quiz)
+    module = LearningModule.objects.create(
+        order=1, name='{0} module'.format(name), description='module',
+        creator=moderator, check_prerequisite=False
+    )
+    module.learning_unit.add(unit)
+    course.learning_module.add(module)
+
+    question_list = []
+    test_cases = {}
+    for index in range(questions):
+        question_type, test_case_type = \
+            QUESTION_TYPES[index % len(QUESTION_TYPES)]
+        question = Question.objects.create(
+            summary='{0} question {1}'.format(name, index),
+            description='question {0}'.format(index), points=1.0,
+            language='python', type=question_type, user=moderator
+        )
+        test_cases[question.id] = create_test_cases(
+            question, test_case_type, index
+        )
+        question_list.append(question)
+    fixed = question_list[:questions // 2]
+    random_pool = question_list[questions // 2:]
+    question_paper = QuestionPaper.objects.create(
+        quiz=quiz, total_marks=float(questions),
+        fixed_question_order=','.join(str(q.id) for q in fixed)
+    )
+    question_paper.fixed_questions.add(*fixed)
+    half = len(random_pool) // 2
+    for pool in (random_pool[:half], random_pool[half:]):
+        question_set = QuestionSet.objects.create(
+            marks=1.0, num_questions=len(pool)
+        )
+        question_set.questions.add(*pool)
+        question_paper.random_questions.add(question_set)
+
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(username='{0}_student_{1}'.format(name, index),
+             first_name='student', last_name=str(index),
+             email='{0}_{1}@example.com'.format(name, index),
+             password=password)
+        for index in range(students)
+    ])
+    users = list(
+        User.objects.filter(username__startswith='{0}_student_'.format(name))
+    )
+    Profile.objects.bulk_create([
+        Profile(user=user, roll_number=str(user.id), institute='IIT',
+                department='Chemical', position='Student', timezone='UTC',
+                is_email_verified=True)
+        for user in users
+    ])
+    course.students.add(*users)
+
+    start_time = timezone.now() - timedelta(days=2)
+    papers = [
+        AnswerPaper(
+            user=user, question_paper=question_paper, course=course,
+            attempt_number=attempt, start_time=start_time,
+            end_time=start_time + timedelta(minutes=30),
+            user_ip='127.0.0.1', status='completed',
+            marks_obtained=float(questions), percent=100.0, passed=True,
+            questions_order=','.join(str(q.id) for q in question_list)
+        )
+        for user in users for attempt in range(1, attempts + 1)
+    ]
+    AnswerPaper.objects.bulk_create(papers)
+    papers = list(AnswerPaper.objects.filter(question_paper=question_paper))
+    answers = [
+        Answer(question=question,
+               answer=answer_text(question, test_cases[question.id], True),
+               error=json.dumps([]), marks=1.0, correct=True)
+        for paper in papers for question in question_list
+    ]
+    Answer.objects.bulk_create(answers)
+    answers = list(
+        Answer.objects.filter(question__in=question_list).order_by('id')
+    )
+    Through = AnswerPaper.questions.through
+    Through.objects.bulk_create([
+        Through(answerpaper_id=paper.id, question_id=question.id)
+        for paper in papers for question in question_list
+    ])
+    Answered = AnswerPaper.questions_answered.through
+    Answered.objects.bulk_create([
+        Answered(answerpaper_id=paper.id, question_id=question.id)
+        for paper in papers for question in question_list
+    ])
+    Answers = AnswerPaper.answers.through
+    Answers.objects.bulk_create([
+        Answers(answerpaper_id=paper.id, answer_id=answer.id)
+        for index, paper in enumerate(papers)
+        for answer in answers[index * questions:(index + 1) * questions]
+    ])
+    CourseStatus.objects.bulk_create([
+        CourseStatus(course=course, user=user, current_unit=unit,
+                     percent_completed=100)
+        for user in users
+    ])
+    Completed = CourseStatus.completed_units.through
+    Completed.objects.bulk_create([
+        Completed(coursestatus_id=status.id, learningunit_id=unit.id)
+        for status in CourseStatus.objects.filter(course=course)
+    ])
+    return {
+        'course': course, 'quiz': quiz, 'module': module,
+        'question_paper': question_paper, 'students': users,
+        'questions': question_list, 'test_cases': test_cases
+    }
+
+
+class QueryCountTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user(
+            username='moderator', password=PASSWORD, email='mod@example.com'
+        )
+        Profile.objects.create(
+            user=cls.moderator, roll_number=1, institute='IIT',
+            department='Chemical', position='Moderator', timezone='UTC',
+            is_moderator=True, is_email_verified=True
+        )
+        Group.objects.create(name='moderator').user_set.add(cls.moderator)
+        cls.small = build_institution('small', cls.moderator, **SMALL)
+        cls.large = build_institution('large', cls.moderator, **LARGE)
+
+    def setUp(self):
+        self.client = Client()
+
+    def measure(self, user, method, url, data=None):
+        """Return the number of queries made by a request of ``user``."""
+        self.client.force_login(user)
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertLess(response.status_code, 400)
+        return len(queries)
+
+    def assertBounded(self, view, max_queries):
+        """Request ``view`` for both institutions and check the bounds.
+
+        ``view`` is called with an institution and returns the user, the
+        method and the url (and optionally the data) of the request.
+        """
+        small_queries = self.measure(*view(self.small))
+        large_queries = self.measure(*view(self.large))
+        self.assertLessEqual(large_queries, small_queries + SLACK)
+        self.assertLessEqual(large_queries, max_queries)
+
+    def test_monitor(self):
+        def view(institution):
+            url = reverse('yaksh:monitor', args=[
+                institution['quiz'].id, institution['course'].id
+            ])
+            return self.moderator, 'get', url
+        self.assertBounded(view, 25)
+
+    def test_download_quiz_csv(self):
+        def view(institution):
+            url = reverse('yaksh:download_quiz_csv', args=[
+                institution['course'].id, institution['quiz'].id
+            ])
+            return self.moderator, 'get', url
+        self.assertBounded(view, 25)
+
+    def test_download_course_csv(self):
+        def view(institution):
+            url = reverse('yaksh:download_course_csv', args=[
+                institution['course'].id
+            ])
+            return self.moderator, 'get', url
+        self.assertBounded(view, 20)
+
+    def test_show_statistics(self):
+        def view(institution):
+            url = reverse('yaksh:show_statistics', args=[
+                institution['question_paper'].id, 1,
+                institution['course'].id
+            ])
+            return self.moderator, 'get', url
+        self.assertBounded(view, 20)
+
+    def test_course_modules(self):
+        def view(institution):
+            url = reverse('yaksh:course_modules', args=[
+                institution['course'].id
+            ])
+            return institution['students'][0], 'get', url
+        self.assertBounded(view, 70)
+
+    def test_start_intro(self):
+        def view(institution):
+            url = reverse('yaksh:start_quiz', args=[
+                institution['question_paper'].id, institution['module'].id,
+                institution['course'].id
+            ])
+            return institution['students'][0], 'get', url
+        self.assertBounded(view, 25)
+
+    def test_start(self):
+        def view(institution):
+            url = reverse('yaksh:start_quiz', args=[
+                3, institution['module'].id,
+                institution['question_paper'].id, institution['course'].id
+            ])
+            return institution['students'][0], 'get', url
+        self.assertBounded(view, 55)
+
+    def test_check(self):
+        def view(institution):
+            student = institution['students'][0]
+            question_paper = institution['question_paper']
+            question_paper.make_answerpaper(
+                student, '127.0.0.1', 3, institution['course'].id
+            )
+            question = [
+                question for question in institution['questions']
+                if question.type == 'mcq'
+            ][-1]
+            url = reverse('yaksh:check', args=[
+                question.id, 3, institution['module'].id,
+                question_paper.id, institution['course'].id
+            ])
+            answer = str(institution['test_cases'][question.id][0].id)
+            return student, 'post', url, {'answer': answer}
+        self.assertBounded(view, 55)
+
+    def test_api_start_quiz(self):
+        def view(institution):
+            url = reverse('api:start_quiz', args=[
+                institution['course'].id, institution['quiz'].id
+            ])
+            return institution['students'][0], 'get', url
+        self.assertBounded(view, 60)
@@ -3,6 +3,7 @@ import pytz
 import os
 import json
 import time
+from unittest.mock import patch
 try:
     from StringIO import StringIO as string_io
 except ImportError:
@@ -35,6 +36,7 @@ from yaksh.models import (
 from yaksh.views import add_as_moderator, course_forum, post_comments
 from yaksh.forms import PostForm, CommentForm
 from yaksh.decorators import user_has_profile
+from yaksh.middleware import query_budget
 from online_test.celery_settings import app
 
 from notifications_plugin.models import Notification
@@ -4151,6 +4153,56 @@ class TestGrader(SimpleTestCase):
         self.mod_group.user_set.add(self.user2)
 
 
+class TestGetResult(SimpleTestCase):
+
+    @patch('yaksh.views.get_result_from_code_server')
+    def test_progress_of_running_job(self, get_result_from_code_server):
+        # Given
+        get_result_from_code_server.return_value = dict(
+            status='running', pid=0, result=None,
+            progress=dict(completed=2, total=5, weight=1.0,
+                          error=[{'message': 'Incorrect answer'}])
+        )
+
+        # When
+        response = self.client.get('/exam/get_result/1/1/1/')
+
+        # Then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content.decode('utf-8')),
+            dict(status='running',
+                 progress=dict(completed=2, total=5, failed=1))
+        )
+
+    @patch('yaksh.views.get_result_from_code_server')
+    def test_no_progress_before_job_runs(self, get_result_from_code_server):
+        # Given
+        get_result_from_code_server.return_value = dict(status='not started')
+
+        # When
+        response = self.client.get('/exam/get_result/1/1/1/')
+
+        # Then
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         dict(status='not started'))
+
+    @patch('yaksh.views.get_result_from_code_server')
+    def test_eta_of_waiting_job(self, get_result_from_code_server):
+        # Given
+        eta = dict(position=3, start_in=2.0, finish_in=2.5)
+        get_result_from_code_server.return_value = dict(
+            status='not started', pool='default', eta=eta
+        )
+
+        # When
+        response = self.client.get('/exam/get_result/1/1/1/')
+
+        # Then
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         dict(status='not started', eta=eta))
+
+
 class TestPasswordReset(TestCase):
     def setUp(self):
         self.mod_group = Group.objects.create(name='moderator')
@@ -7713,3 +7765,78 @@ class TestStartExam(TestCase):
         self.student.delete()
         self.quiz1.delete()
         self.user1_course1.delete()
+
+
+class TestQueryBudgets(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.superuser_plaintext_pass = 'demo_admin'
+        self.superuser = User.objects.create_superuser(
+            username='demo_admin', password=self.superuser_plaintext_pass,
+            email='admin@test.com'
+        )
+        Profile.objects.create(
+            user=self.superuser, roll_number=1, institute='IIT',
+            department='Chemical', position='Admin', timezone='UTC'
+        )
+        self.student_plaintext_pass = 'demo_student'
+        self.student = User.objects.create_user(
+            username='demo_student', password=self.student_plaintext_pass,
+            email='demo_student@test.com'
+        )
+        Profile.objects.create(
+            user=self.student, roll_number=10, institute='IIT',
+            department='Chemical', position='Student', timezone='UTC'
+        )
+        query_budget.clear_summary()
+
+    def tearDown(self):
+        query_budget.clear_summary()
+        self.client.logout()
+        self.superuser.delete()
+        self.student.delete()
+
+    def test_query_budgets_denies_non_superusers(self):
+        self.client.login(
+            username=self.student.username,
+            password=self.student_plaintext_pass
+        )
+        response = self.client.get(reverse('yaksh:query_budgets'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_requests_are_not_sampled_by_default(self):
+        self.client.login(
+            username=self.superuser.username,
+            password=self.superuser_plaintext_pass
+        )
+        self.client.get(reverse('yaksh:query_budgets'))
+        self.assertEqual(query_budget.get_summary(), [])
+
+    def test_sampled_requests_over_budget(self):
+        # Given
+        self.client.login(
+            username=self.superuser.username,
+            password=self.superuser_plaintext_pass
+        )
+        budgets = {'default': {'queries': 1000},
+                   'yaksh:view_notifications': {'queries': 1}}
+
+        # When
+        with patch.object(query_budget, 'QUERY_BUDGET_SAMPLE_RATE', 1.0), \
+                patch.object(query_budget, 'QUERY_BUDGETS', budgets), \
+                self.assertLogs(query_budget.logger, 'WARNING') as logs:
+            self.client.get(reverse('yaksh:view_notifications'))
+            response = self.client.get(reverse('yaksh:query_budgets'))
+
+        # Then
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'yaksh/query_budgets.html')
+        summary = dict((entry['view'], entry)
+                       for entry in query_budget.get_summary())
+        notifications = summary['yaksh:view_notifications']
+        self.assertEqual(notifications['requests'], 1)
+        self.assertGreater(notifications['max_queries'], 1)
+        self.assertEqual(notifications['over_budget'], 1)
+        self.assertEqual(summary['yaksh:query_budgets']['over_budget'], 0)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('yaksh:view_notifications', logs.output[0])
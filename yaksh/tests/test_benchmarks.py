@@ -0,0 +1,178 @@
+from __future__ import unicode_literals
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from yaksh.benchmarks import evaluators, load, replay
+from yaksh.code_server import (
+    SERVER_POOL_PORT, submit, get_result, put_bundle
+)
+from yaksh.traffic import Recorder, read_corpus
+
+
+class TestLoad(unittest.TestCase):
+
+    def test_percentile(self):
+        # Given
+        values = [4, 1, 3, 2, 5]
+
+        # When
+        p50 = load.percentile(values, 50)
+        p95 = load.percentile(values, 95)
+
+        # Then
+        self.assertEqual(p50, 3)
+        self.assertAlmostEqual(p95, 4.8)
+        self.assertIsNone(load.percentile([], 50))
+
+    def test_parse_mix(self):
+        # When
+        mix = load.parse_mix('python_correct=3, c_correct')
+
+        # Then
+        self.assertEqual(dict(mix), {'python_correct': 3.0,
+                                     'c_correct': 1.0})
+        with self.assertRaises(ValueError):
+            load.parse_mix('python_unknown=1')
+
+    def test_run_load(self):
+        # Given
+        jobs = load.make_jobs(
+            load.parse_mix('python_correct,python_wrong'), 6, seed=0
+        )
+        server_pool, thread, url = load.start_server_pool(
+            2, SERVER_POOL_PORT + 3, 1, {}
+        )
+
+        # When
+        try:
+            report = load.run_load(url, jobs, rate=20)
+        finally:
+            server_pool.stop()
+            thread.join()
+
+        # Then
+        self.assertEqual(report['jobs'], 6)
+        self.assertEqual(report['done'], 6)
+        self.assertEqual(report['unexpected'], 0)
+        self.assertGreater(report['throughput'], 0)
+        self.assertLessEqual(report['latency']['p50'],
+                             report['latency']['p99'])
+        self.assertEqual(set(report['kinds']),
+                         set(kind for kind, data, expected in jobs))
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.corpus = os.path.join(self.tmp_dir, 'corpus.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _record(self):
+        server_pool, thread, url = load.start_server_pool(
+            1, SERVER_POOL_PORT + 4, 1, {}
+        )
+        server_pool.recorder = Recorder(self.corpus)
+        correct, wrong = (load.JOBS[kind][0]
+                          for kind in ('python_correct', 'python_wrong'))
+        bundle_json = json.dumps(
+            {'metadata': {'language': 'python'},
+             'test_case_data': correct['test_case_data']}
+        )
+        bundle_hash = hashlib.sha1(bundle_json.encode('utf-8')).hexdigest()
+        by_reference = {'metadata': dict(correct['metadata'],
+                                         bundle_hash=bundle_hash,
+                                         assign_files=['/a/b.txt'])}
+        try:
+            put_bundle(url, bundle_hash, bundle_json)
+            for uid, data in (('1', correct), ('2', wrong),
+                              ('3', by_reference)):
+                submit(url, uid, json.dumps(data), self.tmp_dir,
+                       course=1, user=2)
+                get_result(url, uid, block=True)
+        finally:
+            server_pool.stop()
+            thread.join()
+        return bundle_hash
+
+    def test_record_and_replay(self):
+        # Given
+        bundle_hash = self._record()
+
+        # When
+        bundles, jobs, results = read_corpus(self.corpus)
+        server_pool, thread, url = load.start_server_pool(
+            1, SERVER_POOL_PORT + 5, 1, {}
+        )
+        try:
+            report = replay.replay(url, self.corpus, speed=10)
+        finally:
+            server_pool.stop()
+            thread.join()
+
+        # Then
+        self.assertEqual(list(bundles), [bundle_hash])
+        self.assertEqual(len(jobs), 3)
+        self.assertNotIn(jobs[0]['uid'], ('1', '2', '3'))
+        self.assertEqual(len(set(job['course'] for job in jobs)), 1)
+        self.assertNotIn('assign_files', jobs[2]['data']['metadata'])
+        self.assertEqual(
+            [results[job['uid']]['success'] for job in jobs],
+            [True, False, True]
+        )
+        self.assertEqual(report['done'], 3)
+        self.assertEqual(report['mismatches'], [])
+        self.assertEqual(set(report['kinds']), {'python'})
+
+
+class TestEvaluatorBenchmarks(unittest.TestCase):
+
+    def test_bench_case(self):
+        # Given
+        data = evaluators.make_case('python', 'standardtestcase')
+        wrong = evaluators.make_case('python', 'standardtestcase')
+        wrong['metadata']['user_answer'] = 'def add(a, b):\n    return 0'
+
+        # When
+        times = evaluators.bench_case(data, repeat=2)
+        wrong_times = evaluators.bench_case(wrong, repeat=2)
+
+        # Then
+        self.assertEqual(tuple(times), evaluators.PHASES)
+        self.assertGreater(times['total'], 0)
+        self.assertIn('error', wrong_times)
+        self.assertIsNone(evaluators.make_case('scilab',
+                                               'stdiobasedtestcase'))
+
+    def test_compare(self):
+        # Given
+        baseline = {
+            'evaluators': {'python/standardtestcase':
+                           {'compile': 0.010, 'total': 0.100},
+                           'c/standardtestcase': {'skipped': 'No gcc.'}},
+            'helpers': {'copy_files': {'calls': 20, 'total': 0.050}}
+        }
+        report = {
+            'evaluators': {'python/standardtestcase':
+                           {'compile': 0.0105, 'total': 0.150}},
+            'helpers': {'copy_files': {'calls': 20, 'total': 0.051}}
+        }
+
+        # When
+        regressions = evaluators.compare(report, baseline, threshold=0.2)
+
+        # Then
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0]['name'], 'python/standardtestcase')
+        self.assertEqual(regressions[0]['phase'], 'total')
+        self.assertAlmostEqual(regressions[0]['change'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
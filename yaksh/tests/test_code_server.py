@@ -5,11 +5,21 @@ try:
 except ImportError:
     from queue import Queue
 from threading import Thread
+import hashlib
+import tempfile
+import time
 import unittest
+from unittest import mock
 import urllib
 
-from yaksh.code_server import ServerPool, SERVER_POOL_PORT, submit, get_result
-from yaksh import settings
+import requests
+
+from yaksh.code_server import (
+    ServerPool, SERVER_POOL_PORT, submit, get_result, runs_on_thread, grade,
+    FairQueue, JobEstimator, expand_job, warm_up, has_bundle, put_bundle,
+    scale
+)
+from yaksh import settings, wire_format
 
 
 class TestCodeServer(unittest.TestCase):
@@ -59,7 +69,7 @@ class TestCodeServer(unittest.TestCase):
         result = get_result(self.url, '0', block=True)
 
         # Then
-        data = json.loads(result.get('result'))
+        data = result.get('result')
         self.assertFalse(data['success'])
         self.assertTrue('infinite loop' in data['error'][0]['message'])
 
@@ -81,7 +91,7 @@ class TestCodeServer(unittest.TestCase):
         result = get_result(self.url, '0', block=True)
 
         # Then
-        data = json.loads(result.get('result'))
+        data = result.get('result')
         self.assertTrue(data['success'])
 
     def test_wrong_answer(self):
@@ -102,10 +112,130 @@ class TestCodeServer(unittest.TestCase):
         result = get_result(self.url, '0', block=True)
 
         # Then
-        data = json.loads(result.get('result'))
+        data = result.get('result')
         self.assertFalse(data['success'])
         self.assertTrue('AssertionError' in data['error'][0]['exception'])
 
+    def test_progress_while_running(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 1',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [
+                {'test_case': 'assert f() == 2',
+                 'test_case_type': 'standardtestcase',
+                 'weight': 1.0},
+                {'test_case': 'import time; time.sleep(1); assert f() == 1',
+                 'test_case_type': 'standardtestcase',
+                 'weight': 1.0}
+            ]
+        }
+
+        # When
+        submit(self.url, 'progress', json.dumps(testdata), '')
+        progress = None
+        result = get_result(self.url, 'progress')
+        while result.get('status') != 'done':
+            progress = result.get('progress') or progress
+            time.sleep(0.05)
+            result = get_result(self.url, 'progress')
+
+        # Then
+        self.assertEqual(progress['completed'], 1)
+        self.assertEqual(progress['total'], 2)
+        self.assertEqual(progress['weight'], 0.0)
+        self.assertEqual(len(progress['error']), 1)
+        data = result.get('result')
+        self.assertFalse(data['success'])
+        self.assertEqual(len(data['error']), 1)
+
+    def test_eta_on_submit_and_status(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'import time; time.sleep(0.5)',
+                'language': 'python',
+                'partial_grading': False,
+                'question_id': 1
+            },
+            'test_case_data': [{'test_case': 'assert True',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+
+        # When
+        submitted = submit(self.url, 'eta', json.dumps(testdata), '')
+        status = get_result(self.url, 'eta')
+        result = get_result(self.url, 'eta', block=True)
+        estimate = self.server_pool.estimator.estimate('python', 1)
+
+        # Then
+        self.assertEqual(submitted['status'], 'not started')
+        self.assertEqual(sorted(submitted['eta']),
+                         ['finish_in', 'position', 'start_in'])
+        self.assertIn('eta', status)
+        self.assertNotIn('eta', result)
+        self.assertGreaterEqual(estimate, 0.5)
+
+    def test_clients_without_frames(self):
+        # Given
+        testdata = {
+            'metadata': {
+                'user_answer': 'def f(): return 1',
+                'language': 'python',
+                'partial_grading': False
+            },
+            'test_case_data': [{'test_case': 'assert f() == 1',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+
+        # When
+        response = requests.post(self.url, data=dict(
+            uid='legacy', json_data=json.dumps(testdata), user_dir=''
+        ))
+        status = json.loads(response.content.decode('utf-8'))
+        while status.get('status') != 'done':
+            time.sleep(0.1)
+            response = requests.get(self.url + '/legacy')
+            status = json.loads(response.content.decode('utf-8'))
+
+        # Then
+        self.assertNotEqual(response.headers['Content-Type'],
+                            wire_format.MEDIA_TYPE)
+        self.assertTrue(json.loads(status['result'])['success'])
+
+    def test_job_referring_to_a_bundle(self):
+        # Given
+        bundle_json = json.dumps({
+            'metadata': {'language': 'python', 'partial_grading': False},
+            'test_case_data': [{'test_case': 'assert f() == 1',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        })
+        bundle_hash = hashlib.sha1(bundle_json.encode('utf-8')).hexdigest()
+        job = json.dumps({'metadata': {'user_answer': 'def f(): return 1',
+                                       'language': 'python',
+                                       'bundle_hash': bundle_hash}})
+        get_bundle = mock.Mock(return_value=(bundle_hash, bundle_json))
+
+        # When
+        submit(self.url, 'ref1', job, '', bundle=get_bundle)
+        first = get_result(self.url, 'ref1', block=True)
+        submit(self.url, 'ref2', job, '', bundle=get_bundle)
+        second = get_result(self.url, 'ref2', block=True)
+        response = requests.post(self.url + '/bundles/' + bundle_hash,
+                                 data=b'{}')
+
+        # Then
+        self.assertTrue(first.get('result')['success'])
+        self.assertTrue(second.get('result')['success'])
+        self.assertEqual(get_bundle.call_count, 1)
+        self.assertEqual(response.status_code, 400)
+
     def test_question_with_no_testcases(self):
         # Given
         testdata = {
@@ -122,7 +252,7 @@ class TestCodeServer(unittest.TestCase):
         result = get_result(self.url, '0', block=True)
 
         # Then
-        data = json.loads(result.get('result'))
+        data = result.get('result')
         self.assertFalse(data['success'])
 
         # With correct answer and test case
@@ -136,7 +266,7 @@ class TestCodeServer(unittest.TestCase):
         result = get_result(self.url, '0', block=True)
 
         # Then
-        data = json.loads(result.get('result'))
+        data = result.get('result')
         self.assertTrue(data['success'])
 
     def test_multiple_simultaneous_hits(self):
@@ -157,7 +287,7 @@ class TestCodeServer(unittest.TestCase):
             }
             submit(self.url, uid, json.dumps(testdata), '')
             result = get_result(self.url, uid, block=True)
-            results.put(json.loads(result.get('result')))
+            results.put(result.get('result'))
 
         N = 10
         # When
@@ -208,7 +338,7 @@ class TestCodeServer(unittest.TestCase):
         result = get_result(self.url, '0', block=True)
 
         # Then
-        data = json.loads(result.get('result'))
+        data = result.get('result')
         self.assertFalse(data['success'])
         self.assertTrue('Process ended with exit code' in data['error'][0])
 
@@ -225,5 +355,417 @@ class TestCodeServer(unittest.TestCase):
         self.assertTrue(expect in data)
 
 
+class TestLanguagePools(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.port = SERVER_POOL_PORT + 1
+        pools = {'c': {'languages': ['c', 'cpp'], 'servers': 1}}
+        server_pool = ServerPool(n=1, pool_port=cls.port, pools=pools)
+        cls.server_pool = server_pool
+        cls.server_thread = t = Thread(target=server_pool.run)
+        t.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server_pool.stop()
+        cls.server_thread.join()
+
+    def setUp(self):
+        self.url = 'http://localhost:%s' % self.port
+
+    def test_jobs_are_routed_by_language(self):
+        # Given
+        c_data = {
+            'metadata': {'user_answer': 'int add(int a, int b)\n'
+                                        '{return a+b;}',
+                         'language': 'c', 'partial_grading': False},
+            'test_case_data': [{'test_case': 'int add(int, int);\n'
+                                             'int main(void)\n'
+                                             '{return add(2, 3) != 5;}',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+        bash_data = {
+            'metadata': {'user_answer': 'echo 1', 'language': 'bash',
+                         'partial_grading': False},
+            'test_case_data': [{'test_case': 'echo 1',
+                                'test_case_type': 'standardtestcase',
+                                'weight': 0.0}]
+        }
+
+        # When
+        c_pool = self.server_pool.get_pool_name(json.dumps(c_data))
+        bash_pool = self.server_pool.get_pool_name(json.dumps(bash_data))
+        submit(self.url, 'c', json.dumps(c_data), tempfile.mkdtemp())
+        submit(self.url, 'bash', json.dumps(bash_data), tempfile.mkdtemp())
+        c_result = get_result(self.url, 'c', block=True)
+        bash_result = get_result(self.url, 'bash', block=True)
+        status = self.server_pool.get_pool_status()
+
+        # Then
+        self.assertEqual(c_pool, 'c')
+        self.assertEqual(bash_pool, 'default')
+        self.assertTrue(c_result.get('result')['success'])
+        self.assertTrue(bash_result.get('result')['success'])
+        self.assertEqual(list(status.keys()), ['default', 'c'])
+        self.assertEqual(status['c'], (0, 1, 0))
+
+
+class TestRunsOnThread(unittest.TestCase):
+
+    def test_runs_on_thread(self):
+        # Given
+        c_job = {
+            'metadata': {'language': 'c'},
+            'test_case_data': [{'test_case_type': 'standardtestcase'},
+                               {'test_case_type': 'stdiobasedtestcase'}]
+        }
+        c_hook_job = {
+            'metadata': {'language': 'c'},
+            'test_case_data': [{'test_case_type': 'standardtestcase'},
+                               {'test_case_type': 'hooktestcase'}]
+        }
+        python_job = {
+            'metadata': {'language': 'python'},
+            'test_case_data': [{'test_case_type': 'standardtestcase'}]
+        }
+        invalid_job = {
+            'metadata': {'language': 'c'},
+            'test_case_data': [{'test_case_type': 'invalid'}]
+        }
+
+        # When / Then
+        self.assertTrue(runs_on_thread(c_job))
+        self.assertFalse(runs_on_thread(c_hook_job))
+        self.assertFalse(runs_on_thread(python_job))
+        self.assertFalse(runs_on_thread(invalid_job))
+
+
+class TestGrade(unittest.TestCase):
+
+    def test_grader_failure_is_reported(self):
+        # Given
+        results = {}
+        job = {
+            'metadata': {'language': 'unknown'},
+            'test_case_data': [{'test_case_type': 'standardtestcase'}]
+        }
+
+        # When
+        grade(0, results, 'job', job, tempfile.mkdtemp(), 0.5)
+
+        # Then
+        self.assertEqual(results['job']['status'], 'done')
+        result = results['job']['result']
+        self.assertFalse(result['success'])
+        self.assertEqual(result['weight'], 0.0)
+        self.assertEqual(len(result['error']), 1)
+        self.assertEqual(result['timing']['queue_wait'], 0.5)
+
+
+
+class TestFairQueue(unittest.TestCase):
+
+    def _drain(self, fair_queue):
+        jobs = []
+        item = fair_queue.get()
+        while item is not None:
+            jobs.append(item[0])
+            fair_queue.done(item[1])
+            item = fair_queue.get()
+        return jobs
+
+    def test_courses_are_served_by_weight(self):
+        # Given
+        fair_queue = FairQueue({'2': {'weight': 2}})
+        for i in range(6):
+            fair_queue.put('exam%d' % i, course=1, user=i)
+        for i in range(4):
+            fair_queue.put('lab%d' % i, course=2, user=i)
+
+        # When
+        jobs = self._drain(fair_queue)
+
+        # Then
+        self.assertEqual(len(fair_queue), 0)
+        self.assertEqual(
+            jobs[:6], ['exam0', 'lab0', 'lab1', 'exam1', 'lab2', 'lab3']
+        )
+        self.assertEqual(jobs[6:], ['exam2', 'exam3', 'exam4', 'exam5'])
+
+    def test_users_of_a_course_take_turns(self):
+        # Given
+        fair_queue = FairQueue()
+        for i in range(3):
+            fair_queue.put('a%d' % i, course=1, user='a')
+        fair_queue.put('b0', course=1, user='b')
+
+        # When
+        jobs = self._drain(fair_queue)
+
+        # Then
+        self.assertEqual(jobs, ['a0', 'b0', 'a1', 'a2'])
+
+    def test_course_at_quota_is_skipped(self):
+        # Given
+        fair_queue = FairQueue({'default': {'quota': 1}})
+        fair_queue.put('a0', course=1)
+        fair_queue.put('a1', course=1)
+        fair_queue.put('b0', course=2)
+
+        # When
+        first = fair_queue.get()
+        second = fair_queue.get()
+        third = fair_queue.get()
+        fair_queue.done(first[1])
+        fourth = fair_queue.get()
+
+        # Then
+        self.assertEqual(first, ('a0', 1))
+        self.assertEqual(second, ('b0', 2))
+        self.assertIsNone(third)
+        self.assertEqual(fourth, ('a1', 1))
+
+    def test_late_course_does_not_get_the_missed_turns(self):
+        # Given
+        fair_queue = FairQueue()
+        for i in range(6):
+            fair_queue.put('a%d' % i, course=1)
+        for i in range(3):
+            fair_queue.done(fair_queue.get()[1])
+
+        # When
+        for i in range(3):
+            fair_queue.put('b%d' % i, course=2)
+        jobs = self._drain(fair_queue)
+
+        # Then
+        self.assertEqual(jobs, ['b0', 'a3', 'b1', 'a4', 'b2', 'a5'])
+
+
+
+class TestJobEstimator(unittest.TestCase):
+
+    def test_estimates_fall_back_to_language_and_default(self):
+        # Given
+        estimator = JobEstimator(alpha=0.5, default=3.0)
+
+        # When
+        no_data = estimator.estimate('c', 1)
+        estimator.record('c', 1, 2.0)
+        estimator.record('c', 1, 4.0)
+        estimator.record('c', 2, 1.0)
+
+        # Then
+        self.assertEqual(no_data, 3.0)
+        self.assertEqual(estimator.estimate('c', 1), 3.0)
+        self.assertEqual(estimator.estimate('c', 2), 1.0)
+        self.assertEqual(estimator.estimate('c', 3), 2.0)
+        self.assertEqual(estimator.estimate('java', 1), 2.0)
+
+
+class TestWireFormat(unittest.TestCase):
+
+    def test_frame_round_trip(self):
+        # Given
+        header = {'uid': '1', 'metadata': {'language': 'python'}}
+        body = json.dumps({'test_case_data': []}).encode('utf-8')
+
+        # When
+        frame = wire_format.encode(header, body)
+
+        # Then
+        self.assertFalse(frame[4] & wire_format.COMPRESSED)
+        self.assertEqual(wire_format.decode(frame), (header, body))
+
+    @unittest.skipUnless(wire_format.msgpack, 'msgpack is not installed')
+    def test_msgpack_header(self):
+        # Given
+        header = {'uid': '1', 'metadata': {'language': 'python'}}
+
+        # When
+        frame = wire_format.encode(header, b'body')
+
+        # Then
+        self.assertTrue(frame[4] & wire_format.MSGPACK)
+        self.assertEqual(wire_format.decode(frame), (header, b'body'))
+        with mock.patch('yaksh.wire_format.msgpack', None):
+            with self.assertRaises(ValueError):
+                wire_format.decode(frame)
+
+    def test_json_header(self):
+        # Given
+        header = {'uid': '1', 'metadata': {'language': 'python'}}
+
+        # When
+        with mock.patch('yaksh.wire_format.msgpack', None):
+            frame = wire_format.encode(header, b'body')
+
+        # Then
+        self.assertFalse(frame[4] & wire_format.MSGPACK)
+        self.assertEqual(wire_format.decode(frame), (header, b'body'))
+
+    def test_large_frames_are_compressed(self):
+        # Given
+        header = {'status': 'done',
+                  'result': {'error': ['Traceback ...\n' * 1000]}}
+
+        # When
+        frame = wire_format.encode(header, compress_min_size=1024)
+
+        # Then
+        self.assertTrue(frame[4] & wire_format.COMPRESSED)
+        self.assertLess(len(frame), 1024)
+        self.assertEqual(wire_format.decode(frame), (header, b''))
+
+    def test_invalid_frames(self):
+        # Given
+        frame = wire_format.encode({'uid': '1'})
+
+        # When / Then
+        with self.assertRaises(ValueError):
+            wire_format.decode(b'YK')
+        with self.assertRaises(ValueError):
+            wire_format.decode(b'YKF1' + frame[4:])
+
+
+class TestExpandJob(unittest.TestCase):
+
+    def test_expand_job(self):
+        # Given
+        bundle = {'metadata': {'language': 'c', 'partial_grading': True},
+                  'test_case_data': [{'test_case': 'a', 'weight': 1.0}]}
+        bundle_json = json.dumps(bundle)
+        bundles = {'hash': bundle_json}
+        job = {'metadata': {'user_answer': 'x', 'bundle_hash': 'hash'}}
+        full_job = {'metadata': {'user_answer': 'x'}, 'test_case_data': []}
+
+        # When
+        expanded = expand_job(job, bundles)
+        expanded['test_case_data'][0]['weight'] = 0.0
+        del bundles['hash']
+        cached = expand_job(job, bundles)
+
+        # Then
+        self.assertEqual(expanded['metadata'], {
+            'language': 'c', 'partial_grading': True, 'user_answer': 'x',
+            'bundle_hash': 'hash'
+        })
+        self.assertEqual(cached['test_case_data'], bundle['test_case_data'])
+        self.assertIs(expand_job(full_job, bundles), full_job)
+        with self.assertRaises(KeyError):
+            expand_job({'metadata': {'bundle_hash': 'other'}}, bundles)
+
+
+class TestWarmUp(unittest.TestCase):
+
+    def test_warm_up_loads_bundles_and_hooks_once(self):
+        # Given
+        bundle = {'metadata': {'language': 'python'},
+                  'test_case_data': [
+                      {'test_case_type': 'hooktestcase',
+                       'hook_code': 'def check_answer(user_answer):\n'
+                                    '    return True, "", 1.0',
+                       'weight': 1.0},
+                      {'test_case_type': 'standardtestcase',
+                       'test_case': 'assert True', 'weight': 1.0}
+                  ]}
+        bundles = {'warm': json.dumps(bundle)}
+
+        # When
+        with mock.patch('yaksh.code_server.load_hook') as load_hook:
+            warm_up(bundles, ['warm', 'missing'])
+            del bundles['warm']
+            warm_up(bundles, ['warm'])
+        job = expand_job({'metadata': {'bundle_hash': 'warm'}}, bundles)
+
+        # Then
+        load_hook.assert_called_once_with(
+            bundle['test_case_data'][0]['hook_code']
+        )
+        self.assertEqual(job['test_case_data'], bundle['test_case_data'])
+
+
+class TestScaling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.port = SERVER_POOL_PORT + 2
+        server_pool = ServerPool(n=1, pool_port=cls.port)
+        cls.server_pool = server_pool
+        cls.server_thread = t = Thread(target=server_pool.run)
+        t.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server_pool.stop()
+        cls.server_thread.join()
+
+    def setUp(self):
+        self.url = 'http://localhost:%s' % self.port
+
+    def _wait_for_alive(self, n):
+        for i in range(50):
+            alive = sum(p.is_alive() for p in self.server_pool.processes)
+            if alive == n:
+                break
+            time.sleep(0.2)
+        return alive
+
+    def test_pool_is_scaled_up_for_a_while(self):
+        # Given
+        bundle_json = json.dumps({'metadata': {}, 'test_case_data': []})
+        bundle_hash = hashlib.sha1(bundle_json.encode('utf-8')).hexdigest()
+
+        # When
+        stored_before = has_bundle(self.url, bundle_hash)
+        put_bundle(self.url, bundle_hash, bundle_json)
+        scale(self.url, {'default': 3, 'unknown': 2}, ttl=1,
+              bundles=[bundle_hash, 'missing'])
+        alive_scaled = self._wait_for_alive(3)
+        servers_scaled = self.server_pool.pools['default']['servers']
+        warm = list(self.server_pool.warm)
+        time.sleep(1)
+        alive_after = self._wait_for_alive(1)
+
+        # Then
+        self.assertFalse(stored_before)
+        self.assertTrue(has_bundle(self.url, bundle_hash))
+        self.assertEqual(alive_scaled, 3)
+        self.assertEqual(servers_scaled, 3)
+        self.assertEqual(warm, [bundle_hash])
+        self.assertEqual(alive_after, 1)
+        self.assertEqual(self.server_pool.pools['default']['servers'], 1)
+
+    def test_scale_requests_are_checked(self):
+        # Given
+        oversized = {'pools': {'default': 10000}, 'ttl': 1}
+        invalid = [{'pools': {'default': 2}}, {'pools': {'default': -1},
+                   'ttl': 1}, {'pools': {'default': '2'}, 'ttl': 1},
+                   {'pools': {'default': 2}, 'ttl': 1.5}, [2]]
+
+        # When
+        with mock.patch('yaksh.code_server.CODE_SERVER_MAX_PRESCALE_SERVERS',
+                        2):
+            response = requests.post(self.url + '/scale',
+                                     data=json.dumps(oversized))
+            servers_scaled = self.server_pool.pools['default']['servers']
+        alive_scaled = self._wait_for_alive(2)
+        statuses = [
+            requests.post(self.url + '/scale', data=json.dumps(data))
+            .status_code for data in invalid
+        ]
+        time.sleep(1)
+        alive_after = self._wait_for_alive(1)
+
+        # Then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(servers_scaled, 2)
+        self.assertEqual(alive_scaled, 2)
+        self.assertEqual(statuses, [400] * len(invalid))
+        self.assertEqual(alive_after, 1)
+
+
 if __name__ == '__main__':
     unittest.main()
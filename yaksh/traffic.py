@@ -0,0 +1,103 @@
+"""Recording of the jobs submitted to the code server.
+
+The recorder writes the jobs, the grading bundles they refer to and the
+results to a gzip compressed file of JSON lines, a corpus which
+`yaksh.benchmarks.replay` feeds back to a code server. Each line is one of
+
+    {"type": "bundle", "hash": ..., "bundle": <the JSON of the bundle>}
+    {"type": "job", "uid": ..., "time": ..., "course": ..., "user": ...,
+     "data": <the job data>}
+    {"type": "result", "uid": ..., "success": ..., "weight": ...,
+     "duration": ...}
+
+The submission ids, courses and users are replaced by salted hashes, the
+salt changing with each recorder, and the uploaded files of the students are
+left out of the jobs.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+
+class Recorder(object):
+    """Appends the jobs and results of a code server to a corpus file."""
+
+    def __init__(self, path, flush_every=100):
+        self.path = path
+        self.flush_every = flush_every
+        self._file = gzip.open(path, 'at')
+        self._salt = os.urandom(16)
+        self._bundle_hashes = set()
+        self._unflushed = 0
+
+    def _anonymise(self, value):
+        if value is None:
+            return None
+        digest = hashlib.sha1(self._salt + str(value).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def job(self, uid, json_data, submitted, course=None, user=None,
+            bundle_json=None):
+        """Record a job submitted at the `submitted` time, along with the
+        grading bundle it refers to, if any.
+        """
+        data = json.loads(json_data)
+        metadata = data.get('metadata', {})
+        metadata.pop('assign_files', None)
+        bundle_hash = metadata.get('bundle_hash')
+        if bundle_json is not None and \
+                bundle_hash not in self._bundle_hashes:
+            self._bundle_hashes.add(bundle_hash)
+            self._write(dict(type='bundle', hash=bundle_hash,
+                             bundle=bundle_json))
+        self._write(dict(type='job', uid=self._anonymise(uid),
+                         time=submitted, course=self._anonymise(course),
+                         user=self._anonymise(user), data=data))
+
+    def result(self, uid, result):
+        """Record the result of a job which is done."""
+        graded = result.get('result') or {}
+        self._write(dict(type='result', uid=self._anonymise(uid),
+                         success=graded.get('success'),
+                         weight=graded.get('weight'),
+                         duration=result.get('duration')))
+
+    def flush(self):
+        self._file.flush()
+        self._unflushed = 0
+
+    def close(self):
+        self._file.close()
+
+
+def read_corpus(path):
+    """Return the bundles by hash, the jobs ordered by submission time and
+    the results by uid of a corpus.
+    """
+    bundles, jobs, results = {}, [], {}
+    with gzip.open(path, 'rt') as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line of a corpus still being written.
+                    continue
+                if record['type'] == 'bundle':
+                    bundles[record['hash']] = record['bundle']
+                elif record['type'] == 'job':
+                    jobs.append(record)
+                elif record['type'] == 'result':
+                    results[record['uid']] = record
+        except EOFError:
+            # The corpus is still being written.
+            pass
+    jobs.sort(key=lambda job: job['time'])
+    return bundles, jobs, results
@@ -5,7 +5,7 @@ from django.contrib.auth import login, logout, authenticate
 from django.shortcuts import render, get_object_or_404, redirect
 from django.template import Context, Template
 from django.http import Http404
-from django.db.models import Max, Q, F
+from django.db.models import Count, F, OuterRef, Q, Subquery
 from django.db import models
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
@@ -46,7 +46,10 @@ from yaksh.forms import (
     LessonFileForm, LearningModuleForm, ExerciseForm, TestcaseForm,
     SearchFilterForm, PostForm, CommentForm
 )
-from yaksh.settings import SERVER_POOL_PORT, SERVER_HOST_NAME
+from yaksh.settings import (
+    SERVER_POOL_PORT, SERVER_HOST_NAME, QUERY_BUDGET_SAMPLE_RATE
+)
+from yaksh.middleware.query_budget import get_summary as get_query_summary
 from .settings import URL_ROOT
 from .file_utils import extract_files, is_csv
 from .send_emails import (send_user_mail,
@@ -843,7 +846,8 @@ def check(request, q_id, attempt_num=None, questionpaper_id=None,
         # questions, we obtain the results via XML-RPC with the code executed
         # safely in a separate process (the code_server.py) running as nobody.
         json_data = current_question.consolidate_answer_data(
-            user_answer, user) if current_question.type == 'code' or \
+            user_answer, user, by_reference=True
+        ) if current_question.type == 'code' or \
             current_question.type == 'upload' else None
         result = paper.validate_answer(
             user_answer, current_question, json_data, uid
@@ -854,7 +858,7 @@ def check(request, q_id, attempt_num=None, questionpaper_id=None,
                 url = '{0}:{1}'.format(SERVER_HOST_NAME, SERVER_POOL_PORT)
                 result_details = get_result_from_code_server(url, uid,
                                                              block=True)
-                result = json.loads(result_details.get('result'))
+                result = result_details.get('result')
                 next_question, error_message, paper = _update_paper(
                     request, uid, result)
                 return show_question(request, next_question, paper,
@@ -881,8 +885,18 @@ def get_result(request, uid, course_id, module_id):
     url = '{0}:{1}'.format(SERVER_HOST_NAME, SERVER_POOL_PORT)
     result_state = get_result_from_code_server(url, uid)
     result['status'] = result_state.get('status')
+    progress = result_state.get('progress')
+    if result['status'] == 'running' and progress:
+        result['progress'] = {
+            'completed': progress.get('completed'),
+            'total': progress.get('total'),
+            'failed': len(progress.get('error', [])),
+        }
+    if result['status'] in ['running', 'not started'] and \
+            result_state.get('eta'):
+        result['eta'] = result_state['eta']
     if result['status'] == 'done':
-        result = json.loads(result_state.get('result'))
+        result = result_state.get('result')
         template_path = os.path.join(*[os.path.dirname(__file__),
                                        'templates', 'yaksh',
                                        'error_template.html'
@@ -937,6 +951,7 @@ def _update_paper(request, uid, result):
         next_question = current_question if current_question.type == 'code' \
             or current_question.type == 'upload' \
             else paper.add_completed_question(current_question.id)
+    new_answer.set_timing(result.get('timing'))
     new_answer.save()
     paper.update_marks('inprogress')
     paper.set_end_time(timezone.now())
@@ -1284,6 +1299,11 @@ def show_statistics(request, questionpaper_id, attempt_number=None,
     question_stats = AnswerPaper.objects.get_question_statistics(
         questionpaper_id, attempt_number, course_id
     )
+    grading_times = AnswerPaper.objects.get_grading_time_statistics(
+        questionpaper_id, attempt_number, course_id
+    )
+    for question in question_stats:
+        question.grading_time_stats = grading_times.get(question.id)
     context = {'question_stats': question_stats, 'quiz': quiz,
                'questionpaper_id': questionpaper_id,
                'attempts': attempt_numbers, 'total': total_attempt,
@@ -1327,17 +1347,14 @@ def monitor(request, quiz_id=None, course_id=None):
             course_id=course_id).order_by(
                 'user__profile__roll_number'
         )
-        users = papers.values_list('user').distinct()
-        for auser in users:
-            last_attempt = papers.filter(user__in=auser).aggregate(
-                last_attempt_num=Max('attempt_number')
-            )
-            latest_attempts.append(
-                papers.get(
-                    user__in=auser,
-                    attempt_number=last_attempt['last_attempt_num']
-                )
-            )
+        last_attempt_num = papers.filter(
+            user=OuterRef('user')
+        ).order_by('-attempt_number').values('attempt_number')[:1]
+        latest_attempts = papers.filter(
+            attempt_number=Subquery(last_attempt_num)
+        ).select_related(
+            'user__profile', 'question_paper__quiz'
+        ).annotate(answers_count=Count('answers'))
     csv_fields = CSV_FIELDS
     context = {
         "papers": papers,
@@ -1768,7 +1785,7 @@ def download_quiz_csv(request, course_id, quiz_id):
         attempt_number = request.POST.get('attempt_number',
                                           last_attempt_number)
     if not csv_fields:
-        csv_fields = CSV_FIELDS
+        csv_fields = list(CSV_FIELDS)
     if not attempt_number:
         attempt_number = last_attempt_number
 
@@ -1801,17 +1818,20 @@ def download_quiz_csv(request, course_id, quiz_id):
     questions_scores = {}
     for question in questions:
         questions_scores['{0}-{1}'.format(question.summary, question.points)] \
-                = 'answerpaper.get_per_question_score({0})'.format(question.id)
+                = 'question_scores[answerpaper.id].get({0}, "NA")'.format(
+                    question.id)
     csv_fields_values.update(questions_scores)
 
     users = users.exclude(id=course.creator.id).exclude(
-        id__in=course.teachers.all())
+        id__in=course.teachers.all()).select_related('profile')
+    question_scores = AnswerPaper.objects.get_per_question_scores(
+        answerpapers)
+    user_papers = {}
+    for paper in answerpapers.order_by('id'):
+        user_papers.setdefault(paper.user_id, paper)
     for user in users:
         row = []
-        answerpaper = None
-        papers = answerpapers.filter(user=user)
-        if papers:
-            answerpaper = papers.first()
+        answerpaper = user_papers.get(user.id)
         for field in csv_fields:
             try:
                 row.append(eval(csv_fields_values[field]))
@@ -2212,16 +2232,21 @@ def download_course_csv(request, course_id):
         "email", "institute", "roll_number"
     )
     quizzes = course.get_quizzes()
+    best_marks = AnswerPaper.objects.get_best_of_attempts_marks(
+        quizzes, course_id)
+    quiz_marks = {
+        quiz.id: quiz.questionpaper_set.values_list(
+            "total_marks", flat=True)[0]
+        for quiz in quizzes
+    }
 
     for student in students:
         total_course_marks = 0.0
         user_course_marks = 0.0
         for quiz in quizzes:
-            quiz_best_marks = AnswerPaper.objects. \
-                get_user_best_of_attempts_marks(quiz, student["id"], course_id)
+            quiz_best_marks = best_marks.get((quiz.id, student["id"]), 0.0)
             user_course_marks += quiz_best_marks
-            total_course_marks += quiz.questionpaper_set.values_list(
-                "total_marks", flat=True)[0]
+            total_course_marks += quiz_marks[quiz.id]
             student["{}".format(quiz.description)] = quiz_best_marks
         student["total_scored"] = user_course_marks
         student["out_of"] = total_course_marks
@@ -3420,3 +3445,15 @@ def hide_comment(request, course_id, uuid):
     comment.active = False
     comment.save()
     return redirect('yaksh:post_comments', course_id, post_uid)
+
+
+@login_required
+def query_budgets(request):
+    """Show the queries of the views sampled by this server process, see
+    QueryBudgetMiddleware.
+    """
+    if not request.user.is_superuser:
+        raise Http404('You are not allowed to view this page!')
+    context = {'summary': get_query_summary(),
+               'sample_rate': QUERY_BUDGET_SAMPLE_RATE}
+    return render(request, 'yaksh/query_budgets.html', context)
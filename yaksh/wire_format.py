@@ -0,0 +1,72 @@
+"""Binary frames exchanged between the clients and the code server.
+
+A frame is made of the 4 byte magic, a flags byte, the length of the header
+as 4 bytes (big endian), the header and a body. The header is a dict
+encoded with msgpack when it is installed and with JSON otherwise, the body
+is raw bytes, e.g. the JSON job data which the code server passes on as it
+is. Frames larger than a threshold are compressed with zlib.
+
+Clients which do not ask for this format keep using the form encoded and
+JSON requests and responses.
+"""
+import json
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .settings import CODE_SERVER_COMPRESS_MIN_SIZE
+
+
+MEDIA_TYPE = 'application/x-yaksh-frame'
+
+MAGIC = b'YKF2'
+MSGPACK = 1
+COMPRESSED = 2
+
+_prefix = struct.Struct('>4sBI')
+
+
+def encode(header, body=b'', compress_min_size=CODE_SERVER_COMPRESS_MIN_SIZE):
+    """Return the frame of the header dict and the body bytes."""
+    flags = 0
+    if msgpack is not None:
+        flags |= MSGPACK
+        encoded_header = msgpack.packb(header, use_bin_type=True)
+    else:
+        encoded_header = json.dumps(header).encode('utf-8')
+    payload = encoded_header + body
+    if len(payload) >= compress_min_size:
+        flags |= COMPRESSED
+        payload = zlib.compress(payload, 1)
+    return _prefix.pack(MAGIC, flags, len(encoded_header)) + payload
+
+
+def decode(frame):
+    """Return the header dict and the body bytes of a frame.
+
+    Raises ValueError if the frame is not valid or cannot be decoded here.
+    """
+    try:
+        magic, flags, header_size = _prefix.unpack_from(frame)
+    except struct.error:
+        raise ValueError('Frame too short.')
+    if magic != MAGIC:
+        raise ValueError('Not a frame of this version.')
+    payload = frame[_prefix.size:]
+    if flags & COMPRESSED:
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError(str(e))
+    encoded_header = payload[:header_size]
+    if flags & MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack is not installed.')
+        header = msgpack.unpackb(encoded_header, raw=False)
+    else:
+        header = json.loads(encoded_header.decode('utf-8'))
+    return header, payload[header_size:]